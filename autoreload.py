@@ -1,63 +1,357 @@
 #!/usr/bin/env python
+"""
+Runs a command and restarts it whenever a file under the watched directory changes.
+
+    python autoreload.py python main.py --pipeline
+    python autoreload.py -i "*.py" -i "*.json" -x "benchmarks/*" --grace 5 -- python main.py
+
+Changes are picked up with inotify where the kernel supports it, and by polling the modification times otherwise.
+Bursts of changes, ie a git pull, are collapsed into one restart once the tree has been quiet for the debounce time.
+The command is stopped with SIGTERM, which main.py handles by closing the camera and the bridge connection, and
+only killed if it hasn't exited after the grace period.
+"""
+
+from util.graceful_killer import GracefulKiller
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
 import os
-import sys
+import select
+import shlex
+import signal
+import struct
 import subprocess
 import time
 
 
-def file_filter(name):
-    return (not name.startswith(".")) and (not name.endswith(".swp"))
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_EXCLUDES = [".*", "*.swp", "*~", "*.pyc", "__pycache__"]
+
+
+class FileFilter:
+    """
+    Decides which paths under the watched directory we care about. A path is excluded if it, or any directory it
+    is in, matches an exclude glob, and included if its relative path or its name matches an include glob.
+    """
+
+    def __init__(self, root, includes=None, excludes=None):
+        """
+
+        :param root: the watched directory
+        :param includes: globs of the files to watch, every file if None
+        :param excludes: globs of the files and directories to ignore
+        """
+        self.root = root
+        self.includes = includes or ["*"]
+        self.excludes = excludes if excludes is not None else DEFAULT_EXCLUDES
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def excluded(self, path):
+        relative = self.relative(path)
+        parts = relative.split(os.sep)
+        for pattern in self.excludes:
+            if fnmatch.fnmatch(relative, pattern) or any(fnmatch.fnmatch(part, pattern) for part in parts):
+                return True
+        return False
+
+    def included(self, path):
+        if self.excluded(path):
+            return False
+        relative = self.relative(path)
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in self.includes)
+
+    def directories(self):
+        """
+        :return: generator of the directories to watch, pruning the excluded ones
+        """
+        for (top, dirs, files) in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not self.excluded(os.path.join(top, d))]
+            yield top
+
+    def files(self):
+        for top in self.directories():
+            for name in os.listdir(top):
+                path = os.path.join(top, name)
+                if os.path.isfile(path) and self.included(path):
+                    yield path
+
+
+class InotifyWatcher:
+    """
+    Waits for changes with inotify, so the watcher costs nothing while the tree is quiet.
+    """
+
+    def __init__(self, file_filter):
+        """
+
+        :param file_filter: the FileFilter deciding which paths to watch
+        """
+        self.filter = file_filter
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in file_filter.directories():
+            self.watch(directory)
+
+    def watch(self, directory):
+        descriptor = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if descriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "inotify_add_watch failed for {}: {}".format(directory, os.strerror(errno)))
+        self.directories[descriptor] = directory
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: seconds to wait for a change, None to wait forever
+        :return: list of the changed paths we care about, empty if nothing changed before the timeout
+        """
+        (readable, _, _) = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            (descriptor, mask, _, length) = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # we missed events, so assume something we care about changed
+                changed.append(self.filter.root)
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(descriptor, None)
+                continue
+            directory = self.directories.get(descriptor)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # inotify isn't recursive, so new directories need watches of their own
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.filter.excluded(path):
+                    for new_directory in FileFilter(path, excludes=self.filter.excludes).directories():
+                        self.watch(new_directory)
+                continue
+            if self.filter.included(path):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Compares modification times every interval, for systems without inotify.
+    """
+
+    def __init__(self, file_filter, interval=1.0):
+        """
+
+        :param file_filter: the FileFilter deciding which paths to watch
+        :param interval: seconds between scans of the tree
+        """
+        self.filter = file_filter
+        self.interval = interval
+        self.mtimes = self.scan()
+
+    def scan(self):
+        mtimes = {}
+        for path in self.filter.files():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return mtimes
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        mtimes = self.scan()
+        changed = [path for (path, mtime) in mtimes.items() if self.mtimes.get(path) != mtime]
+        changed.extend(path for path in self.mtimes if path not in mtimes)
+        self.mtimes = mtimes
+        return changed
+
+    def close(self):
+        pass
+
+
+class Supervisor:
+    """
+    Runs the command in a process group of its own, so that stopping it also stops anything it started.
+    """
+
+    def __init__(self, command, grace=10.0):
+        """
 
+        :param command: the command to run, as a list of arguments
+        :param grace: seconds to wait after SIGTERM before killing the process
+        """
+        self.command = command
+        self.grace = grace
+        self.process = None
 
-def file_times(path):
-    for top_level in filter(file_filter, os.listdir(path)):
-        for root, dirs, files in os.walk(top_level):
-            for file in filter(file_filter, files):
-                yield os.stat(os.path.join(root, file)).st_mtime
+    def start(self):
+        self.process = subprocess.Popen(self.command, start_new_session=True)
+        print("started {} as pid {}".format(" ".join(self.command), self.process.pid))
 
+    def running(self):
+        return self.process is not None and self.process.poll() is None
 
-def print_stdout(process):
-    stdout = process.stdout
-    if stdout != None:
-        print(stdout)
+    def stop(self):
+        """
+        Asks the process to exit with SIGTERM, and kills it if it hasn't after the grace period.
 
+        :return: seconds it took the process to exit
+        """
+        if not self.running():
+            return 0.0
+        before = time.time()
+        self._signal(signal.SIGTERM)
+        try:
+            self.process.wait(self.grace)
+        except subprocess.TimeoutExpired:
+            print("pid {} still running {}s after SIGTERM, killing it".format(self.process.pid, self.grace))
+            self._signal(signal.SIGKILL)
+            self.process.wait()
+        return time.time() - before
 
-def print_stderr(process):
-    stderr = process.stderr
-    if stderr != None:
-        print(stderr)
+    def _signal(self, signo):
+        try:
+            os.killpg(self.process.pid, signo)
+        except ProcessLookupError:
+            pass
 
 
-# We concatenate all of the arguments together, and treat that as the command to run
-command = ' '.join(sys.argv[1:])
+def debounce(watcher, changed, quiet, max_delay):
+    """
+    Keeps collecting changes until none came in for quiet seconds.
 
-# The path to watch
-path = '.'
+    :param watcher: the watcher to wait on
+    :param changed: the changes seen so far
+    :param quiet: seconds without changes after which the burst is over
+    :param max_delay: restart after this many seconds even if changes keep coming
+    :return: the set of changed paths
+    """
+    changed = set(changed)
+    started = time.time()
+    last_change = started
+    while True:
+        remaining = min(last_change + quiet, started + max_delay) - time.time()
+        if remaining <= 0:
+            break
+        more = watcher.wait(remaining)
+        if len(more) > 0:
+            changed.update(more)
+            last_change = time.time()
+    return changed
 
-# How often we check the filesystem for changes (in seconds)
-wait = 1
 
-# The process to autoreload
-process = subprocess.Popen(command, shell=True)
+def run(command, path=".", includes=None, excludes=None, quiet=0.5, max_delay=5.0, grace=10.0, poll=None):
+    """
+    :param command: the command to run, as a list of arguments
+    :param path: the directory to watch
+    :param includes: globs of the files to watch, every file if None
+    :param excludes: globs of the files and directories to ignore
+    :param quiet: seconds the tree has to be quiet after a change before we restart
+    :param max_delay: most seconds we hold back a restart while changes keep coming
+    :param grace: seconds the command gets to exit after SIGTERM before it is killed
+    :param poll: seconds between scans of the tree, to poll instead of using inotify. None to use inotify if we can.
+    :return:
+    """
+    file_filter = FileFilter(path, includes, excludes)
+    watcher = None
+    if poll is None:
+        try:
+            watcher = InotifyWatcher(file_filter)
+            print("watching {} directories under {} with inotify".format(len(watcher.directories), path))
+        except (OSError, AttributeError) as e:
+            print("inotify unavailable ({}), polling instead".format(e))
+    if watcher is None:
+        watcher = PollingWatcher(file_filter, poll or 1.0)
+        print("polling {} files under {}".format(len(watcher.mtimes), path))
 
-# The current maximum file modified time under the watched directory
-last_mtime = max(file_times(path))
-max_mtime = last_mtime
+    killer = GracefulKiller()
+    supervisor = Supervisor(command, grace)
+    supervisor.start()
+    exited = False
+    try:
+        while not killer.kill_now:
+            changed = watcher.wait(1.0)
+            if not supervisor.running() and not exited:
+                exited = True
+                print("pid {} exited with {}, waiting for changes".format(supervisor.process.pid,
+                                                                          supervisor.process.returncode))
+            if len(changed) == 0:
+                continue
 
+            detected_at = time.time()
+            changed = debounce(watcher, changed, quiet, max_delay)
+            print("{} changed, restarting".format(", ".join(sorted(file_filter.relative(p) for p in changed))))
+            stop_seconds = supervisor.stop()
+            supervisor.start()
+            exited = False
+            print("restarted {:.2f}s after the first change, stopping took {:.2f}s".format(
+                time.time() - detected_at, stop_seconds))
+    finally:
+        supervisor.stop()
+        watcher.close()
 
-while True:
-    print_stdout(process)
-    print_stderr(process)
-    if max_mtime > last_mtime:
-        last_mtime = max_mtime
-        print("killing process")
-        process.kill()
-        print_stdout(process)
-        print_stderr(process)
-        time.sleep(5)
-        print('Restarting process.')
-        process = subprocess.Popen(command, shell=True)
 
-    max_mtime = max(file_times(path))
-    time.sleep(wait)
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-p", "--path", default=".", help="directory to watch")
+    ap.add_argument("-i", "--include", action="append", help="glob of the files to watch, can be repeated")
+    ap.add_argument("-x", "--exclude", action="append",
+                    help="glob of the files and directories to ignore, can be repeated. "
+                         "defaults to {}".format(" ".join(DEFAULT_EXCLUDES)))
+    ap.add_argument("-d", "--debounce", type=float, default=0.5,
+                    help="seconds without changes to wait for before restarting")
+    ap.add_argument("-g", "--grace", type=float, default=10.0,
+                    help="seconds the command gets to exit after SIGTERM before it is killed")
+    ap.add_argument("--poll", type=float, help="poll for changes every this many seconds instead of using inotify")
+    ap.add_argument("command", nargs=argparse.REMAINDER, help="the command to run")
+    args = vars(ap.parse_args())
 
+    command = args["command"]
+    if len(command) > 0 and command[0] == "--":
+        command = command[1:]
+    if len(command) == 1:
+        # the command may have been passed as a single quoted string
+        command = shlex.split(command[0])
+    if len(command) == 0:
+        ap.error("no command to run")
+    excludes = DEFAULT_EXCLUDES + args["exclude"] if args["exclude"] is not None else None
+    run(command, args["path"], args["include"], excludes, args["debounce"], grace=args["grace"], poll=args["poll"])
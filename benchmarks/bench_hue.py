@@ -0,0 +1,96 @@
+"""
+Times the HueWrapper calls made by the scan loop against an in-process fake bridge that adds a fixed round-trip
+latency, with and without the state cache and the asynchronous command queue.
+
+With --server, the wrapper is also load tested over http against a FakeBridgeServer that throttles commands
+like the real bridge and fails a fraction of the requests.
+"""
+
+from hue.fake_bridge import FakeBridge
+from hue.fake_bridge_server import FakeBridgeServer
+from hue.hue_wrapper import HueWrapper
+
+import argparse
+import time
+
+
+def time_calls(function, count):
+    before = time.time()
+    for i in range(count):
+        function(i)
+    return (time.time() - before) / count
+
+
+def time_is_group_on(latency, count, state_ttl):
+    bridge = FakeBridge(latency=latency)
+    hue = HueWrapper("fake", state_ttl=state_ttl, bridge=bridge)
+    seconds = time_calls(lambda i: hue.is_group_on("Kitchen"), count)
+    hue.close()
+    return {"seconds": seconds, "requests": bridge.requests}
+
+
+def time_set_group_state(latency, count, async_commands):
+    bridge = FakeBridge(latency=latency)
+    hue = HueWrapper("fake", bridge=bridge, async_commands=async_commands)
+    futures = []
+    before = time.time()
+    # alternate the brightness so that the cache can't skip every command as redundant
+    seconds = time_calls(lambda i: futures.append(hue.set_group_state("Kitchen", on=True,
+                                                                      brightness_pct=50 + i % 2)), count)
+    for future in futures:
+        future.result()
+    delivered = (time.time() - before) / count
+    hue.close()
+    return {"seconds": seconds, "delivered_seconds": delivered, "requests": bridge.requests}
+
+
+def failed(future):
+    # rejected commands fail their future, in both the synchronous and the asynchronous mode
+    return future.exception() is not None
+
+
+def time_server_load(latency, count, async_commands, rate_limit=10, jitter=0.02, error_rate=0.02):
+    server = FakeBridgeServer(latency=latency, jitter=jitter, rate_limit=rate_limit, error_rate=error_rate,
+                              errors=("api",), error_methods=("PUT",), seed=0)
+    server.start()
+    hue = HueWrapper(server.address, username=server.username, async_commands=async_commands)
+    futures = []
+    before = time.time()
+    seconds = time_calls(lambda i: futures.append(hue.set_group_state("Kitchen", on=True,
+                                                                      brightness_pct=50 + i % 2)), count)
+    failures = sum(1 for future in futures if failed(future))
+    delivered = (time.time() - before) / count
+    hue.close()
+    server.stop()
+    return dict(server.stats(), seconds=seconds, delivered_seconds=delivered, failed=failures)
+
+
+def run(latency=0.05, count=50, server=False):
+    """
+    :param latency: seconds every request to the fake bridge takes
+    :param count: number of calls to time
+    :param server: also load test the wrapper against a FakeBridgeServer
+    :return: dict of call to seconds the caller spent per call, and the number of requests that reached the bridge
+    """
+    results = {
+        "is_group_on/uncached": time_is_group_on(latency, count, state_ttl=0),
+        "is_group_on/cached": time_is_group_on(latency, count, state_ttl=5.0),
+        "set_group_state/sync": time_set_group_state(latency, count, async_commands=False),
+        "set_group_state/async": time_set_group_state(latency, count, async_commands=True),
+    }
+    if server:
+        results["server/set_group_state/sync"] = time_server_load(latency, count, async_commands=False)
+        results["server/set_group_state/async"] = time_server_load(latency, count, async_commands=True)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-l", "--latency", type=float, default=0.05, help="round-trip latency of the fake bridge")
+    ap.add_argument("-n", "--count", type=int, default=50, help="number of calls to time")
+    ap.add_argument("-s", "--server", action="store_true", help="also load test against a fake bridge server")
+    args = vars(ap.parse_args())
+
+    for (call, result) in sorted(run(args["latency"], args["count"], args["server"]).items()):
+        print("{:>32}: {:.2f}ms per call, {} bridge requests, {} failed".format(
+            call, result["seconds"] * 1000, result["requests"], result.get("failed", 0)))
@@ -0,0 +1,88 @@
+"""
+Times HumanDetector.detect() over several frame resolutions, varying the resize width, winStride and scale
+one at a time around the defaults used by main.py.
+"""
+
+from optics.frame_source import SyntheticFrameSource
+from optics.human_detector import HumanDetector
+
+import argparse
+import cv2
+import time
+
+
+DEFAULT_PARAMETERS = {"width": 350, "winStride": (4, 4), "scale": 1.05}
+SWEEP = {
+    "width": (250, 350, 500),
+    "winStride": ((4, 4), (8, 8)),
+    "scale": (1.05, 1.1, 1.2),
+}
+RESOLUTIONS = ((640, 480), (1280, 720))
+
+
+def configurations(sweep=SWEEP):
+    """
+    :return: list of parameter dicts, the defaults first and then one varied parameter at a time
+    """
+    configs = [dict(DEFAULT_PARAMETERS)]
+    for (parameter, values) in sorted(sweep.items()):
+        for value in values:
+            if value == DEFAULT_PARAMETERS[parameter]:
+                continue
+            config = dict(DEFAULT_PARAMETERS)
+            config[parameter] = value
+            configs.append(config)
+    return configs
+
+
+def name(resolution, config):
+    return "{}x{}/width={}/stride={}x{}/scale={}".format(resolution[0], resolution[1], config["width"],
+                                                         config["winStride"][0], config["winStride"][1],
+                                                         config["scale"])
+
+
+def time_detector(frames, width, winStride, scale, repeat):
+    detector = HumanDetector(width)
+    detections = sum(len(detector.detect(frame, winStride=winStride, scale=scale)[0]) for frame in frames)
+    before = time.time()
+    for i in range(repeat):
+        for frame in frames:
+            detector.detect(frame, winStride=winStride, scale=scale)
+    return ((time.time() - before) / (repeat * len(frames)), detections)
+
+
+def run(frames_by_resolution=None, num_frames=4, repeat=2, sweep=SWEEP):
+    """
+    :param frames_by_resolution: dict of (width, height) to the frames to run the detector on.
+                                 defaults to synthetic frames at RESOLUTIONS.
+    :return: dict of configuration to seconds per frame and number of detections
+    """
+    if frames_by_resolution is None:
+        frames_by_resolution = dict((resolution, list(SyntheticFrameSource(resolution=resolution,
+                                                                           max_frames=num_frames).frames()))
+                                    for resolution in RESOLUTIONS)
+    results = {}
+    for (resolution, frames) in sorted(frames_by_resolution.items()):
+        for config in configurations(sweep):
+            (seconds, detections) = time_detector(frames, config["width"], config["winStride"], config["scale"],
+                                                  repeat)
+            results[name(resolution, config)] = {"seconds": seconds, "detections": detections}
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", action="append", help="image to run the detector on, can be repeated")
+    ap.add_argument("-n", "--frames", type=int, default=4, help="number of synthetic frames per resolution")
+    ap.add_argument("-r", "--repeat", type=int, default=2, help="number of timed passes over the frames")
+    args = vars(ap.parse_args())
+
+    frames_by_resolution = None
+    if args["image"]:
+        frames_by_resolution = {}
+        for image in [cv2.imread(path) for path in args["image"]]:
+            frames_by_resolution.setdefault((image.shape[1], image.shape[0]), []).append(image)
+
+    for (config, result) in sorted(run(frames_by_resolution, args["frames"], args["repeat"]).items()):
+        print("{:>40}: {:.1f}ms per frame, {} detections".format(config, result["seconds"] * 1000,
+                                                                 result["detections"]))
@@ -0,0 +1,97 @@
+"""
+Compares the pairwise MotionDetector.detect() with the stateful MotionDetector.update() on 640x480 frames,
+and update() on bgr frames with update() on the luminance plane alone, as read from a yuv capture.
+"""
+
+from optics.frame_source import SyntheticFrameSource
+from optics.motion_detector import MotionDetector
+
+import argparse
+import cv2
+import time
+import tracemalloc
+
+
+def time_pairwise(frames, min_area=300):
+    detector = MotionDetector(min_area=min_area)
+    before = time.time()
+    for (previous_frame, frame) in zip(frames, frames[1:]):
+        list(detector.detect(previous_frame, frame))
+    return (time.time() - before) / (len(frames) - 1)
+
+
+def time_update(frames, min_area=300, learning_rate=None):
+    detector = MotionDetector(min_area=min_area, learning_rate=learning_rate)
+    detector.update(frames[0])
+    before = time.time()
+    for frame in frames[1:]:
+        list(detector.update(frame))
+    return (time.time() - before) / (len(frames) - 1)
+
+
+def allocated(analyse, frames):
+    """
+    :param analyse: function analysing a frame
+    :return: the most memory (in bytes) allocated on top of what was in use before while analysing the frames,
+             after a couple of frames to let the detector set up its buffers
+    """
+    for frame in frames[:2]:
+        analyse(frame)
+    tracemalloc.start()
+    try:
+        (before, _) = tracemalloc.get_traced_memory()
+        for frame in frames[2:]:
+            analyse(frame)
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def run(num_frames=200, resolution=(640, 480), learning_rate=0.1):
+    """
+    :return: dict of mode to seconds per frame
+    """
+    # generate the frames up front so that we only time the detector
+    frames = list(SyntheticFrameSource(resolution=resolution, max_frames=num_frames).frames())
+    luminance = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    return {
+        "pairwise": time_pairwise(frames),
+        "previous_frame": time_update(frames),
+        "running_average": time_update(frames, learning_rate=learning_rate),
+        "luminance": time_update(luminance),
+    }
+
+
+def run_allocations(num_frames=20, resolution=(640, 480)):
+    """
+    :return: dict of mode to bytes allocated while analysing the frames
+    """
+    frames = list(SyntheticFrameSource(resolution=resolution, max_frames=num_frames).frames())
+    luminance = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    pairwise = MotionDetector()
+    previous = {"frame": frames[0]}
+
+    def detect(frame):
+        pairwise.detect(previous["frame"], frame)
+        previous["frame"] = frame
+
+    return {
+        "pairwise": allocated(detect, frames),
+        "previous_frame": allocated(MotionDetector().update, frames),
+        "luminance": allocated(MotionDetector().update, luminance),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--frames", type=int, default=200, help="number of frames to run through each mode")
+    ap.add_argument("-l", "--learning-rate", type=float, default=0.1, help="learning rate of the running average")
+    args = vars(ap.parse_args())
+
+    results = run(args["frames"], learning_rate=args["learning_rate"])
+    for (mode, seconds) in results.items():
+        print("{:>16}: {:.2f}ms per frame ({:.2f}x pairwise)".format(
+            mode, seconds * 1000, results["pairwise"] / seconds))
+    for (mode, size) in run_allocations().items():
+        print("{:>16}: {:.0f}kB allocated at most".format(mode, size / 1024.0))
@@ -0,0 +1,70 @@
+"""
+Compares finding motion in the encoder's motion vectors with MotionDetector diffing 640x480 frames, on the same
+synthetic blob. Recorded vectors (ie from CameraMotionVectorSource's record_path) can be replayed with -r.
+"""
+
+from optics.frame_source import SyntheticFrameSource
+from optics.motion_detector import MotionDetector
+from optics.motion_vectors import MotionVectorDetector, MotionVectorFileSource, SyntheticMotionVectorSource
+
+import argparse
+import time
+
+
+def time_vectors(arrays, min_area=300, resolution=(640, 480)):
+    """
+    :return: (seconds per array, fraction of arrays with motion)
+    """
+    detector = MotionVectorDetector(min_area=min_area, resolution=resolution)
+    found = 0
+    before = time.time()
+    for vectors in arrays:
+        if len(detector.detect(vectors)) > 0:
+            found += 1
+    return ((time.time() - before) / len(arrays), float(found) / len(arrays))
+
+
+def time_frames(frames, min_area=300):
+    """
+    :return: (seconds per frame, fraction of frames with motion)
+    """
+    detector = MotionDetector(min_area=min_area)
+    detector.update(frames[0])
+    found = 0
+    before = time.time()
+    for frame in frames[1:]:
+        if len(detector.update(frame)) > 0:
+            found += 1
+    return ((time.time() - before) / (len(frames) - 1), float(found) / (len(frames) - 1))
+
+
+def run(num_frames=200, resolution=(640, 480), speed=30, recording=None):
+    """
+    :param recording: optional file of recorded motion vectors to time as well
+    :return: dict of backend to seconds per frame and the fraction of frames in which it found motion
+    """
+    # generate the input up front so that we only time the detectors
+    frames = list(SyntheticFrameSource(resolution=resolution, max_frames=num_frames, speed=speed).frames())
+    arrays = list(SyntheticMotionVectorSource(resolution=resolution, max_frames=num_frames, speed=speed).frames())
+    results = {}
+    for (backend, (seconds, motion_rate)) in (("frames", time_frames(frames)),
+                                              ("vectors", time_vectors(arrays, resolution=resolution))):
+        results[backend] = {"seconds": seconds, "motion_rate": motion_rate}
+    if recording is not None:
+        recorded = list(MotionVectorFileSource(recording, resolution).frames())
+        (seconds, motion_rate) = time_vectors(recorded, resolution=resolution)
+        results["recorded"] = {"seconds": seconds, "motion_rate": motion_rate}
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--frames", type=int, default=200, help="number of frames to run through each backend")
+    ap.add_argument("-r", "--recording", help="recorded motion vectors to replay, raw or .npy")
+    args = vars(ap.parse_args())
+
+    results = run(args["frames"], recording=args["recording"])
+    for (backend, result) in sorted(results.items()):
+        print("{:>10}: {:.3f}ms per frame ({:.1f}x frames), motion in {:.0f}% of frames".format(
+            backend, result["seconds"] * 1000, results["frames"]["seconds"] / result["seconds"],
+            result["motion_rate"] * 100))
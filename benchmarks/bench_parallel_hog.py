@@ -0,0 +1,74 @@
+"""
+Measures how the HOG person detector scales over 1, 2 and 4 worker processes,
+and checks that the parallel detector finds the same boxes as the single process one.
+"""
+
+from optics.frame_source import SyntheticFrameSource
+from optics.human_detector import HumanDetector
+from optics.parallel_human_detector import ParallelHumanDetector
+
+import argparse
+import cv2
+import imutils
+import time
+
+
+def time_detector(detector, images, repeat):
+    results = [detector.detect_multiscale(image) for image in images]
+    before = time.time()
+    for i in range(repeat):
+        for image in images:
+            detector.detect_multiscale(image)
+    return ((time.time() - before) / (repeat * len(images)), results)
+
+
+def same_boxes(expected, actual):
+    return sorted(map(tuple, expected[0])) == sorted(map(tuple, actual[0]))
+
+
+def run(images, workers=(1, 2, 4), repeat=3, width=350):
+    """
+    :param images: bgr images to run the detectors on
+    :return: dict of configuration to seconds per image, and whether its boxes match the baseline
+    """
+    images = [imutils.resize(image, width=min(width, image.shape[1])) for image in images]
+
+    # opencv parallelises detectMultiScale itself when it is built with threading support, so we time the
+    # single threaded detector as the baseline, and report the threaded one for reference
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+    (baseline, expected) = time_detector(HumanDetector(width), images, repeat)
+    cv2.setNumThreads(threads)
+    (threaded, _) = time_detector(HumanDetector(width), images, repeat)
+
+    results = {
+        "single_process": {"seconds": baseline, "speedup": 1.0, "matches": True},
+        "opencv_threads": {"seconds": threaded, "speedup": baseline / threaded, "matches": True},
+    }
+    for count in workers:
+        detector = ParallelHumanDetector(width, workers=count)
+        (seconds, actual) = time_detector(detector, images, repeat)
+        detector.close()
+        results["workers_{}".format(count)] = {
+            "seconds": seconds,
+            "speedup": baseline / seconds,
+            "matches": all(same_boxes(e, a) for (e, a) in zip(expected, actual)),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", action="append", help="image to run the detector on, can be repeated")
+    ap.add_argument("-w", "--width", type=int, default=350, help="width images are resized to")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="number of timed passes over the images")
+    args = vars(ap.parse_args())
+
+    if args["image"]:
+        images = [cv2.imread(path) for path in args["image"]]
+    else:
+        images = list(SyntheticFrameSource(max_frames=4).frames())
+
+    for (name, result) in sorted(run(images, repeat=args["repeat"], width=args["width"]).items()):
+        print("{:>16}: {:.1f}ms per image, {:.2f}x, matches single process: {}".format(
+            name, result["seconds"] * 1000, result["speedup"], result["matches"]))
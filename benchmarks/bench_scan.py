@@ -0,0 +1,54 @@
+"""
+Times the end to end scan loop, and the threaded pipeline, on replayed frames against a fake bridge.
+"""
+
+from hue.fake_bridge import FakeBridge
+from hue.hue_wrapper import HueWrapper
+from model.hue_strategy import HueStrategy
+from optics.frame_source import SyntheticFrameSource, VideoFileFrameSource
+
+import argparse
+import replay
+
+
+def time_replay(get_frame_source, pipelined, latency):
+    hue = HueWrapper("fake", bridge=FakeBridge(latency=latency), async_commands=True)
+    strategy = HueStrategy("Kitchen", lambda: 100, lambda: 0)
+    frame_source = get_frame_source()
+    summary = replay.replay(frame_source, hue, strategy, pipelined=pipelined)
+    frame_source.close()
+    hue.close()
+    summary.pop("stages", None)
+    # seconds per frame, comparable with the other benchmarks
+    summary["seconds"] = 1.0 / summary["fps"] if summary["fps"] > 0 else 0.0
+    return summary
+
+
+def run(video=None, num_frames=300, latency=0.05):
+    """
+    :param video: path to a recorded video, synthetic frames are used if None
+    :param num_frames: number of frames to replay
+    :param latency: seconds every request to the fake bridge takes
+    :return: dict of mode to the replay summary, ie fps and per frame latency percentiles
+    """
+    def get_frame_source():
+        if video is not None:
+            return VideoFileFrameSource(video, max_frames=num_frames)
+        return SyntheticFrameSource(max_frames=num_frames)
+
+    return {
+        "scan": time_replay(get_frame_source, False, latency),
+        "pipeline": time_replay(get_frame_source, True, latency),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", help="path to a recorded video")
+    ap.add_argument("-n", "--frames", type=int, default=300, help="number of frames to replay")
+    ap.add_argument("-l", "--latency", type=float, default=0.05, help="round-trip latency of the fake bridge")
+    args = vars(ap.parse_args())
+
+    for (mode, summary) in sorted(run(args["video"], args["frames"], args["latency"]).items()):
+        print("{:>10}: {:.1f} fps, p50 {:.1f}ms p90 {:.1f}ms p99 {:.1f}ms".format(
+            mode, summary["fps"], summary["p50"] * 1000, summary["p90"] * 1000, summary["p99"] * 1000))
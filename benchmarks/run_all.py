@@ -0,0 +1,133 @@
+"""
+Runs every benchmark and saves the results as JSON, so that runs can be compared over time.
+
+    python -m benchmarks.run_all -o results/$(date +%F).json --compare results/previous.json
+"""
+
+from benchmarks import bench_human, bench_hue, bench_motion, bench_motion_vectors, bench_scan
+from optics.frame_source import SyntheticFrameSource
+
+import argparse
+import cv2
+import datetime
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "time": datetime.datetime.now().isoformat(),
+        "revision": git_revision(),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def run_motion(num_frames, min_areas=(100, 300, 1000)):
+    results = dict(("mode={}".format(mode), {"seconds": seconds})
+                   for (mode, seconds) in bench_motion.run(num_frames).items())
+    frames = list(SyntheticFrameSource(max_frames=num_frames).frames())
+    for min_area in min_areas:
+        results["min_area={}".format(min_area)] = {"seconds": bench_motion.time_pairwise(frames, min_area)}
+    for (backend, result) in bench_motion_vectors.run(num_frames).items():
+        results["backend={}".format(backend)] = result
+    return results
+
+
+def run(quick=False, video=None, latency=0.05):
+    """
+    :param quick: fewer frames and repeats, for a fast sanity check rather than numbers to compare
+    :param video: optional recorded video to replay through the scan loop
+    :param latency: round-trip latency of the fake bridge
+    :return: dict with the environment and the results of every benchmark
+    """
+    scale = 0.25 if quick else 1.0
+    return {
+        "environment": environment(),
+        "results": {
+            "motion": run_motion(int(200 * scale)),
+            "human": bench_human.run(num_frames=2 if quick else 4, repeat=1 if quick else 2),
+            "scan": bench_scan.run(video, int(300 * scale), latency),
+            "hue": bench_hue.run(latency, int(50 * scale), server=True),
+        },
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    :return: dict of "benchmark/case" to seconds, for every timed case in the results
+    """
+    flat = {}
+    for (key, value) in results.items():
+        if isinstance(value, dict):
+            if "seconds" in value:
+                flat[prefix + key] = value["seconds"]
+            else:
+                flat.update(flatten(value, prefix + key + "/"))
+    return flat
+
+
+def compare(previous, current, threshold=0.1):
+    """
+    Prints every case that got slower or faster by more than threshold.
+
+    :param previous: results of the earlier run
+    :param current: results of this run
+    :param threshold: relative change below which we consider the timing unchanged
+    :return: number of cases that got slower
+    """
+    before = flatten(previous["results"])
+    after = flatten(current["results"])
+    slower = 0
+    for case in sorted(set(before) & set(after)):
+        if before[case] <= 0:
+            continue
+        change = after[case] / before[case] - 1
+        if abs(change) < threshold:
+            continue
+        if change > 0:
+            slower += 1
+        print("{:>60}: {:.2f}ms -> {:.2f}ms ({:+.0f}%)".format(case, before[case] * 1000, after[case] * 1000,
+                                                               change * 100))
+    return slower
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-o", "--output", help="file to save the results to as JSON")
+    ap.add_argument("-c", "--compare", help="results of an earlier run to compare against")
+    ap.add_argument("-q", "--quick", action="store_true", help="run fewer iterations")
+    ap.add_argument("-v", "--video", help="recorded video to replay through the scan loop")
+    ap.add_argument("-l", "--latency", type=float, default=0.05, help="round-trip latency of the fake bridge")
+    args = vars(ap.parse_args())
+
+    results = run(args["quick"], args["video"], args["latency"])
+    for (case, seconds) in sorted(flatten(results["results"]).items()):
+        print("{:>60}: {:.2f}ms".format(case, seconds * 1000))
+
+    if args["output"] is not None:
+        with open(args["output"], "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("saved results to {}".format(args["output"]))
+
+    if args["compare"] is not None:
+        with open(args["compare"]) as f:
+            previous = json.load(f)
+        print("compared to {} ({}):".format(args["compare"], previous["environment"].get("revision")))
+        sys.exit(1 if compare(previous, results) > 0 else 0)
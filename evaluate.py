@@ -0,0 +1,383 @@
+#!/usr/bin/python
+"""
+Evaluates the person and motion detectors against a labelled dataset, without a display.
+
+The labels are a JSON file mapping the path of every image, relative to the dataset directory, to the (x, y, w, h)
+boxes of the people in it, ie {"kitchen/0001.jpg": [[412, 80, 96, 240]], "kitchen/0002.jpg": []}. Only labelled
+images are evaluated. Consecutive images in the same directory are treated as consecutive frames for the motion
+detector.
+
+By default the person detector searches every whole image. With --in-motion it only searches the regions the motion
+detector found, with HumanDetector.detect_regions() like main.scan(), so the accuracy and latency are what the scan
+loop gets.
+
+Detections are computed in a process pool and cached by image hash and detector parameters, so a re-run only
+recomputes the images or parameters that changed. The weight and overlap thresholds are applied to the cached
+detections, so changing those never recomputes anything.
+
+    python evaluate.py -d ~/frames -l ~/frames/labels.json --scale 1.1
+"""
+
+from imutils import paths
+from multiprocessing import Pool, cpu_count
+from optics.boxes import iou_matrix, rects_overlap
+from optics.human_detector import HumanDetector
+from optics.motion_detector import MotionDetector
+
+import argparse
+import cv2
+import hashlib
+import imutils
+import json
+import numpy as np
+import os
+import platform
+import time
+
+
+HUMAN_DEFAULTS = {"width": 350, "winStride": [4, 4], "padding": [6, 6], "scale": 1.05}
+MOTION_DEFAULTS = {"min_area": 300}
+
+# detectors of a worker process, set up once by _init_worker
+_worker_human = None
+_worker_motion = None
+_worker_params = None
+
+
+def _init_worker(human_params, motion_params):
+    global _worker_human, _worker_motion, _worker_params
+    # the pool already uses every core, so we don't want opencv spawning threads of its own
+    cv2.setNumThreads(1)
+    _worker_human = HumanDetector(human_params["width"], human_params["winStride"], human_params["padding"],
+                                  human_params["scale"], verbose=False)
+    _worker_motion = MotionDetector(min_area=motion_params["min_area"])
+    _worker_params = human_params
+
+
+def _detect_humans(path):
+    image = cv2.imread(path)
+    before = time.time()
+    # the same as HumanDetector.detect(), without printing every result
+    resized = imutils.resize(image, width=min(_worker_human.width, image.shape[1]))
+    (rects, weights) = _worker_human.detect_multiscale(resized, winStride=tuple(_worker_params["winStride"]),
+                                                       padding=tuple(_worker_params["padding"]),
+                                                       scale=_worker_params["scale"])
+    seconds = time.time() - before
+    # map the boxes back into the coordinates of the labels
+    ratio = float(image.shape[1]) / resized.shape[1]
+    return {
+        "boxes": [[int(round(v * ratio)) for v in rect] for rect in np.reshape(rects, (-1, 4))],
+        "weights": [float(w) for w in np.ravel(weights)],
+        "seconds": seconds,
+    }
+
+
+def _detect_humans_in_motion(path, rects):
+    image = cv2.imread(path)
+    before = time.time()
+    # the same as main.scan(): only search the regions with motion, at the resolution detect_regions picks for them
+    (boxes, weights) = _worker_human.detect_regions(image, [tuple(rect) for rect in rects])
+    return {
+        "boxes": [[int(v) for v in box] for box in boxes],
+        "weights": [float(w) for w in weights],
+        "seconds": time.time() - before,
+    }
+
+
+def _detect_motion(previous_path, path):
+    _worker_motion.reset()
+    _worker_motion.update(cv2.imread(previous_path))
+    frame = cv2.imread(path)
+    before = time.time()
+    rects = _worker_motion.update(frame)
+    return {"boxes": [list(rect) for rect in rects], "seconds": time.time() - before}
+
+
+class DetectionCache:
+    """
+    Detections for one detector and set of parameters, keyed by image hash and stored as a JSON file.
+    """
+
+    def __init__(self, directory, kind, params):
+        """
+
+        :param directory: directory to keep the cache files in
+        :param kind: name of the detector, ie "human"
+        :param params: the detector parameters. results are only shared between runs with the same parameters.
+        """
+        # the cached latencies are only meaningful on the kind of machine that measured them, ie the pi
+        key = dict(params, kind=kind, opencv=cv2.__version__, machine=platform.machine())
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(directory, "{}-{}.json".format(kind, digest))
+        self.params = key
+        self.results = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.results = json.load(f)["results"]
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def put(self, key, result):
+        self.results[key] = result
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # write to a temporary file first, so an interrupted run never leaves a corrupt cache behind
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"params": self.params, "results": self.results}, f)
+        os.rename(temp_path, self.path)
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_dataset(directory, labels_path):
+    """
+    :param directory: the dataset directory
+    :param labels_path: JSON file of image path, relative to the directory, to person boxes
+    :return: sorted list of (path, boxes) for every labelled image that exists
+    """
+    with open(labels_path) as f:
+        labels = json.load(f)
+    dataset = []
+    for path in sorted(paths.list_images(directory)):
+        relative = os.path.relpath(path, directory).replace(os.sep, "/")
+        if relative in labels:
+            dataset.append((path, [tuple(box) for box in labels[relative]]))
+    return dataset
+
+
+def frame_pairs(dataset):
+    """
+    :return: list of (index of previous image, index of image) for consecutive images in the same directory
+    """
+    return [(i - 1, i) for i in range(1, len(dataset))
+            if os.path.dirname(dataset[i - 1][0]) == os.path.dirname(dataset[i][0])]
+
+
+def match(boxes, truth, iou_threshold):
+    """
+    Greedily matches detections, strongest first, to the labelled box they overlap the most.
+
+    :param boxes: detected (x, y, w, h) boxes, sorted by descending weight
+    :param truth: labelled (x, y, w, h) boxes
+    :param iou_threshold: minimum intersection over union for a detection to count as finding a labelled box
+    :return: tuple of true positives, false positives and false negatives
+    """
+    if len(boxes) == 0 or len(truth) == 0:
+        return (0, len(boxes), len(truth))
+    overlaps = iou_matrix(boxes, truth)
+    true_positives = 0
+    for row in overlaps:
+        best = int(np.argmax(row))
+        if row[best] >= iou_threshold:
+            # a labelled box can only be found once
+            overlaps[:, best] = -1.0
+            true_positives += 1
+    return (true_positives, len(boxes) - true_positives, len(truth) - true_positives)
+
+
+def latency_summary(seconds):
+    if len(seconds) == 0:
+        return {"mean": 0.0, "p50": 0.0, "p90": 0.0, "max": 0.0}
+    return {
+        "mean": float(np.mean(seconds)),
+        "p50": float(np.percentile(seconds, 50)),
+        "p90": float(np.percentile(seconds, 90)),
+        "max": float(np.max(seconds)),
+    }
+
+
+def precision_recall(true_positives, false_positives, false_negatives):
+    found = true_positives + false_positives
+    expected = true_positives + false_negatives
+    return {
+        "precision": float(true_positives) / found if found > 0 else 1.0,
+        "recall": float(true_positives) / expected if expected > 0 else 1.0,
+        "true_positives": true_positives,
+        "false_positives": false_positives,
+        "false_negatives": false_negatives,
+    }
+
+
+def detect(dataset, human_params, motion_params, cache_directory, workers=None, in_motion=False):
+    """
+    Runs the detectors over every image of the dataset that isn't cached yet.
+
+    :param dataset: list of (path, boxes) from load_dataset
+    :param human_params: parameters of the HumanDetector, see HUMAN_DEFAULTS
+    :param motion_params: parameters of the MotionDetector, see MOTION_DEFAULTS
+    :param cache_directory: directory to cache detections in
+    :param workers: number of worker processes, defaults to the number of cores
+    :param in_motion: run the person detector the way main.scan() does, with detect_regions() on the motion the
+                      motion detector found in the image, and not at all on images without motion. otherwise it
+                      searches every whole image.
+    :return: tuple of the human detections, one per image, the motion detections, one per frame pair,
+             and the number of detections that had to be computed
+    """
+    motion_cache = DetectionCache(cache_directory, "motion", motion_params)
+    hashes = [file_hash(path) for (path, boxes) in dataset]
+    pairs = frame_pairs(dataset)
+    motion_keys = ["{}:{}".format(hashes[previous], hashes[current]) for (previous, current) in pairs]
+    if in_motion:
+        # the regions depend on the motion parameters, and the motion key identifies the regions of an image
+        human_cache = DetectionCache(cache_directory, "human_in_motion", dict(human_params, motion=motion_params))
+        human_keys = [None] * len(dataset)
+        for ((previous, current), key) in zip(pairs, motion_keys):
+            human_keys[current] = key
+    else:
+        human_cache = DetectionCache(cache_directory, "human", human_params)
+        human_keys = hashes
+
+    pool = None
+    computed = 0
+    try:
+        motion_todo = [i for (i, key) in enumerate(motion_keys) if motion_cache.get(key) is None]
+        if len(motion_todo) > 0:
+            print("computing {} motion detections, {} cached".format(len(motion_todo),
+                                                                     len(motion_keys) - len(motion_todo)))
+            pool = Pool(processes=workers or cpu_count(), initializer=_init_worker,
+                        initargs=(human_params, motion_params))
+            motion_results = pool.starmap(_detect_motion, [(dataset[pairs[i][0]][0], dataset[pairs[i][1]][0])
+                                                           for i in motion_todo])
+            for (i, result) in zip(motion_todo, motion_results):
+                motion_cache.put(motion_keys[i], result)
+            computed += len(motion_todo)
+
+        regions = [None] * len(dataset)
+        if in_motion:
+            for ((previous, current), key) in zip(pairs, motion_keys):
+                regions[current] = motion_cache.get(key)["boxes"]
+            # the first image of a sequence only primes the motion detector, so neither it nor images without
+            # motion ever reach the person detector
+            human_keys = [key if rects else None for (key, rects) in zip(human_keys, regions)]
+
+        human_todo = [i for (i, key) in enumerate(human_keys) if key is not None and human_cache.get(key) is None]
+        if len(human_todo) > 0:
+            print("computing {} person detections, {} cached".format(
+                len(human_todo), sum(1 for key in human_keys if key is not None) - len(human_todo)))
+            if pool is None:
+                pool = Pool(processes=workers or cpu_count(), initializer=_init_worker,
+                            initargs=(human_params, motion_params))
+            if in_motion:
+                human_results = pool.starmap(_detect_humans_in_motion, [(dataset[i][0], regions[i])
+                                                                        for i in human_todo], chunksize=4)
+            else:
+                human_results = pool.imap(_detect_humans, [dataset[i][0] for i in human_todo], chunksize=4)
+            for (i, result) in zip(human_todo, human_results):
+                human_cache.put(human_keys[i], result)
+            computed += len(human_todo)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        # keep whatever we computed, even if we were interrupted
+        human_cache.save()
+        motion_cache.save()
+
+    nothing = {"boxes": [], "weights": [], "seconds": 0.0}
+    return ([human_cache.get(key) if key is not None else nothing for key in human_keys],
+            [motion_cache.get(key) for key in motion_keys], computed)
+
+
+def score(dataset, human_results, motion_results, weight_threshold=0.2, iou_threshold=0.5):
+    """
+    :param dataset: list of (path, boxes) from load_dataset
+    :param human_results: detections for every image, from detect()
+    :param motion_results: detections for every frame pair, from detect()
+    :param weight_threshold: minimum weight of a person detection, like the threshold in main.scan()
+    :param iou_threshold: minimum intersection over union for a detection to match a labelled box
+    :return: dict of precision, recall and latency of both detectors, and the results of every image
+    """
+    totals = [0, 0, 0]
+    images = []
+    for ((path, truth), result) in zip(dataset, human_results):
+        detections = sorted(zip(result["weights"], map(tuple, result["boxes"])), reverse=True)
+        boxes = [box for (weight, box) in detections if weight > weight_threshold]
+        counts = match(boxes, truth, iou_threshold)
+        totals = [total + count for (total, count) in zip(totals, counts)]
+        images.append({"path": path, "true_positives": counts[0], "false_positives": counts[1],
+                       "false_negatives": counts[2], "seconds": result["seconds"]})
+
+    # the motion detector only gates the person detector, so we score it per frame: did it find motion
+    # on a person in frames with people, and did it stay quiet in frames without
+    frames = [0, 0, 0]
+    for ((previous, current), result) in zip(frame_pairs(dataset), motion_results):
+        truth = dataset[current][1]
+        triggered = len(result["boxes"]) > 0
+        on_person = any(rects_overlap(box, t) for box in result["boxes"] for t in truth)
+        if on_person:
+            frames[0] += 1
+        elif triggered:
+            frames[1] += 1
+        elif len(truth) > 0:
+            frames[2] += 1
+
+    return {
+        "human": dict(precision_recall(*totals), latency=latency_summary([r["seconds"] for r in human_results])),
+        "motion": dict(precision_recall(*frames), latency=latency_summary([r["seconds"] for r in motion_results])),
+        "images": images,
+    }
+
+
+def evaluate(directory, labels_path, human_params=None, motion_params=None, cache_directory=None, workers=None,
+             weight_threshold=0.2, iou_threshold=0.5, in_motion=False):
+    """
+    :param in_motion: score the person detector on the regions with motion only, see detect()
+    :return: the scores of the detectors on the dataset, see score()
+    """
+    human_params = dict(HUMAN_DEFAULTS, **(human_params or {}))
+    motion_params = dict(MOTION_DEFAULTS, **(motion_params or {}))
+    if cache_directory is None:
+        cache_directory = os.path.join(directory, ".detections")
+    dataset = load_dataset(directory, labels_path)
+    (human_results, motion_results, computed) = detect(dataset, human_params, motion_params, cache_directory,
+                                                       workers, in_motion)
+    scores = score(dataset, human_results, motion_results, weight_threshold, iou_threshold)
+    scores["computed"] = computed
+    scores["params"] = {"human": human_params, "motion": motion_params}
+    return scores
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--dataset", required=True, help="path to the dataset directory")
+    ap.add_argument("-l", "--labels", help="path to the labels, defaults to labels.json in the dataset directory")
+    ap.add_argument("-c", "--cache", help="directory to cache detections in, defaults to .detections in the dataset")
+    ap.add_argument("-w", "--workers", type=int, help="number of worker processes, defaults to the number of cores")
+    ap.add_argument("-o", "--output", help="file to save the scores and per image results to as JSON")
+    ap.add_argument("--width", type=int, default=HUMAN_DEFAULTS["width"], help="width images are resized to")
+    ap.add_argument("--win-stride", type=int, default=HUMAN_DEFAULTS["winStride"][0], help="HOG window stride")
+    ap.add_argument("--padding", type=int, default=HUMAN_DEFAULTS["padding"][0], help="HOG padding")
+    ap.add_argument("--scale", type=float, default=HUMAN_DEFAULTS["scale"], help="HOG pyramid scale")
+    ap.add_argument("--min-area", type=int, default=MOTION_DEFAULTS["min_area"], help="minimum area of motion")
+    ap.add_argument("--threshold", type=float, default=0.2, help="minimum weight of a person detection")
+    ap.add_argument("--iou", type=float, default=0.5, help="minimum overlap for a detection to match a label")
+    ap.add_argument("--in-motion", action="store_true",
+                    help="only run the person detector on the regions with motion, like main.py does")
+    args = vars(ap.parse_args())
+
+    before = time.time()
+    scores = evaluate(args["dataset"], args["labels"] or os.path.join(args["dataset"], "labels.json"),
+                      human_params={"width": args["width"], "winStride": [args["win_stride"]] * 2,
+                                    "padding": [args["padding"]] * 2, "scale": args["scale"]},
+                      motion_params={"min_area": args["min_area"]}, cache_directory=args["cache"],
+                      workers=args["workers"], weight_threshold=args["threshold"], iou_threshold=args["iou"],
+                      in_motion=args["in_motion"])
+
+    print("evaluated {} images in {:.1f}s, {} detections computed".format(
+        len(scores["images"]), time.time() - before, scores["computed"]))
+    for detector in ("human", "motion"):
+        result = scores[detector]
+        print("{:>6}: precision {:.3f} recall {:.3f} (tp {} fp {} fn {}), latency mean {:.1f}ms p90 {:.1f}ms".format(
+            detector, result["precision"], result["recall"], result["true_positives"], result["false_positives"],
+            result["false_negatives"], result["latency"]["mean"] * 1000, result["latency"]["p90"] * 1000))
+
+    if args["output"] is not None:
+        with open(args["output"], "w") as f:
+            json.dump(scores, f, indent=2)
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+"""
+Summarises the event log written by main.py --event-log, per hour or per day.
+
+    python events.py -l events.db occupancy --by day --since 2026-01-01
+    python events.py -l events.db latency --by hour --zone Kitchen
+    python events.py -l events.db tail -n 20
+
+Occupancy is the fraction of every bucket the lights were on, from the light change events. Latency combines the
+per minute frame statistics with the time from motion to the bridge acknowledging the lights are on. The aggregation
+runs in sqlite or streams through the rows in time order, so months of events don't have to fit in memory.
+"""
+
+from util.event_log import connect
+
+import argparse
+import datetime
+import time
+
+
+BUCKETS = {
+    "hour": ("%Y-%m-%d %H:00", 3600),
+    "day": ("%Y-%m-%d", 86400),
+}
+
+
+def bucket_start(timestamp, by):
+    """
+    :return: the local time the bucket of the timestamp starts at, as a timestamp
+    """
+    when = datetime.datetime.fromtimestamp(timestamp)
+    if by == "hour":
+        when = when.replace(minute=0, second=0, microsecond=0)
+    else:
+        when = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    return time.mktime(when.timetuple())
+
+
+def bucket_name(timestamp, by):
+    return datetime.datetime.fromtimestamp(timestamp).strftime(BUCKETS[by][0])
+
+
+def where(since, until, zone, time_column="time"):
+    """
+    :return: (sql condition, parameters) selecting the rows in the time range and zone
+    """
+    conditions = ["{} >= ?".format(time_column)]
+    parameters = [since]
+    if until is not None:
+        conditions.append("{} < ?".format(time_column))
+        parameters.append(until)
+    if zone is not None:
+        conditions.append("zone = ?")
+        parameters.append(zone)
+    return (" AND ".join(conditions), parameters)
+
+
+def lights_on_at(connection, when, zone=None):
+    """
+    :return: set of the zones whose lights were on at the time, going by the last light change before it
+    """
+    if zone is not None:
+        zones = [zone]
+    else:
+        zones = [row[0] for row in connection.execute(
+            "SELECT DISTINCT zone FROM events WHERE kind = 'lights' AND time < ?", (when,))]
+    on = set()
+    for event_zone in zones:
+        last = connection.execute("SELECT value FROM events WHERE kind = 'lights' AND zone = ? AND time < ? "
+                                  "ORDER BY time DESC LIMIT 1", (event_zone, when)).fetchone()
+        if last is not None and last[0]:
+            on.add(event_zone)
+    return on
+
+
+def occupancy(connection, by="hour", since=0.0, until=None, zone=None):
+    """
+    :return: list of (bucket, seconds the lights were on, fraction of the bucket, times they were turned on),
+             summed over the zones
+    """
+    if until is None:
+        until = time.time()
+    (condition, parameters) = where(since, until, zone)
+    on_seconds = {}
+    turned_on = {}
+
+    def add(began, ended):
+        # split the interval over the buckets it spans
+        while began < ended:
+            start = bucket_start(began, by)
+            end = min(ended, start + BUCKETS[by][1])
+            on_seconds[start] = on_seconds.get(start, 0.0) + end - began
+            began = end
+
+    # lights that were already on at since count from there, but weren't turned on in the range
+    on_at_since = lights_on_at(connection, since, zone)
+    # ordered per zone, so we only have to remember when the current zone's lights came on
+    cursor = connection.execute("SELECT zone, time, value FROM events WHERE kind = 'lights' AND {} "
+                                "ORDER BY zone, time".format(condition), parameters)
+    current_zone = None
+    on_since = None
+    for (event_zone, timestamp, value) in cursor:
+        if event_zone != current_zone:
+            if on_since is not None:
+                add(on_since, until)
+            (current_zone, on_since) = (event_zone, since if event_zone in on_at_since else None)
+            on_at_since.discard(event_zone)
+        if value and on_since is None:
+            on_since = timestamp
+            start = bucket_start(timestamp, by)
+            turned_on[start] = turned_on.get(start, 0) + 1
+        elif not value and on_since is not None:
+            add(on_since, timestamp)
+            on_since = None
+    if on_since is not None:
+        add(on_since, until)
+    # on the whole time, without a light change in the range
+    for _ in on_at_since:
+        add(since, until)
+
+    return [(bucket_name(start, by), seconds, seconds / BUCKETS[by][1], turned_on.get(start, 0))
+            for (start, seconds) in sorted(on_seconds.items())]
+
+
+def latency(connection, by="hour", since=0.0, until=None, zone=None):
+    """
+    :return: list of (bucket, frames, mean seconds per frame, max seconds per frame, fraction of frames with motion,
+             times the lights came on, mean seconds from motion to the lights coming on)
+    """
+    if until is None:
+        until = time.time()
+    (condition, parameters) = where(since / 60, until / 60, zone, "minute")
+    rows = {}
+    for (bucket, frames, motion_frames, seconds_sum, seconds_max) in connection.execute(
+            "SELECT strftime(?, minute * 60, 'unixepoch', 'localtime') AS bucket, sum(frames), sum(motion_frames), "
+            "sum(seconds_sum), max(seconds_max) FROM frame_stats WHERE {} GROUP BY bucket".format(condition),
+            [BUCKETS[by][0]] + parameters):
+        rows[bucket] = [frames, seconds_sum / frames if frames > 0 else 0.0, seconds_max,
+                        float(motion_frames) / frames if frames > 0 else 0.0, 0, None]
+
+    (condition, parameters) = where(since, until, zone)
+    for (bucket, count, mean) in connection.execute(
+            "SELECT strftime(?, time, 'unixepoch', 'localtime') AS bucket, count(*), avg(seconds) FROM events "
+            "WHERE kind = 'lights' AND value = 1 AND {} GROUP BY bucket".format(condition),
+            [BUCKETS[by][0]] + parameters):
+        row = rows.setdefault(bucket, [0, 0.0, 0.0, 0.0, 0, None])
+        (row[4], row[5]) = (count, mean)
+    return [tuple([bucket] + row) for (bucket, row) in sorted(rows.items())]
+
+
+def tail(connection, count=20, kind=None, zone=None):
+    """
+    :return: the last count events, oldest first
+    """
+    (condition, parameters) = where(0.0, None, zone)
+    if kind is not None:
+        condition += " AND kind = ?"
+        parameters.append(kind)
+    rows = connection.execute("SELECT time, kind, zone, value, seconds, details FROM events WHERE {} "
+                              "ORDER BY time DESC LIMIT ?".format(condition), parameters + [count]).fetchall()
+    return list(reversed(rows))
+
+
+def parse_date(value):
+    return time.mktime(datetime.datetime.strptime(value, "%Y-%m-%d").timetuple())
+
+
+def optional(value, format):
+    return format.format(value) if value is not None else "-"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-l", "--log", default="events.db", help="the event log")
+    ap.add_argument("-z", "--zone", help="only look at this hue group")
+    ap.add_argument("--since", type=parse_date, default=0.0, help="first day to include, as YYYY-MM-DD")
+    ap.add_argument("--until", type=parse_date, help="first day to leave out, as YYYY-MM-DD")
+    commands = ap.add_subparsers(dest="command")
+    for (name, help) in (("occupancy", "how long the lights were on"), ("latency", "frame and light latencies")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("-b", "--by", choices=sorted(BUCKETS), default="hour", help="size of the buckets")
+    command = commands.add_parser("tail", help="the latest events")
+    command.add_argument("-n", "--count", type=int, default=20, help="number of events to show")
+    command.add_argument("-k", "--kind", help="only show events of this kind")
+    args = vars(ap.parse_args())
+
+    connection = connect(args["log"])
+    if args["command"] == "occupancy":
+        print("{:<16} {:>10} {:>8} {:>6}".format("bucket", "on", "fraction", "times"))
+        for (bucket, seconds, fraction, count) in occupancy(connection, args["by"], args["since"], args["until"],
+                                                            args["zone"]):
+            print("{:<16} {:>9.0f}s {:>7.1f}% {:>6}".format(bucket, seconds, fraction * 100, count))
+    elif args["command"] == "latency":
+        print("{:<16} {:>8} {:>10} {:>10} {:>7} {:>6} {:>10}".format(
+            "bucket", "frames", "mean", "max", "motion", "on", "to light"))
+        for (bucket, frames, mean, maximum, motion, count, to_light) in latency(
+                connection, args["by"], args["since"], args["until"], args["zone"]):
+            print("{:<16} {:>8} {:>8.1f}ms {:>8.1f}ms {:>6.1f}% {:>6} {:>10}".format(
+                bucket, frames, mean * 1000, maximum * 1000, motion * 100, count,
+                optional(to_light * 1000 if to_light is not None else None, "{:.0f}ms")))
+    elif args["command"] == "tail":
+        for (timestamp, kind, zone, value, seconds, details) in tail(connection, args["count"], args["kind"],
+                                                                    args["zone"]):
+            print("{} {:<10} {:<10} {:>6} {:>8} {}".format(
+                datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"), kind, zone or "-",
+                optional(value, "{:g}"), optional(seconds, "{:.3f}s"), details or ""))
+    else:
+        ap.print_help()
+    connection.close()
@@ -0,0 +1,165 @@
+import http.client
+import json
+import select
+
+
+class HueCommandError(Exception):
+    """
+    Raised when the bridge rejects a command or cannot be reached.
+    """
+    pass
+
+
+def check_response(group, payload, response):
+    """
+    Raises if the bridge rejected the command. The bridge answers a rejected command with a list of
+    {"error": ...} objects rather than an http error, and phue returns them instead of raising.
+
+    :param group: name or id of the group the command was for
+    :param payload: the state the command set
+    :param response: the bridge's response, or phue's list of responses
+    :return: the response
+    :raises: HueCommandError if the response contains errors
+    """
+    errors = []
+    pending = [response]
+    while len(pending) > 0:
+        item = pending.pop()
+        if isinstance(item, list):
+            pending.extend(item)
+        elif isinstance(item, dict) and "error" in item:
+            errors.append(item["error"])
+    if len(errors) > 0:
+        raise HueCommandError("bridge rejected {} for group {}: {}".format(
+            payload, group, ", ".join(e.get("description", "") if isinstance(e, dict) else str(e) for e in errors)))
+    return response
+
+
+class KeepAliveTransport:
+    """
+    Sends group commands to the bridge over a single persistent http connection.
+
+    phue opens and closes a new connection for every request, which adds a tcp handshake to every command.
+    """
+
+    def __init__(self, ip, username, timeout=10):
+        """
+
+        :param ip: ip address (optionally with :port) of the hue bridge
+        :param username: the api username we registered with the bridge
+        :param timeout: socket timeout in seconds
+        """
+        self.ip = ip
+        self.username = username
+        self.timeout = timeout
+        self.requests = 0
+        self.connects = 0
+        self._connection = None
+        self._group_ids = {}
+
+    def send(self, group, payload):
+        """
+        Applies the payload to the group's action.
+
+        :param group: name or id of the group
+        :param payload: dict of state to set, ie {"on": True, "bri": 127, "transitiontime": 4}
+        :return: the bridge's response
+        """
+        address = "/api/{}/groups/{}/action".format(self.username, self.group_id(group))
+        return check_response(group, payload, self.request("PUT", address, payload))
+
+    def group_id(self, group):
+        """
+        Resolves a group name to its id on the bridge. Lookups are remembered for the lifetime of the transport.
+
+        :param group: name or id of the group
+        :return: the id of the group
+        """
+        if isinstance(group, int) or str(group).isdigit():
+            return str(group)
+        if group not in self._group_ids:
+            groups = self.request("GET", "/api/{}/groups".format(self.username))
+            for (group_id, attributes) in groups.items():
+                self._group_ids[attributes["name"]] = group_id
+        if group not in self._group_ids:
+            raise HueCommandError("unknown group {}".format(group))
+        return self._group_ids[group]
+
+    def request(self, method, address, data=None):
+        """
+        Issues a request on the persistent connection.
+
+        A request is only sent again if it provably never reached the bridge, ie it failed while being sent, or if
+        it is a read. A command the bridge may already have applied when the connection dropped is not repeated.
+
+        :param method:
+        :param address:
+        :param data: json serializable body
+        :return: the decoded json response
+        """
+        body = json.dumps(data) if data is not None else None
+        for attempt in range(2):
+            connection = self._connect()
+            try:
+                connection.request(method, address, body, {"Connection": "keep-alive"})
+            except (http.client.HTTPException, OSError) as e:
+                # nothing reached the bridge, so it is safe to try again on a fresh connection
+                self.close()
+                if attempt > 0:
+                    raise HueCommandError("{} {} failed: {}".format(method, address, e))
+                continue
+            try:
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if attempt > 0 or method != "GET":
+                    raise HueCommandError("{} {} failed: {}".format(method, address, e))
+                continue
+            self.requests += 1
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            return json.loads(content.decode("utf-8"))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self):
+        if self._connection is not None and self._dropped(self._connection):
+            # the bridge closes idle connections. finding out before sending means a command is never sent on a
+            # connection that is already gone.
+            self.close()
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(self.ip, timeout=self.timeout)
+            self.connects += 1
+        return self._connection
+
+    @staticmethod
+    def _dropped(connection):
+        """
+        :return: True iff the other end closed the idle connection, ie its socket is readable without a request
+        """
+        if connection.sock is None:
+            return False
+        try:
+            (readable, _, _) = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return len(readable) > 0
+
+
+class BridgeTransport:
+    """
+    Sends group commands through a phue compatible bridge object, ie the FakeBridge.
+    """
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+
+    def send(self, group, payload):
+        return check_response(group, payload, self.bridge.set_group(group, payload))
+
+    def close(self):
+        pass
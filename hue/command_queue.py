@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Condition, Thread
+from util.metrics import registry
+
+import time
+
+delivery_seconds = registry.histogram("hue_command_delivery_seconds",
+                                      "time from submitting a hue command to the bridge acknowledging it")
+
+
+class HueCommandQueue:
+    """
+    Delivers hue group commands from a background thread so that callers never block on the bridge.
+
+    Commands for the same group that arrive while a previous delivery is in flight are merged into a single
+    payload, and values the state cache says the group already has are dropped before they are sent.
+    """
+
+    def __init__(self, transport, state_cache=None):
+        """
+
+        :param transport: object with a send(group, payload) method that delivers the payload to the bridge
+        :param state_cache: optional GroupStateCache used to skip redundant writes and updated on submit
+        """
+        self.transport = transport
+        self.state_cache = state_cache
+        self.submitted = 0
+        self.sent = 0
+        self.skipped = 0
+
+        self._pending = OrderedDict()
+        self._condition = Condition()
+        self._closed = False
+        self._thread = Thread(target=self._run, name="hue-command-queue")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, group, state):
+        """
+        Queues a state change for the group.
+
+        :param group: identifier of the group
+        :param state: dict of group action state to set, ie {"on": True, "bri": 127, "transitiontime": 4}
+        :return: a Future that resolves to the bridge's response, or None if there was nothing to send
+        """
+        future = Future()
+        state = self._without_redundant(group, state)
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("command queue is closed")
+            self.submitted += 1
+            if group in self._pending:
+                (payload, futures) = self._pending[group]
+            else:
+                (payload, futures) = ({}, [])
+                self._pending[group] = (payload, futures)
+            payload.update(state)
+            futures.append((time.time(), future))
+            self._condition.notify()
+
+        # assume the write succeeds, so readers see the new state straight away
+        if self.state_cache is not None:
+            self.state_cache.update(group, self._cached_state(state))
+        return future
+
+    def pending(self):
+        """
+        :return: number of groups with commands waiting to be delivered
+        """
+        with self._condition:
+            return len(self._pending)
+
+    def close(self, timeout=None):
+        """
+        Delivers anything still queued and stops the background thread.
+
+        :param timeout: seconds to wait for the queue to drain
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        self.transport.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._pending) == 0 and not self._closed:
+                    self._condition.wait()
+                if len(self._pending) == 0 and self._closed:
+                    return
+                (group, (payload, futures)) = self._pending.popitem(last=False)
+
+            self._deliver(group, payload, futures)
+
+    def _deliver(self, group, payload, futures):
+        if len(self._cached_state(payload)) == 0:
+            # every command for this group turned out to be redundant
+            self.skipped += 1
+            for (submitted_at, future) in futures:
+                future.set_result(None)
+            return
+
+        try:
+            result = self.transport.send(group, payload)
+        except Exception as e:
+            print("failed to send {} to group {}: {}".format(payload, group, e))
+            if self.state_cache is not None:
+                # we updated the cache optimistically, so it can no longer be trusted
+                self.state_cache.invalidate(group)
+            for (submitted_at, future) in futures:
+                future.set_exception(e)
+            return
+
+        self.sent += 1
+        delivered_at = time.time()
+        for (submitted_at, future) in futures:
+            delivery_seconds.observe(delivered_at - submitted_at)
+            future.set_result(result)
+
+    def _without_redundant(self, group, state):
+        if self.state_cache is None:
+            return dict(state)
+        changes = {}
+        for (parameter, value) in self._cached_state(state).items():
+            (found, current) = self.state_cache.get(group, parameter)
+            if not found or current != value:
+                changes[parameter] = value
+        # a transition on its own doesn't change anything
+        if len(changes) > 0 and "transitiontime" in state:
+            changes["transitiontime"] = state["transitiontime"]
+        return changes
+
+    @staticmethod
+    def _cached_state(state):
+        return dict((k, v) for (k, v) in state.items() if k != "transitiontime")
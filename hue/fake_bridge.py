@@ -0,0 +1,117 @@
+import threading
+import time
+
+
+class FakeLight:
+
+    def __init__(self, light_id, name):
+        self.light_id = light_id
+        self.name = name
+
+
+class FakeBridge:
+    """
+    In-process stand-in for phue.Bridge, so that HueWrapper can be exercised without the physical bridge.
+
+    Implements the subset of the phue api that HueWrapper uses and counts how many requests would have gone
+    over the network.
+    """
+
+    def __init__(self, groups=None, latency=0.0):
+        """
+
+        :param groups: dict of group name to list of light names. defaults to a single "Kitchen" group.
+        :param latency: seconds to sleep on every request, to simulate the round-trip to the bridge
+        """
+        if groups is None:
+            groups = {"Kitchen": ["Kitchen 1", "Kitchen 2"]}
+
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        self.lights = []
+        self.groups = {}
+        for (group_id, (name, light_names)) in enumerate(sorted(groups.items()), start=1):
+            light_ids = []
+            for light_name in light_names:
+                light = FakeLight(len(self.lights) + 1, light_name)
+                self.lights.append(light)
+                light_ids.append(str(light.light_id))
+            self.groups[str(group_id)] = {
+                "name": name,
+                "lights": light_ids,
+                "action": {"on": False, "bri": 254},
+            }
+        self.light_states = dict((str(l.light_id), {"on": False, "bri": 254}) for l in self.lights)
+        # group id -> description of the error commands for the group are rejected with
+        self.rejections = {}
+
+    def connect(self):
+        pass
+
+    def get_group(self, group_id=None, parameter=None):
+        self._request()
+        if group_id is None:
+            return dict((k, self._copy(v)) for (k, v) in self.groups.items())
+        group = self._copy(self.groups[self._group_id(group_id)])
+        if parameter is None:
+            return group
+        if parameter in ("name", "lights"):
+            return group[parameter]
+        return group["action"][parameter]
+
+    def reject(self, group_id, description="device is unreachable"):
+        """
+        Makes the bridge reject every command for the group, like the real bridge does when the lights are
+        unreachable: the request succeeds, but the response lists an error instead of applying the change.
+
+        :param group_id: name or id of the group
+        :param description: the error description, None to accept commands again
+        :return:
+        """
+        if description is None:
+            self.rejections.pop(self._group_id(group_id), None)
+        else:
+            self.rejections[self._group_id(group_id)] = description
+
+    def set_group(self, group_id, parameter, value=None, transitiontime=None):
+        self._request()
+        data = dict(parameter) if isinstance(parameter, dict) else {parameter: value}
+        data.pop("transitiontime", None)
+        if self._group_id(group_id) in self.rejections:
+            address = "/groups/{}/action".format(self._group_id(group_id))
+            return [[{"error": {"type": 201, "address": address,
+                                "description": self.rejections[self._group_id(group_id)]}}]]
+        group = self.groups[self._group_id(group_id)]
+        with self._lock:
+            group["action"].update(data)
+            for light_id in group["lights"]:
+                self.light_states[light_id].update(data)
+        return [[{"success": {key: value}} for (key, value) in data.items()]]
+
+    def set_light(self, light_id, parameter, value=None, transitiontime=None):
+        self._request()
+        data = dict(parameter) if isinstance(parameter, dict) else {parameter: value}
+        data.pop("transitiontime", None)
+        with self._lock:
+            self.light_states[str(light_id)].update(data)
+        return [[{"success": {key: value}} for (key, value) in data.items()]]
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _group_id(self, group_id):
+        if str(group_id) in self.groups:
+            return str(group_id)
+        for (gid, group) in self.groups.items():
+            if group["name"] == group_id:
+                return gid
+        raise KeyError("unknown group {}".format(group_id))
+
+    def _copy(self, group):
+        with self._lock:
+            return {"name": group["name"], "lights": list(group["lights"]), "action": dict(group["action"])}
@@ -0,0 +1,290 @@
+"""
+A local http stand-in for the hue bridge, so that phue, the KeepAliveTransport and the HueWrapper can be exercised
+and load tested without the physical bridge.
+
+    server = FakeBridgeServer(latency=0.05, jitter=0.02, rate_limit=10, error_rate=0.01)
+    server.start()
+    hue = HueWrapper(server.address, username=server.username, async_commands=True)
+    ...
+    server.stop()
+"""
+
+from hue.fake_bridge import FakeBridge
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+
+import json
+import random
+import time
+
+
+# error types of the hue api
+UNAUTHORIZED_USER = 1
+BODY_CONTAINS_INVALID_JSON = 2
+RESOURCE_NOT_AVAILABLE = 3
+METHOD_NOT_AVAILABLE = 4
+INTERNAL_ERROR = 901
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TokenBucket:
+    """
+    Allows rate commands per second on average, with bursts of up to burst commands.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = Lock()
+
+    def take(self):
+        """
+        :return: True iff a token was available
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeBridgeServer:
+    """
+    Serves the group and light endpoints of the hue api that phue uses, backed by a FakeBridge.
+
+    Every request can be delayed by a fixed latency plus random jitter. Commands (PUTs) beyond rate_limit per second
+    are rejected like an overloaded bridge rejects them, and a fraction of requests can be made to fail, either with
+    an api error or by dropping the connection without a response.
+    """
+
+    def __init__(self, bridge=None, address="127.0.0.1", port=0, username="fakeuser", latency=0.0, jitter=0.0,
+                 rate_limit=None, burst=None, error_rate=0.0, errors=("api", "disconnect"),
+                 error_methods=("GET", "PUT", "POST"), seed=None):
+        """
+
+        :param bridge: the FakeBridge holding the state of the lights and groups, a new one if None
+        :param address: address to bind to
+        :param port: port to bind to, 0 picks a free port
+        :param username: the api username clients have to use. registering always hands out this one.
+        :param latency: seconds every request takes
+        :param jitter: up to this many seconds are randomly added to or taken off the latency of every request
+        :param rate_limit: commands per second the bridge accepts, None for no limit. the real bridge manages about 10.
+        :param burst: commands the bridge accepts in a burst, defaults to rate_limit
+        :param error_rate: fraction of requests that fail
+        :param errors: the kinds of failure to pick from, "api" for an internal error response and "disconnect"
+                       to close the connection without responding
+        :param error_methods: the http methods error_rate applies to, ie only ("PUT",) to fail commands but not reads
+        :param seed: seed for the random jitter and errors, so runs can be repeated
+        """
+        self.bridge = bridge if bridge is not None else FakeBridge()
+        self.username = username
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limiter = TokenBucket(rate_limit, burst) if rate_limit is not None else None
+        self.error_rate = error_rate
+        self.errors = tuple(errors)
+        self.error_methods = tuple(error_methods)
+
+        self.requests = 0
+        self.commands = 0
+        self.rate_limited = 0
+        self.injected_errors = 0
+
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self._forced_errors = []
+        self._server = _ThreadingHTTPServer((address, port), self._handler())
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        :return: host:port of the server, usable as the bridge ip by phue and the KeepAliveTransport
+        """
+        (host, port) = self._server.server_address[:2]
+        return "{}:{}".format(host, port)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._server.serve_forever, name="fake-hue-bridge")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._thread = None
+
+    def fail_next(self, count=1, kind="api"):
+        """
+        Makes the next count requests fail, regardless of error_rate.
+
+        :param count:
+        :param kind: "api" or "disconnect"
+        :return:
+        """
+        with self._lock:
+            self._forced_errors.extend([kind] * count)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "commands": self.commands,
+                "rate_limited": self.rate_limited,
+                "injected_errors": self.injected_errors,
+            }
+
+    def handle(self, method, path, body):
+        """
+        Simulates the bridge handling a single request.
+
+        :param method:
+        :param path: the request path, ie /api/fakeuser/groups/1/action
+        :param body: the raw request body
+        :return: json serializable response, or None to drop the connection
+        """
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            if len(self._forced_errors) > 0:
+                error = self._forced_errors.pop(0)
+            elif self.error_rate > 0 and method in self.error_methods and self._random.random() < self.error_rate:
+                error = self._random.choice(self.errors)
+            else:
+                error = None
+            if error is not None:
+                self.injected_errors += 1
+        if delay > 0:
+            time.sleep(delay)
+
+        if error == "disconnect":
+            return None
+        if error is not None:
+            return [_error(INTERNAL_ERROR, path, "Internal error, 503")]
+
+        try:
+            data = json.loads(body.decode("utf-8")) if body else None
+        except ValueError:
+            return [_error(BODY_CONTAINS_INVALID_JSON, path, "body contains invalid json")]
+
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if len(parts) == 0 or parts[0] != "api":
+            return [_error(RESOURCE_NOT_AVAILABLE, path, "resource, {}, not available".format(path))]
+        if len(parts) == 1:
+            if method != "POST":
+                return [_error(METHOD_NOT_AVAILABLE, path, "method, {}, not available".format(method))]
+            return [{"success": {"username": self.username}}]
+        if parts[1] != self.username:
+            return [_error(UNAUTHORIZED_USER, path, "unauthorized user")]
+
+        if method == "PUT":
+            if self.rate_limiter is not None and not self.rate_limiter.take():
+                with self._lock:
+                    self.rate_limited += 1
+                return [_error(INTERNAL_ERROR, path, "Internal error, 503")]
+            with self._lock:
+                self.commands += 1
+
+        try:
+            return self._route(method, parts[2:], data, path)
+        except KeyError:
+            return [_error(RESOURCE_NOT_AVAILABLE, path, "resource, {}, not available".format(path))]
+
+    def _route(self, method, parts, data, path):
+        bridge = self.bridge
+        resource = parts[0] if len(parts) > 0 else None
+
+        if method == "GET" and resource is None:
+            return {"lights": self._lights(), "groups": bridge.get_group(), "config": self._config()}
+        if method == "GET" and resource == "config":
+            return self._config()
+
+        if resource == "lights":
+            if method == "GET" and len(parts) == 1:
+                return self._lights()
+            if method == "GET" and len(parts) == 2:
+                return self._lights()[parts[1]]
+            if method == "PUT" and len(parts) == 3 and parts[2] == "state":
+                bridge.set_light(parts[1], data)
+                return _success("/lights/{}/state".format(parts[1]), data)
+
+        if resource == "groups":
+            if method == "GET" and len(parts) == 1:
+                return bridge.get_group()
+            if method == "GET" and len(parts) == 2:
+                return bridge.get_group(parts[1])
+            if method == "PUT" and len(parts) == 3 and parts[2] == "action":
+                bridge.set_group(parts[1], data)
+                return _success("/groups/{}/action".format(parts[1]), data)
+
+        return [_error(METHOD_NOT_AVAILABLE, path, "method, {}, not available for resource".format(method))]
+
+    def _lights(self):
+        with self.bridge._lock:
+            return dict((str(light.light_id), {"name": light.name,
+                                                "state": dict(self.bridge.light_states[str(light.light_id)])})
+                        for light in self.bridge.lights)
+
+    def _config(self):
+        return {"name": "Fake bridge", "ipaddress": self.address, "apiversion": "1.16.0"}
+
+    def _handler(self):
+        server = self
+
+        class FakeBridgeHandler(BaseHTTPRequestHandler):
+            # keep connections open between requests, like the real bridge
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_PUT(self):
+                self._respond("PUT")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_DELETE(self):
+                self._respond("DELETE")
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length > 0 else b""
+                response = server.handle(method, self.path, body)
+                if response is None:
+                    self.close_connection = True
+                    return
+                content = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeBridgeHandler
+
+
+def _error(error_type, address, description):
+    return {"error": {"type": error_type, "address": address, "description": description}}
+
+
+def _success(address, data):
+    return [{"success": {"{}/{}".format(address, key): value}} for (key, value) in sorted((data or {}).items())]
@@ -0,0 +1,100 @@
+import threading
+import time
+
+
+class GroupStateCache:
+    """
+    Remembers the last known state of hue light groups so that we don't have to ask the bridge on every frame.
+
+    Entries are updated whenever we write to the bridge and expire after `ttl` seconds, after which the next read
+    has to go back to the bridge.
+    """
+
+    def __init__(self, ttl=5.0, clock=time.time):
+        """
+
+        :param ttl: number of seconds a cached value stays valid for. None means values never expire.
+        :param clock: function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, group, parameter):
+        """
+        Looks up a cached value for the group.
+
+        :param group: identifier of the group
+        :param parameter: name of the state parameter, ie "on" or "bri"
+        :return: tuple of (found, value). found is False if the value is missing or expired.
+        """
+        with self._lock:
+            entry = self._states.get(group, {}).get(parameter)
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, group, parameter, value):
+        """
+        Stores a single state value for the group.
+
+        :param group:
+        :param parameter:
+        :param value:
+        :return:
+        """
+        self.update(group, {parameter: value})
+
+    def update(self, group, state):
+        """
+        Stores several state values for the group at once.
+
+        :param group:
+        :param state: dict of parameter name to value, ie the "action" object returned by the bridge
+        :return:
+        """
+        now = self.clock()
+        with self._lock:
+            entries = self._states.setdefault(group, {})
+            for (parameter, value) in state.items():
+                entries[parameter] = (value, now)
+
+    def invalidate(self, group=None):
+        """
+        Drops cached values so that the next read goes to the bridge.
+
+        :param group: the group to drop, or None to drop everything
+        :return:
+        """
+        with self._lock:
+            if group is None:
+                self._states.clear()
+            else:
+                self._states.pop(group, None)
+
+    def groups(self):
+        """
+        :return: the groups we currently hold state for.
+        """
+        with self._lock:
+            return list(self._states.keys())
+
+    def stats(self):
+        """
+        :return: dict with the hit and miss counters and the resulting hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / total if total > 0 else 0.0,
+            }
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and self.clock() - stored_at > self.ttl
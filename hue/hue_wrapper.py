@@ -1,21 +1,60 @@
+from concurrent.futures import Future
+from hue.bridge_transport import BridgeTransport, HueCommandError, KeepAliveTransport, check_response
+from hue.command_queue import HueCommandQueue
+from hue.group_state_cache import GroupStateCache
 from phue import Bridge
+from threading import Event, Thread
+from util.metrics import registry
+
+
+def _call_seconds(call):
+    return registry.histogram("hue_call_seconds", "time callers spend in hue wrapper calls", labels={"call": call})
 
 
 class HueWrapper:
 
-    def __init__(self, bridge_ip):
+    def __init__(self, bridge_ip, state_ttl=5.0, bridge=None, async_commands=False, username=None, list_lights=True):
         """
 
-        :param bridge_ip: ip address of the hue bridge
+        :param bridge_ip: ip address (optionally with :port) of the hue bridge, ie a FakeBridgeServer
+        :param state_ttl: number of seconds we trust cached group state before asking the bridge again
+        :param bridge: optional bridge to use instead of connecting to bridge_ip, ie a fake bridge
+        :param async_commands: if True, group commands are queued and delivered from a background thread
+                               over a persistent connection, and the group methods return futures
+        :param username: api username registered with the bridge. phue reads it from its config file if None.
+        :param list_lights: if True, fetch and print every light on the bridge. it takes a round trip per light
+                            on the real bridge, so skip it to start up faster and call print_lights() if needed.
         """
-        self.bridge = Bridge(bridge_ip)
+        self.bridge_ip = bridge_ip
+        self.bridge = bridge if bridge is not None else Bridge(bridge_ip, username=username)
         # first time we run, we have to press the physical button on the bridge device
         self.bridge.connect()
+        self.state_cache = GroupStateCache(ttl=state_ttl)
+
+        self.command_queue = None
+        if async_commands:
+            if isinstance(self.bridge, Bridge):
+                transport = KeepAliveTransport(self.bridge.ip, self.bridge.username)
+            else:
+                transport = BridgeTransport(self.bridge)
+            self.command_queue = HueCommandQueue(transport, self.state_cache)
+
+        self._refresh_stop = Event()
+        self._refresh_thread = None
+
+        registry.gauge("hue_state_cache_hits", "group state reads answered from the cache",
+                       function=lambda: self.state_cache.hits)
+        registry.gauge("hue_state_cache_misses", "group state reads that had to go to the bridge",
+                       function=lambda: self.state_cache.misses)
 
+        if list_lights:
+            self.print_lights()
+
+    def print_lights(self):
         lights = self.bridge.lights
 
         # Print light names
-        print("found the following lights on bridge {}".format(bridge_ip))
+        print("found the following lights on bridge {}".format(self.bridge_ip))
         for l in lights:
             print(l.name)
 
@@ -23,28 +62,127 @@ class HueWrapper:
         """
         Checks whether the specified group is on.
 
+        Answers from the state cache when possible, and only goes to the bridge when the cached value is missing
+        or expired.
+
         :param group:
         :return: True iff the specified group is on.
         """
-        return self.bridge.get_group(group, "on")
+        with _call_seconds("is_group_on").time():
+            (found, on) = self.state_cache.get(group, "on")
+            if found:
+                return on
+            return self.refresh_group(group).get("on")
+
+    def refresh_group(self, group):
+        """
+        Fetches the current state of the group from the bridge and stores it in the state cache.
+
+        :param group:
+        :return: the "action" state of the group as reported by the bridge
+        """
+        with _call_seconds("refresh_group").time():
+            state = self.bridge.get_group(group)["action"]
+        self.state_cache.update(group, state)
+        return state
+
+    def start_state_refresh(self, interval=None):
+        """
+        Starts a background thread that periodically refreshes the state of every group we have seen,
+        so that changes made outside of this process (ie the hue app or a wall switch) are picked up
+        without blocking the caller.
+
+        :param interval: seconds between refreshes. defaults to half of the cache ttl.
+        :return:
+        """
+        if self._refresh_thread is not None:
+            return
+        if interval is None:
+            interval = self.state_cache.ttl / 2.0 if self.state_cache.ttl else 5.0
+
+        self._refresh_stop.clear()
+        self._refresh_thread = Thread(target=self._refresh_loop, args=(interval,), name="hue-state-refresh")
+        self._refresh_thread.daemon = True
+        self._refresh_thread.start()
+
+    def stop_state_refresh(self):
+        """
+        Stops the background refresh thread, if it is running.
+
+        :return:
+        """
+        if self._refresh_thread is None:
+            return
+        self._refresh_stop.set()
+        self._refresh_thread.join()
+        self._refresh_thread = None
+
+    def _refresh_loop(self, interval):
+        while not self._refresh_stop.wait(interval):
+            for group in self.state_cache.groups():
+                try:
+                    self.refresh_group(group)
+                except Exception as e:
+                    # drop what we have so the next read goes to the bridge instead of trusting stale state
+                    print("failed to refresh state of group {}: {}".format(group, e))
+                    self.state_cache.invalidate(group)
+
+    def set_group_state(self, group, on=None, brightness_pct=None, transition=None):
+        """
+        Changes several attributes of the group with a single command.
+
+        :param group:
+        :param on: True to turn the group on, False to turn it off, None to leave it as is
+        :param brightness_pct: brightness as a percentage, None to leave it as is
+        :param transition: seconds the bridge should take to fade to the new state, None for its default
+        :return: a Future that resolves once the command has been delivered, or fails if the bridge rejected it.
+                 in async mode, callers don't have to wait on it.
+        """
+        state = {}
+        if on is not None:
+            state["on"] = on
+        if brightness_pct is not None:
+            state["bri"] = self.brightness_from_pct(brightness_pct)
+        if transition is not None:
+            # the bridge expresses transitions in multiples of 100ms
+            state["transitiontime"] = int(round(transition * 10))
+
+        with _call_seconds("set_group_state").time():
+            if self.command_queue is not None:
+                return self.command_queue.submit(group, state)
+
+            future = Future()
+            try:
+                future.set_result(check_response(group, state, self.bridge.set_group(group, state)))
+            except HueCommandError as e:
+                # the bridge answered but didn't apply the change, so what we cached can no longer be trusted
+                print("failed to send {} to group {}: {}".format(state, group, e))
+                self.state_cache.invalidate(group)
+                future.set_exception(e)
+                return future
+            except Exception:
+                self.state_cache.invalidate(group)
+                raise
+        self.state_cache.update(group, dict((k, v) for (k, v) in state.items() if k != "transitiontime"))
+        return future
 
     def turn_group_off(self, group):
         """
         Turns off the specified group.
 
         :param group:
-        :return:
+        :return: a Future that resolves once the command has been delivered
         """
-        self.bridge.set_group(group, "on", False)
+        return self.set_group_state(group, on=False)
 
     def turn_group_on(self, group):
         """
         Turns on the specified group.
 
         :param group:
-        :return:
+        :return: a Future that resolves once the command has been delivered
         """
-        self.bridge.set_group(group, "on", True)
+        return self.set_group_state(group, on=True)
 
     def set_light_group_brightness(self, group, brightness_pct):
         """
@@ -54,9 +192,9 @@ class HueWrapper:
 
         :param group:
         :param brightness_pct:
-        :return:
+        :return: a Future that resolves once the command has been delivered
         """
-        self.bridge.set_group(group, 'bri', self.brightness_from_pct(brightness_pct))
+        return self.set_group_state(group, brightness_pct=brightness_pct)
 
     def set_light_brightness(self, light, brightness_pct):
         """
@@ -70,6 +208,16 @@ class HueWrapper:
         """
         self.bridge.set_light(light, 'bri', self.brightness_from_pct(brightness_pct))
 
+    def close(self):
+        """
+        Releases background resources held by the wrapper, delivering any queued commands first.
+
+        :return:
+        """
+        self.stop_state_refresh()
+        if self.command_queue is not None:
+            self.command_queue.close()
+
     @staticmethod
     def brightness_from_pct(brightness_pct):
         """
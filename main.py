@@ -17,166 +17,291 @@
 #       otherwise, turn the lights off and don't sleep
 #
 
+# imported first, so that the startup profile starts as close to the start of the process as it can
+from util.startup import StartupProfile
 
+# only what every scan needs is imported here. the optional features (the pipeline, the tracker, the detector pool,
+# motion vectors, clips, the event log, the occupancy model and the duty cycle scheduler) are imported where they
+# are turned on.
 from hue.hue_wrapper import HueWrapper
+from optics.fusion import DetectionFusion
 from optics.human_detector import HumanDetector
 from optics.motion_detector import MotionDetector
 from model.hue_strategy import HueStrategy
 from model.hue_state_change import HueStateChangeEvent
-from picamera.array import PiRGBArray
+from util.metrics import observe_when_done, registry
 from util.storm import *
-from picamera import PiCamera
 from threading import Event
 
 import cv2
-import datetime
-import pytz
+import json
+import math
 import sys
 import time
 
 # handle sigkill signals when we get restarted
 exit_handler = Event()
 
+# cleared the first time waitKey fails, ie on headless opencv builds
+has_windows = True
 
-def get_camera():
+light_seconds = registry.histogram("motion_to_light_seconds",
+                                   "time from seeing motion to the bridge acknowledging the lights are on")
+
+
+def get_camera(framerate=2, capture_format="bgr"):
     """
-    Connects to the camera
+    Creates a session for the camera. The camera itself is opened on first use and stays open between scans.
 
-    :return: a handle to the camera and its capture feed
+    :param framerate: frames per second the sensor captures at, ie the highest rate the scheduler asks for
+    :param capture_format: "bgr", or "yuv" to capture only the luminance plane into a reused buffer
+    :return: a camera session
     """
-    resolution = (640, 480)
-    camera = PiCamera()
-    camera.resolution = resolution
-    camera.framerate = 2
-    camera.contrast = 100
-    camera.brightness = 70
-    camera.iso = 800
-    raw_capture = PiRGBArray(camera, size=resolution)
-    # warmup the sensor array
-    time.sleep(1)
-    return (camera, raw_capture)
+    # picamera is only available on the pi, so we don't want to import it when replaying recorded frames
+    from optics.camera_session import CameraSession
+    # the sensor needs at least one frame a second to keep the exposure short enough
+    return CameraSession(resolution=(640, 480), framerate=max(1, int(math.ceil(framerate))), contrast=100,
+                         brightness=70, iso=800, capture_format=capture_format)
 
 
-def scan(camera, capture, hue, strategy):
+def quit_key_pressed():
+    """
+    :return: True iff q was pressed in an opencv window. headless opencv builds have no windows, so they never quit.
+    """
+    global has_windows
+    if has_windows:
+        try:
+            return cv2.waitKey(1) & 0xFF == ord("q")
+        except cv2.error:
+            has_windows = False
+    return False
+
+
+def log_lights_on(event_log, group, future, submitted_at, motion_seen_at, brightness):
+    """
+    Records the lights coming on once the bridge acknowledged the command, with the time since we saw the motion.
+    """
+    def done(future):
+        if future.exception() is None:
+            event_log.record("lights", group, 1, time.time() - motion_seen_at, timestamp=submitted_at,
+                             brightness=brightness)
+        else:
+            event_log.record("lights_failed", group, 1, timestamp=submitted_at, error=str(future.exception()))
+    future.add_done_callback(done)
+
+
+def scan(frame_source, hue, strategy, human_detector=None, human_threshold=0.2, min_area=300, scheduler=None,
+         recorder=None, fusion=None, event_log=None, occupancy=None, motion_detector=None):
     """
     Scans the video stream for motion and humans.
 
-    :param camera:
-    :param capture:
+    :param frame_source: the FrameSource to read frames from, ie the camera session
     :param hue:
     :param strategy:
+    :param human_detector: the HumanDetector to use, a new one is created if None
+    :param human_threshold: minimum confidence of a human detection, see DetectionFusion
+    :param min_area: minimum area (in pixels) of a region of motion
+    :param scheduler: the DutyCycleScheduler pacing the frames, None to analyse frames as fast as they come
+    :param recorder: optional ClipRecorder to save the frames around light changes with
+    :param fusion: the DetectionFusion combining person boxes with motion, a default one is created if None
+    :param event_log: optional EventLog to record the frames, detections and light changes in
+    :param occupancy: optional OccupancyModel to learn from the light changes and motion
+    :param motion_detector: what to find motion with, ie a CameraMotionVectorDetector. a MotionDetector with
+                            min_area is created if None.
     :return:
     """
-    human_detector = HumanDetector()
-    motion_detector = MotionDetector(min_area=300)
-    human_threshold = 0.2
+    if human_detector is None:
+        human_detector = HumanDetector()
+    if fusion is None:
+        fusion = DetectionFusion()
+    if motion_detector is None:
+        motion_detector = MotionDetector(min_area=min_area)
+    else:
+        motion_detector.reset()
 
     print("scanning video stream...")
-    stream = camera.capture_continuous(capture, format="bgr", use_video_port=True)
-
-    # discard the first few frames
-    for i in range(10):
-        next(stream)
-        capture.truncate(0)
-
-    previous_frame = next(stream).array
-    capture.truncate(0)
+    # the camera session discards the badly exposed frames after waking up
+    stream = frame_source.frames()
+    # the motion detector remembers the previous frame, so every frame is only preprocessed once
+    first_frame = next(stream, None)
+    if first_frame is not None:
+        motion_detector.update(first_frame)
 
     for frame in stream:
-        frame = frame.array
-
+        started = time.time()
         # first check for motion
-        motion_rects = list(motion_detector.detect(previous_frame, frame))
+        motion_rects = list(motion_detector.update(frame))
+        frame_source.frame_analysed()
+        if recorder is not None:
+            recorder.add(frame)
+        done = False
         if len(motion_rects) > 0:
+            motion_seen_at = time.time()
             print("found motion {}".format(motion_rects))
 
             # the lights are already on and we found motion. leave them on and go back to sleep.
             # its too slow to rely on the person detector here
             if hue.is_group_on(strategy.hue_group):
-                break
-
-            # if we found motion, continue by checking for humans
-            (human_rects, human_weights) = human_detector.detect(frame)
-            # filter on a small threshold to avoid false positives
-            filtered_weights = filter(lambda w: w > human_threshold, human_weights)
-            # TODO we should also check that the rects are overlapping
-            if len(list(filtered_weights)) > 0:
-                print \
-                    ("found humans above threshold {}, turning on {} lights".format(human_threshold, strategy.hue_group))
-                hue.set_light_group_brightness(strategy.hue_group, strategy.brightness())
-                hue.turn_group_on(strategy.hue_group)
-                break
-            # just print that we are likely avoiding a false positive
-            elif len(human_rects) > 0:
-                print("found humans below threshold {} (likely false positive)".format(human_threshold))
+                if occupancy is not None:
+                    occupancy.motion(strategy.hue_group, motion_seen_at)
+                done = True
+            else:
+                # if we found motion, continue by checking for humans, but only where we found the motion.
+                # grayscale sources only produce colour now that the person detector needs it
+                detect_started = time.time()
+                (human_rects, human_weights) = human_detector.detect_regions(frame_source.color(frame), motion_rects)
+                # the searched regions include a margin around the motion, so weigh every person by how much of
+                # them actually moved. a small threshold on that avoids false positives.
+                fused = fusion.fuse(human_rects, human_weights, motion_rects)
+                if event_log is not None and len(fused.boxes) > 0:
+                    event_log.record("detection", strategy.hue_group, fused.score, time.time() - detect_started,
+                                     boxes=fused.boxes.tolist(), motion=motion_rects)
+                if fused.score > human_threshold:
+                    print("found humans above threshold {}, turning on {} lights".format(
+                        human_threshold, strategy.hue_group))
+                    # a single queued command, so the loop doesn't wait on the bridge
+                    brightness = strategy.brightness()
+                    submitted_at = time.time()
+                    future = hue.set_group_state(strategy.hue_group, on=True, brightness_pct=brightness)
+                    observe_when_done(light_seconds, future, motion_seen_at)
+                    if event_log is not None:
+                        log_lights_on(event_log, strategy.hue_group, future, submitted_at, motion_seen_at, brightness)
+                    if occupancy is not None:
+                        occupancy.lights_on(strategy.hue_group, motion_seen_at)
+                    if recorder is not None:
+                        recorder.event("on", group=strategy.hue_group, motion=motion_rects,
+                                       humans=[list(map(int, rect)) for rect in fused.boxes],
+                                       weights=[float(w) for w in fused.weights], confidence=fused.score)
+                    done = True
+                # just print that we are likely avoiding a false positive
+                elif len(fused.boxes) > 0:
+                    print("found humans with confidence {:.2f} below threshold {} (likely false positive)".format(
+                        fused.score, human_threshold))
 
         elif hue.is_group_on(strategy.hue_group):
             print("turning off {} lights".format(strategy.hue_group))
             hue.turn_group_off(strategy.hue_group)
-
-        previous_frame = frame
-        # we need to truncate the buffer before the next iteration
-        capture.truncate(0)
-
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord("q"):
+            if event_log is not None:
+                event_log.record("lights", strategy.hue_group, 0)
+            if occupancy is not None:
+                occupancy.lights_off(strategy.hue_group)
+            if recorder is not None:
+                recorder.event("off", group=strategy.hue_group)
+
+        # the cost includes the person detector, by far the most expensive part, so the cpu budget covers it
+        cost = time.time() - started
+        if scheduler is not None:
+            scheduler.record(cost, motion=len(motion_rects) > 0)
+        if event_log is not None:
+            event_log.frame(strategy.hue_group, cost, motion=len(motion_rects) > 0)
+        if done:
+            break
+
+        if quit_key_pressed():
             sys.exit(1)
 
+        # analyse the next frame sooner after motion, and later while the room is quiet
+        if scheduler is not None and scheduler.wait(scheduler.mode(), started, exit_handler):
+            break
+
     return HueStateChangeEvent(strategy.sleep_when_on)
 
 
-def get_brightness():
+def watch(frame_source, scheduler, sleep_time, min_area=300, vacancy_timeout=None, recorder=None, event_log=None,
+          zone=None, occupancy=None, motion_detector=None):
     """
-    TODO this should lookup sunrise and sunset time
-    TODO this should return a tuple and be combined with get_brightness()
-    :return: the brightness we should set the lights to based on time of day.
+    Keeps a slow, motion only watch on the room while the lights are on, instead of sleeping blind.
+
+    Every motion pushes the end of the watch back to sleep_time after it, so the lights stay on while someone is
+    around. If vacancy_timeout is set and the room has been still for that long, the watch ends early so that the
+    next scan can turn the lights off.
+
+    :param frame_source: the FrameSource to read frames from, ie the camera session
+    :param scheduler: the DutyCycleScheduler pacing the frames
+    :param sleep_time: seconds to keep the lights on after the last motion
+    :param min_area: minimum area (in pixels) of a region of motion
+    :param vacancy_timeout: seconds without motion after which we stop watching early, None to watch for sleep_time
+    :param recorder: optional ClipRecorder to keep the watched frames in
+    :param event_log: optional EventLog to record the frames in
+    :param zone: the hue group we are watching, for the event log and the occupancy model
+    :param occupancy: optional OccupancyModel to learn from the motion
+    :param motion_detector: what to find motion with, a MotionDetector with min_area is created if None
+    :return: True iff we saw motion during the watch
     """
-    hour = datetime.datetime.now(pytz.timezone('US/Pacific')).hour
+    from pipeline.duty_cycle import WATCH
 
-    sunrise = getSunrise()
-    sunset = getSunset()
+    if motion_detector is None:
+        motion_detector = MotionDetector(min_area=min_area)
+    else:
+        motion_detector.reset()
+    now = time.time()
+    deadline = now + sleep_time
+    last_motion = now
+    seen = False
+    print("watching for motion for {}s".format(sleep_time))
+
+    for frame in frame_source.frames():
+        started = time.time()
+        motion_rects = list(motion_detector.update(frame))
+        scheduler.record(time.time() - started, motion=len(motion_rects) > 0)
+        if event_log is not None:
+            event_log.frame(zone, time.time() - started, motion=len(motion_rects) > 0)
+        if recorder is not None:
+            recorder.add(frame)
+        if len(motion_rects) > 0:
+            last_motion = time.time()
+            if occupancy is not None:
+                occupancy.motion(zone, last_motion)
+            if last_motion + sleep_time > deadline:
+                deadline = last_motion + sleep_time
+            if not seen:
+                print("found motion while the lights are on, extending the timer")
+            seen = True
+
+        now = time.time()
+        if now >= deadline:
+            break
+        if vacancy_timeout is not None and now - last_motion >= vacancy_timeout:
+            print("no motion for {}s, cutting the timer short".format(vacancy_timeout))
+            if event_log is not None:
+                event_log.record("vacancy", zone, seconds=now - last_motion)
+            break
+        if scheduler.wait(WATCH, started, exit_handler):
+            break
+
+    return seen
 
 
-    # late night
-    if hour <= 3:
-        return 20
-    # late night
-    elif hour <= 5:
-        return 20
-    # early morning
-    elif hour <= sunrise[0]:
-        return 100
-    # during work
-    elif hour <= sunset[0]:
-        return 50
-    else:
-        return 100
+def get_brightness():
+    """
+    :return: the brightness we should set the lights to based on time of day, including sunrise and sunset.
+    """
+    return schedule.brightness()
 
 
 def get_sleep_time():
     """
-    TODO this should lookup sunrise and sunset time
-    TODO this should return a tuple and be combined with get_brightness()
     :return: the amount of time (in seconds) that we should sleep for after turning the lights on.
     """
-    hour = datetime.datetime.now(pytz.timezone('US/Pacific')).hour
-    # late night
-    if hour <= 1:
-        return 360
-    # sleep time
-    elif hour <= 8:
-        return 120
-    # early morning
-    elif hour <= 10:
-        return 180
-    # during work
-    elif hour <= 17:
-        return 300
-    # evening
-    elif hour <= 22:
-        return 900
-    else:
-        return 360
+    return schedule.sleep_time()
+
+
+def load_detector_config(path=None):
+    """
+    :param path: JSON file with detector parameters, ie one written by tune.py. None for the defaults.
+    :return: dict with the HumanDetector parameters under "human", the MotionDetector parameters under "motion"
+             and the minimum weight of a human detection under "threshold"
+    """
+    config = {"human": {}, "motion": {"min_area": 300}, "threshold": 0.2}
+    if path is not None:
+        with open(path) as f:
+            loaded = json.load(f)
+        for (key, value) in loaded.items():
+            if isinstance(config.get(key), dict):
+                config[key].update(value)
+            elif key in config:
+                config[key] = value
+    return config
 
 
 def quit(signo, _frame):
@@ -184,44 +309,211 @@ def quit(signo, _frame):
     exit_handler.set()
 
 
-def main():
+def main(pipelined=False, workers=0, metrics_port=None, metrics_file=None, metrics_interval=300,
+         bridge_ip="10.0.1.35", username=None, detector_config=None, scheduler=None, vacancy_timeout=None,
+         luminance=False, recorder=None, track_every=0, event_log=None, occupancy=None, motion_vectors=False):
     """
     Main script loop.
 
     Creates a hue wrapper and monitors the video stream.
+    :param pipelined: if True, scan with a DetectionPipeline instead of scan(), so that capture, detection and
+                      the hue calls run concurrently
+    :param workers: number of processes to run the person detector on, 0 to run it in this process
+    :param metrics_port: if set, serve prometheus metrics on this port
+    :param metrics_file: if set, periodically write prometheus metrics to this file
+    :param metrics_interval: seconds between metrics summaries
+    :param bridge_ip: address of the hue bridge, ie a FakeBridgeServer's address to run without the real bridge
+    :param username: api username registered with the bridge, phue's config file is used if None
+    :param detector_config: JSON file with tuned detector parameters, see load_detector_config()
+    :param scheduler: the DutyCycleScheduler pacing the frames, a default one is created if None
+    :param vacancy_timeout: seconds without motion after which the lights go off early, see watch()
+    :param luminance: capture only the Y plane of yuv frames, and convert to bgr only for the person detector.
+                      the pipeline holds on to frames across threads, so this only works without it.
+    :param recorder: optional ClipRecorder to save the frames around light changes with
+    :param track_every: follow the people we found with a tracker, and only run the person detector again after
+                        this many tracked frames. 0 runs the detector on every frame with motion.
+    :param event_log: optional EventLog to record the frames, detections and light changes in
+    :param occupancy: optional OccupancyModel predicting how long to keep the lights on and learning from every
+                      visit, the schedule's sleep time is used if None
+    :param motion_vectors: find motion in the motion vectors of the h264 encoder, recording next to the frame
+                           capture, instead of diffing the frames on the cpu
     :return:
     """
-    hue = HueWrapper("10.0.1.35")
+    if luminance and pipelined:
+        raise ValueError("luminance capture reuses a single frame buffer and can't be used with the pipeline")
+    if scheduler is None:
+        from pipeline.duty_cycle import DutyCycleScheduler
+        scheduler = DutyCycleScheduler()
+    if metrics_port is not None:
+        registry.start_http_server(metrics_port)
+    registry.start_reporter(metrics_interval, metrics_file)
+
+    profile = StartupProfile()
+    profile.add("imports", profile.started, time.time())
+    config = load_detector_config(detector_config)
+
+    def connect():
+        # listing every light takes a round trip per light, and we don't need them to get going
+        hue = HueWrapper(bridge_ip, async_commands=True, username=username, list_lights=False)
+        # keep the cached group state fresh in the background so scan() never waits on the bridge
+        hue.start_state_refresh()
+        return hue
+
+    def warm_up():
+        # the camera stays open for the lifetime of the process so that it keeps its calibration
+        session = get_camera(scheduler.max_rate(), "yuv" if luminance else "bgr")
+        session.open()
+        return session
+
+    def load_detector():
+        if workers > 0:
+            # only imported when used, it starts the worker processes
+            from optics.parallel_human_detector import ParallelHumanDetector
+            return ParallelHumanDetector(workers=workers, **config["human"])
+        return HumanDetector(**config["human"])
+
+    # none of these depend on each other, and the camera spends most of its time sleeping while the sensor settles
+    started = profile.run_concurrently({
+        "bridge": connect,
+        "camera": warm_up,
+        "detector": load_detector,
+        "schedule": lambda: schedule.for_time(),
+    }, cleanup={
+        # don't leave the refresh thread, the camera or the worker processes behind if another phase failed
+        "bridge": lambda hue: hue.close(),
+        "camera": lambda session: session.close(),
+        "detector": lambda detector: detector.close() if workers > 0 else None,
+    })
+    (hue, session, human_detector) = (started["bridge"], started["camera"], started["detector"])
 
     # create a strategy
-    strategy = HueStrategy("Kitchen", lambda: get_brightness(), lambda: get_sleep_time())
-
-    (camera, capture, result) = None, None, None
+    if occupancy is not None:
+        strategy = HueStrategy("Kitchen", lambda: get_brightness(), lambda: occupancy.predict("Kitchen"))
+    else:
+        strategy = HueStrategy("Kitchen", lambda: get_brightness(), lambda: get_sleep_time())
+
+    # scan() and watch() diff the frames unless we give them a detector
+    (motion_detector, vector_source) = (None, None)
+    if motion_vectors:
+        from optics.motion_vectors import CameraMotionVectorDetector, CameraMotionVectorSource, MotionVectorDetector
+        # keep about a second of vectors, so the motion in the frames the scheduler skips isn't lost
+        vector_source = CameraMotionVectorSource(session, max_queued=session.framerate)
+        motion_detector = CameraMotionVectorDetector(vector_source, MotionVectorDetector(
+            min_area=config["motion"]["min_area"], resolution=session.resolution))
+
+    person_detector = human_detector
+    if track_every > 0:
+        from optics.person_tracker import TrackingHumanDetector
+        person_detector = TrackingHumanDetector(human_detector, verify_every=track_every)
+    pipeline = None
+    if pipelined:
+        from pipeline.detection_pipeline import DetectionPipeline
+        if motion_detector is None:
+            motion_detector = MotionDetector(**config["motion"])
+        pipeline = DetectionPipeline(session, hue, strategy, motion_detector, person_detector,
+                                     human_threshold=config["threshold"])
+    print(profile.report())
 
     while not exit_handler.is_set():
-        # create a camera
-        (camera, capture) = get_camera()
         # scan the video stream
-        result = scan(camera, capture, hue, strategy)
-        camera.close()
-        capture.close()
-        print("sleeping for {}s".format(result.sleep_time()))
-        exit_handler.wait(result.sleep_time())
+        if pipeline is not None:
+            result = pipeline.run()
+            print("pipeline stats {}".format(pipeline.stats()))
+        else:
+            result = scan(session, hue, strategy, person_detector, config["threshold"], config["motion"]["min_area"],
+                          scheduler, recorder, event_log=event_log, occupancy=occupancy,
+                          motion_detector=motion_detector)
+        if not exit_handler.is_set() and hue.is_group_on(strategy.hue_group):
+            # keep watching at a low rate, the next scan turns the lights off once the room is empty
+            watch(session, scheduler, result.sleep_time(), config["motion"]["min_area"], vacancy_timeout, recorder,
+                  event_log, strategy.hue_group, occupancy, motion_detector)
+        # stop capturing between scans, but keep the camera open
+        if vector_source is not None:
+            vector_source.pause()
+        session.pause()
 
     print("received exit signal, closing resources")
-    if camera is not None:
-        camera.close()
-
-    if capture is not None:
-        capture.close()
+    registry.stop()
+    print("metrics summary:\n{}".format(registry.summary()))
+    hue.close()
+    if vector_source is not None:
+        vector_source.close()
+    session.close()
+    if recorder is not None:
+        recorder.close()
+    if event_log is not None:
+        event_log.close()
+    if occupancy is not None:
+        occupancy.flush()
+    if workers > 0:
+        human_detector.close()
 
 
 if __name__ == "__main__":
 
     # set up interrupt handler
+    import argparse
     import signal
 
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-p", "--pipeline", action="store_true",
+                    help="run capture, detection and the hue calls as a pipeline of threads")
+    ap.add_argument("-w", "--workers", type=int, default=0,
+                    help="number of processes to run the person detector on, 0 to run it in the main process")
+    ap.add_argument("-y", "--yuv", action="store_true",
+                    help="capture the luminance plane only and convert to bgr when the person detector needs it")
+    ap.add_argument("-m", "--motion-vectors", action="store_true",
+                    help="find motion in the h264 encoder's motion vectors instead of diffing the frames")
+    ap.add_argument("-t", "--track-every", type=int, default=0,
+                    help="track the people found and only run the person detector again after this many frames")
+    ap.add_argument("-b", "--bridge", default="10.0.1.35", help="address of the hue bridge")
+    ap.add_argument("-u", "--username", help="api username registered with the bridge")
+    ap.add_argument("-d", "--detector-config", help="JSON file with tuned detector parameters, ie from tune.py")
+    ap.add_argument("--idle-rate", type=float, default=1.0, help="frames per second analysed while the room is idle")
+    ap.add_argument("--active-rate", type=float, default=4.0, help="frames per second analysed after motion")
+    ap.add_argument("--watch-rate", type=float, default=0.5,
+                    help="frames per second of the motion watch while the lights are on")
+    ap.add_argument("--cpu-budget", type=float, default=0.5, help="fraction of a core we may spend analysing frames")
+    ap.add_argument("--vacancy-timeout", type=float,
+                    help="turn the lights off after this many seconds without motion, instead of the full sleep time")
+    ap.add_argument("--clips", help="directory to save the frames around every light change in")
+    ap.add_argument("--clip-seconds", type=float, default=10,
+                    help="seconds of frames to save from before and after a light change")
+    ap.add_argument("--clip-memory", type=int, default=16, help="megabytes of frames to keep in memory for clips")
+    ap.add_argument("--clip-disk", type=int, default=512, help="megabytes of clips to keep, the oldest are deleted")
+    ap.add_argument("--event-log", help="sqlite database to record detections, light changes and timings in")
+    ap.add_argument("--occupancy-model",
+                    help="JSON file to learn how long to keep the lights on in, instead of the time of day schedule")
+    ap.add_argument("--metrics-port", type=int, help="serve prometheus metrics on this port")
+    ap.add_argument("--metrics-file", help="periodically write prometheus metrics to this file")
+    ap.add_argument("--metrics-interval", type=int, default=300, help="seconds between metrics summaries")
+    args = vars(ap.parse_args())
+
     for sig in ('TERM', 'HUP', 'INT'):
         signal.signal(getattr(signal, 'SIG' + sig), quit)
 
-    main()
+    recorder = None
+    if args["clips"] is not None:
+        from optics.clip_recorder import ClipRecorder
+        recorder = ClipRecorder(args["clips"], pre_seconds=args["clip_seconds"], post_seconds=args["clip_seconds"],
+                                max_memory=args["clip_memory"] * 1024 * 1024, max_disk=args["clip_disk"] * 1024 * 1024)
+
+    event_log = None
+    if args["event_log"] is not None:
+        from util.event_log import EventLog
+        event_log = EventLog(args["event_log"])
+
+    occupancy = None
+    if args["occupancy_model"] is not None:
+        from model.occupancy_model import OccupancyModel, schedule_fallback
+        occupancy = OccupancyModel(schedule_fallback(schedule), path=args["occupancy_model"])
+
+    from pipeline.duty_cycle import DutyCycleScheduler
+    main(pipelined=args["pipeline"], workers=args["workers"], metrics_port=args["metrics_port"],
+         metrics_file=args["metrics_file"], metrics_interval=args["metrics_interval"], bridge_ip=args["bridge"],
+         username=args["username"], detector_config=args["detector_config"],
+         scheduler=DutyCycleScheduler(idle_rate=args["idle_rate"], active_rate=args["active_rate"],
+                                      watch_rate=args["watch_rate"], cpu_budget=args["cpu_budget"]),
+         vacancy_timeout=args["vacancy_timeout"], luminance=args["yuv"],
+         recorder=recorder, track_every=args["track_every"], motion_vectors=args["motion_vectors"],
+         event_log=event_log, occupancy=occupancy)
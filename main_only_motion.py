@@ -25,41 +25,28 @@ from optics.human_detector import HumanDetector
 from optics.motion_detector import MotionDetector
 from model.hue_strategy import HueStrategy
 from model.hue_state_change import HueStateChangeEvent
-from picamera.array import PiRGBArray
-from picamera import PiCamera
+from optics.camera_session import CameraSession
 
 import cv2
 import sys
 import time
 
 def get_camera():
-    resolution= (640, 480)
-    camera = PiCamera()
-    camera.resolution = resolution
-    camera.framerate = 2
-    raw_capture = PiRGBArray(camera, size=resolution)
-    time.sleep(0.1)
-    return (camera, raw_capture)
+    return CameraSession(resolution=(640, 480), framerate=2, warmup=0.1, discard_frames=0, resume_discard_frames=0)
 
 
-def scan(camera, capture, hue, strategy):
+def scan(session, hue, strategy):
     motion_detector = MotionDetector(min_area=500)
 
-    initial_frame = None
-    for frame in camera.capture_continuous(capture, format="bgr", use_video_port=True):
-        # make sure we initialize the first frame TODO look for a nicer to consume the first frame
-        if initial_frame is None:
-            initial_frame = frame.array
-            capture.truncate(0)
-            continue
-
+    stream = session.frames()
+    motion_detector.update(next(stream))
+    for frame in stream:
         light_status = hue.is_group_on(strategy.hue_group)
-        frame = frame.array
-        motion_rects = motion_detector.detect(initial_frame, frame)
+        motion_rects = motion_detector.update(frame)
+        session.frame_analysed()
         if len(list(motion_rects)) > 0 and not light_status:
             print("found motion, turning on lights")
-            hue.set_light_group_brightness(strategy.hue_group, strategy.brightness())
-            hue.turn_group_on(strategy.hue_group)
+            hue.set_group_state(strategy.hue_group, on=True, brightness_pct=strategy.brightness())
             # since we turned the lights on, we want to sleep and stop watching
             break
             
@@ -67,10 +54,6 @@ def scan(camera, capture, hue, strategy):
             print("turning off {} lights".format(strategy.hue_group))
             hue.turn_group_off(strategy.hue_group)
 
-        initial_frame = frame
-        # we need to truncate the buffer before the next iteration
-        capture.truncate(0)
-
         key = cv2.waitKey(1) & 0xFF
         if key == ord("q"):
             sys.exit(1)
@@ -79,7 +62,8 @@ def scan(camera, capture, hue, strategy):
 
 
 def main():
-    hue = HueWrapper("10.0.1.35")
+    hue = HueWrapper("10.0.1.35", async_commands=True)
+    hue.start_state_refresh()
 
     # hue.set_light_group_brightness("Kitchen", 0)
     # hue.turn_group_on("Kitchen")
@@ -88,16 +72,15 @@ def main():
     # create a strategy
     strategy = HueStrategy("Kitchen", lambda: 40, lambda: 10)
 
-    while True:
-        # create a camera
-        (camera, capture) = get_camera()
+    # create a camera, it stays open between scans
+    session = get_camera()
 
+    while True:
         # call the other method scan
-        result = scan(camera, capture, hue, strategy)
+        result = scan(session, hue, strategy)
 
-        # close the camera and sleep
-        camera.close()
-        capture.close()
+        # stop capturing and sleep
+        session.pause()
         print("sleeping for {}s".format(result.sleep_time()))
         time.sleep(result.sleep_time())
 
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+"""
+Watches several rooms from one process. Every zone maps a camera (or a recording) to a hue group, and all zones share
+one bridge connection and one pool of person detectors.
+
+    {
+        "bridge": "10.0.1.35",
+        "detectors": 2,
+        "workers": 0,
+        "zones": [
+            {"name": "kitchen", "group": "Kitchen", "camera": {"resolution": [640, 480], "framerate": 2}},
+            {"name": "hallway", "group": "Hallway", "device": 0, "min_area": 500}
+        ]
+    }
+
+A zone reads from the pi camera ("camera", at most one zone), a usb camera ("device"), a recorded video ("video"),
+a directory of frames ("images") or generated frames ("synthetic"). Zones can set their own "min_area" and "threshold",
+and a fixed "brightness" (percentage) and "sleep" (seconds) instead of following the time of day schedule.
+With "track_every", the zones follow the people they found and only use the shared detectors every that many frames.
+With "workers", the zones share a single detector that spreads every frame over that many processes instead of the
+"detectors" pool.
+"""
+
+from hue.hue_wrapper import HueWrapper
+from model.hue_strategy import HueStrategy
+from optics.frame_source import ImageDirectoryFrameSource, SyntheticFrameSource, VideoFileFrameSource
+from optics.human_detector import HumanDetector
+from optics.parallel_human_detector import ParallelHumanDetector
+from pipeline.zone_controller import Zone, ZoneController
+from util.metrics import registry
+from util.storm import *
+
+import argparse
+import json
+import main
+import signal
+
+
+def get_frame_source(config):
+    """
+    :param config: the zone's configuration
+    :return: the FrameSource the zone reads from
+    """
+    if "camera" in config:
+        # picamera is only available on the pi
+        from optics.camera_session import CameraSession
+        camera = config["camera"]
+        return CameraSession(resolution=tuple(camera.get("resolution", (640, 480))),
+                             framerate=camera.get("framerate", 2), contrast=camera.get("contrast", 100),
+                             brightness=camera.get("brightness", 70), iso=camera.get("iso", 800))
+    if "device" in config:
+        return VideoFileFrameSource(int(config["device"]))
+    if "video" in config:
+        return VideoFileFrameSource(config["video"], max_frames=config.get("max_frames"))
+    if "images" in config:
+        return ImageDirectoryFrameSource(config["images"], max_frames=config.get("max_frames"))
+    if "synthetic" in config:
+        return SyntheticFrameSource(max_frames=config.get("max_frames", 300))
+    raise ValueError("zone {} has no frame source".format(config.get("name")))
+
+
+def get_zone(config, detector_config):
+    brightness = config.get("brightness")
+    sleep_time = config.get("sleep")
+    strategy = HueStrategy(config["group"],
+                           (lambda: brightness) if brightness is not None else (lambda: schedule.brightness()),
+                           (lambda: sleep_time) if sleep_time is not None else (lambda: schedule.sleep_time()))
+    return Zone(config.get("name", config["group"]), get_frame_source(config), strategy,
+                min_area=config.get("min_area", detector_config["motion"]["min_area"]),
+                human_threshold=config.get("threshold", detector_config["threshold"]))
+
+
+def run(config, hue=None, detector_config=None):
+    """
+    :param config: the zones configuration, see above
+    :param hue: the HueWrapper to use, one connecting to config["bridge"] is created if None
+    :param detector_config: JSON file with tuned detector parameters, see main.load_detector_config()
+    :return:
+    """
+    detector_config = main.load_detector_config(detector_config)
+    if hue is None:
+        hue = HueWrapper(config.get("bridge", "10.0.1.35"), async_commands=True, username=config.get("username"))
+    hue.start_state_refresh()
+
+    workers = config.get("workers", 0)
+    if workers > 0:
+        # a single detector spreading every frame over the worker processes
+        detectors = [ParallelHumanDetector(workers=workers, **detector_config["human"])]
+    else:
+        detectors = [HumanDetector(**detector_config["human"]) for i in range(config.get("detectors", 1))]
+
+    controller = ZoneController([get_zone(zone, detector_config) for zone in config["zones"]], hue, detectors,
+                                track_every=config.get("track_every", 0))
+
+    def quit(signo, _frame):
+        print("Interrupted by %d, shutting down" % signo)
+        controller.stop()
+
+    for sig in ('TERM', 'HUP', 'INT'):
+        signal.signal(getattr(signal, 'SIG' + sig), quit)
+
+    controller.run()
+    print("zone stats {}".format(controller.stats()))
+    print("metrics summary:\n{}".format(registry.summary()))
+    controller.close()
+    hue.close()
+    for detector in detectors:
+        if isinstance(detector, ParallelHumanDetector):
+            detector.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-z", "--zones", required=True, help="JSON file describing the zones")
+    ap.add_argument("-d", "--detector-config", help="JSON file with tuned detector parameters, ie from tune.py")
+    ap.add_argument("--fake-bridge", action="store_true", help="run against an in-process fake bridge")
+    args = vars(ap.parse_args())
+
+    with open(args["zones"]) as f:
+        zones_config = json.load(f)
+
+    hue = None
+    if args["fake_bridge"]:
+        from hue.fake_bridge import FakeBridge
+        groups = dict((zone["group"], [zone["group"] + " 1"]) for zone in zones_config["zones"])
+        hue = HueWrapper("fake", bridge=FakeBridge(groups), async_commands=True)
+
+    run(zones_config, hue, args["detector_config"])
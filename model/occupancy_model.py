@@ -0,0 +1,220 @@
+from util.storm import TIMEZONE
+
+import datetime
+import json
+import math
+import os
+import time
+
+
+def schedule_fallback(schedule):
+    """
+    :param schedule: the DailySchedule to fall back on
+    :return: function of a timestamp returning the schedule's sleep time at that time
+    """
+    return lambda timestamp: schedule.sleep_time(datetime.datetime.fromtimestamp(timestamp, schedule.timezone))
+
+
+def slots(timestamp, timezone=None):
+    """
+    :param timestamp: seconds since the epoch
+    :param timezone: the pytz timezone to take the hour and day in, defaults to the schedule's so the slots line up
+                     with the fallback rather than with the machine's local time
+    :return: the slots a timestamp falls in, from the most to the least specific: the hour on weekdays or weekends,
+             the hour of any day, and the whole day
+    """
+    if timezone is None:
+        import pytz
+        timezone = pytz.timezone(TIMEZONE)
+    when = datetime.datetime.fromtimestamp(timestamp, timezone)
+    day = "weekend" if when.weekday() >= 5 else "weekday"
+    return ["{}-{:02d}".format(day, when.hour), "{:02d}".format(when.hour), "all"]
+
+
+class Visit:
+    """
+    The lights of a zone coming on until they go off, and the longest we went without seeing motion in between.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.last_motion = started
+        self.longest_gap = 0.0
+        self.ended = None
+        self.rejoined = 0
+
+    def motion(self, when):
+        self.longest_gap = max(self.longest_gap, when - self.last_motion)
+        self.last_motion = when
+
+
+class OccupancyModel:
+    """
+    Learns how long the lights should stay on after the last motion, per zone and time slot, from what happened
+    while they were on.
+
+    While someone is in a zone they move every now and then, and the longest they went without moving during a
+    visit is what the timer has to cover. Every visit adds that gap to a histogram of its zone and slot, in log
+    spaced bins between min_seconds and max_seconds. Older visits decay, so the model follows changing habits, and
+    the sleep time is a high quantile of the histogram times a margin. If the lights come back on soon after going
+    off, the visit was cut short: it continues, and the gap spans the time the lights were off.
+
+    Slots without enough visits back off to the hour of any day, then to the whole day of the zone, and then to
+    the fallback, ie the time of day schedule.
+    """
+
+    def __init__(self, fallback, path=None, quantile=0.85, margin=1.0, min_seconds=60.0, max_seconds=1800.0,
+                 bins=24, decay=0.99, min_visits=5.0, rejoin=300.0, clock=time.time):
+        """
+
+        :param fallback: function of a timestamp returning the sleep time to use while we know too little
+        :param path: JSON file to load the model from if it exists, and to save it to after every visit
+        :param quantile: fraction of the visits the sleep time should cover
+        :param margin: factor to stretch the quantile by, since a gap longer than the sleep time turns the lights off
+                       on someone
+        :param min_seconds: shortest sleep time to predict
+        :param max_seconds: longest sleep time to predict
+        :param bins: number of histogram bins between min_seconds and max_seconds
+        :param decay: weight every visit keeps for each newer visit in the same slot
+        :param min_visits: decayed number of visits a slot needs before we predict from it
+        :param rejoin: seconds after the lights went off in which coming back on continues the visit
+        :param clock: function returning the current time in seconds
+        """
+        self.fallback = fallback
+        self.path = path
+        self.quantile = quantile
+        self.margin = margin
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.bins = bins
+        self.decay = decay
+        self.min_visits = min_visits
+        self.rejoin = rejoin
+        self.clock = clock
+
+        # zone -> slot -> histogram of the decayed visit counts
+        self.histograms = {}
+        self.visits = {}
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def predict(self, zone, when=None):
+        """
+        :param zone: the hue group or zone
+        :param when: timestamp the lights came on, defaults to now
+        :return: seconds to keep the lights on after the last motion
+        """
+        if when is None:
+            when = self.clock()
+        histograms = self.histograms.get(zone, {})
+        for slot in slots(when):
+            histogram = histograms.get(slot)
+            if histogram is not None and sum(histogram) >= self.min_visits:
+                return min(self.max_seconds, max(self.min_seconds, self._quantile(histogram) * self.margin))
+        return self.fallback(when)
+
+    def add(self, zone, when, gap):
+        """
+        Learns from a finished visit.
+
+        :param zone: the hue group or zone
+        :param when: timestamp the visit started
+        :param gap: longest seconds without motion during the visit
+        :return:
+        """
+        histograms = self.histograms.setdefault(zone, {})
+        index = self._bin(gap)
+        for slot in slots(when):
+            histogram = histograms.setdefault(slot, [0.0] * self.bins)
+            for i in range(self.bins):
+                histogram[i] *= self.decay
+            histogram[index] += 1.0
+
+    def lights_on(self, zone, when=None):
+        """
+        Starts a visit, or continues the last one if its lights only just went off.
+        """
+        if when is None:
+            when = self.clock()
+        visit = self.visits.get(zone)
+        if visit is not None and visit.ended is not None and when - visit.ended <= self.rejoin:
+            visit.motion(when)
+            visit.ended = None
+            visit.rejoined += 1
+            return
+        self._finish(zone)
+        self.visits[zone] = Visit(when)
+
+    def motion(self, zone, when=None):
+        """
+        Notes motion while the lights are on.
+        """
+        visit = self.visits.get(zone)
+        if visit is not None and visit.ended is None:
+            visit.motion(when if when is not None else self.clock())
+
+    def lights_off(self, zone, when=None):
+        """
+        Ends the visit. We only learn from it once it can't be continued anymore.
+        """
+        visit = self.visits.get(zone)
+        if visit is not None and visit.ended is None:
+            visit.ended = when if when is not None else self.clock()
+
+    def flush(self, when=None):
+        """
+        Learns from the visits that ended more than rejoin seconds ago.
+        """
+        if when is None:
+            when = self.clock()
+        for (zone, visit) in list(self.visits.items()):
+            if visit.ended is not None and when - visit.ended > self.rejoin:
+                self._finish(zone)
+
+    def _finish(self, zone):
+        visit = self.visits.pop(zone, None)
+        if visit is None or visit.ended is None:
+            return
+        self.add(zone, visit.started, visit.longest_gap)
+        print("learned a {:.0f}s gap in a {:.0f}s visit to {}, cut short {} times".format(
+            visit.longest_gap, visit.ended - visit.started, zone, visit.rejoined))
+        if self.path is not None:
+            self.save(self.path)
+
+    def _bin(self, seconds):
+        if seconds <= self.min_seconds:
+            return 0
+        ratio = math.log(seconds / self.min_seconds) / math.log(self.max_seconds / self.min_seconds)
+        # bin i holds the gaps up to its top edge, so a quantile never undershoots the gaps it covers
+        return min(self.bins - 1, int(math.ceil(ratio * (self.bins - 1) - 1e-9)))
+
+    def _edge(self, index):
+        """
+        :return: the seconds at the top of a bin
+        """
+        return self.min_seconds * (self.max_seconds / self.min_seconds) ** (float(index) / (self.bins - 1))
+
+    def _quantile(self, histogram):
+        total = sum(histogram)
+        seen = 0.0
+        for (i, count) in enumerate(histogram):
+            seen += count
+            if seen >= self.quantile * total:
+                return self._edge(i)
+        return self.max_seconds
+
+    def save(self, path):
+        # write next to the model and rename, so that a crash never leaves half a model behind
+        partial = path + ".partial"
+        with open(partial, "w") as f:
+            json.dump({"min_seconds": self.min_seconds, "max_seconds": self.max_seconds, "bins": self.bins,
+                       "histograms": self.histograms}, f, indent=2, sort_keys=True)
+        os.rename(partial, path)
+
+    def load(self, path):
+        with open(path) as f:
+            saved = json.load(f)
+        if (saved["min_seconds"], saved["max_seconds"], saved["bins"]) != \
+                (self.min_seconds, self.max_seconds, self.bins):
+            raise ValueError("{} was saved with different bins, retrain it with occupancy.py".format(path))
+        self.histograms = saved["histograms"]
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+"""
+Trains the occupancy model from the event log of main.py --event-log, and evaluates it by replaying the history.
+
+    python occupancy.py -l events.db train -o occupancy.json
+    python occupancy.py -l events.db evaluate --since 2026-09-01 --fixed 10 --fixed 300
+
+A visit is the lights of a zone coming on until they go off, and motion is read from the per minute frame statistics,
+so gaps are only known to the minute. The evaluation replays the visits in time order. Before every visit the model
+predicts how long to keep the lights on after the last motion, and only then learns from it, so it never sees the
+future. The schedule and any fixed sleep times are replayed on the same visits. For every policy it counts:
+
+    cut short   times the lights would have gone off on someone, who then had to move to get them back on
+    idle on     time the lights stay on after the last motion of a visit, with the motion watch running
+    watch       frames the motion watch analyses in that time, at --watch-rate
+
+The history was recorded with the sleep times in force at the time, so a longer stillness than those only shows up
+if the lights came back on within the rejoin time. Expect the replay to undercount the cut short visits of policies
+shorter than the recorded ones.
+"""
+
+from events import parse_date, where
+from model.occupancy_model import OccupancyModel, schedule_fallback
+from util.event_log import connect
+from util.storm import schedule
+
+import argparse
+
+
+def visits(connection, since=0.0, until=None, zone=None, rejoin=300.0):
+    """
+    Reads the visits from the light changes, continuing a visit if the lights came back on within rejoin seconds.
+
+    :return: list of (zone, started, ended, sorted motion timestamps during the visit), in the order they started
+    """
+    (condition, parameters) = where(since, until, zone)
+    found = []
+    visit = None
+    for (event_zone, timestamp, value) in connection.execute(
+            "SELECT zone, time, value FROM events WHERE kind = 'lights' AND {} ORDER BY zone, time".format(condition),
+            parameters):
+        if visit is not None and visit[0] != event_zone:
+            visit = None
+        if value:
+            if visit is not None and visit[2] is not None and timestamp - visit[2] <= rejoin:
+                # the lights went off on someone, this is still the same visit
+                visit[2] = None
+                visit[3].append(timestamp)
+            elif visit is None or visit[2] is not None:
+                visit = [event_zone, timestamp, None, []]
+                found.append(visit)
+        elif visit is not None and visit[2] is None:
+            visit[2] = timestamp
+
+    # a visit without an end is still going on, or the process stopped while the lights were on
+    found = [visit for visit in found if visit[2] is not None]
+    for visit in found:
+        (event_zone, started, ended, motions) = visit
+        # the middle of every minute with motion, within the visit
+        for (minute,) in connection.execute("SELECT minute FROM frame_stats WHERE zone = ? AND minute >= ? AND "
+                                            "minute <= ? AND motion_frames > 0",
+                                            (event_zone, int(started // 60), int(ended // 60))):
+            motions.append(min(ended, max(started, minute * 60 + 30)))
+        motions.sort()
+    return sorted([tuple(visit) for visit in found], key=lambda visit: visit[1])
+
+
+def longest_gap(started, motions):
+    """
+    :return: the longest seconds without motion between the start of a visit and its last motion
+    """
+    longest = 0.0
+    last = started
+    for motion in motions:
+        longest = max(longest, motion - last)
+        last = motion
+    return longest
+
+
+def cut_short(started, motions, sleep_time):
+    """
+    :return: the number of times the lights would have gone off during the visit, keeping them on for sleep_time
+             seconds after every motion
+    """
+    count = 0
+    last = started
+    for motion in motions:
+        if motion - last > sleep_time:
+            count += 1
+        last = motion
+    return count
+
+
+class Replay:
+    """
+    Totals of replaying the visits with one policy.
+    """
+
+    def __init__(self, name, sleep_time):
+        """
+
+        :param name: name of the policy
+        :param sleep_time: function of (zone, timestamp the lights came on) returning the sleep time
+        """
+        self.name = name
+        self.sleep_time = sleep_time
+        self.visits = 0
+        self.visits_cut_short = 0
+        self.cut_short = 0
+        self.idle_seconds = 0.0
+
+    def add(self, zone, started, motions):
+        sleep_time = self.sleep_time(zone, started)
+        count = cut_short(started, motions, sleep_time)
+        self.visits += 1
+        self.visits_cut_short += 1 if count > 0 else 0
+        self.cut_short += count
+        self.idle_seconds += sleep_time
+
+
+def train(model, found):
+    """
+    Learns from the visits, in the order they started.
+
+    :return: the model
+    """
+    for (zone, started, ended, motions) in found:
+        model.add(zone, started, longest_gap(started, motions))
+    return model
+
+
+def evaluate(model, found, fixed=()):
+    """
+    Replays the visits with the schedule, the fixed sleep times and the model, which learns from every visit after
+    predicting it.
+
+    :param model: the OccupancyModel to evaluate, usually untrained
+    :param found: the visits, see visits()
+    :param fixed: sleep times (in seconds) to compare with
+    :return: list of Replay, one per policy
+    """
+    replays = [Replay("schedule", lambda zone, started: model.fallback(started))]
+    replays.extend(Replay("fixed {:g}s".format(seconds), lambda zone, started, seconds=seconds: seconds)
+                   for seconds in fixed)
+    replays.append(Replay("model", model.predict))
+    for (zone, started, ended, motions) in found:
+        for replay in replays:
+            replay.add(zone, started, motions)
+        model.add(zone, started, longest_gap(started, motions))
+    return replays
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-l", "--log", default="events.db", help="the event log")
+    ap.add_argument("-z", "--zone", help="only look at this hue group")
+    ap.add_argument("--since", type=parse_date, default=0.0, help="first day to include, as YYYY-MM-DD")
+    ap.add_argument("--until", type=parse_date, help="first day to leave out, as YYYY-MM-DD")
+    ap.add_argument("-q", "--quantile", type=float, default=0.85, help="fraction of the visits the sleep time covers")
+    ap.add_argument("-m", "--margin", type=float, default=1.0, help="factor to stretch the quantile by")
+    ap.add_argument("--rejoin", type=float, default=300.0,
+                    help="seconds after the lights went off in which coming back on continues the visit")
+    commands = ap.add_subparsers(dest="command")
+    command = commands.add_parser("train", help="learn from every visit and save the model")
+    command.add_argument("-o", "--output", default="occupancy.json", help="JSON file to save the model to")
+    command = commands.add_parser("evaluate", help="replay the visits and compare the model with the schedule")
+    command.add_argument("-f", "--fixed", type=float, action="append", default=[],
+                         help="also replay a fixed sleep time of this many seconds, can be repeated")
+    command.add_argument("--watch-rate", type=float, default=0.5,
+                         help="frames per second of the motion watch while the lights are on")
+    args = vars(ap.parse_args())
+
+    connection = connect(args["log"])
+    found = visits(connection, args["since"], args["until"], args["zone"], args["rejoin"])
+    connection.close()
+    model = OccupancyModel(schedule_fallback(schedule), quantile=args["quantile"], margin=args["margin"],
+                           rejoin=args["rejoin"])
+    if args["command"] == "train":
+        train(model, found).save(args["output"])
+        print("learned from {} visits, saved to {}".format(len(found), args["output"]))
+    elif args["command"] == "evaluate":
+        print("{:<12} {:>7} {:>10} {:>11} {:>10} {:>10} {:>9}".format(
+            "policy", "visits", "cut short", "visits cut", "mean sleep", "idle on", "watch"))
+        for replay in evaluate(model, found, args["fixed"]):
+            print("{:<12} {:>7} {:>10} {:>10.1f}% {:>9.0f}s {:>9.1f}h {:>9.0f}".format(
+                replay.name, replay.visits, replay.cut_short,
+                100.0 * replay.visits_cut_short / max(1, replay.visits),
+                replay.idle_seconds / max(1, replay.visits), replay.idle_seconds / 3600,
+                replay.idle_seconds * args["watch_rate"]))
+    else:
+        ap.print_help()
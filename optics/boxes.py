@@ -0,0 +1,245 @@
+"""
+Helpers for working with (x, y, w, h) bounding boxes.
+"""
+import numpy as np
+
+
+def rects_overlap(rect1, rect2):
+    """
+    :param rect1: (x, y, w, h)
+    :param rect2: (x, y, w, h)
+    :return: True iff the two rects share at least one pixel
+    """
+    (x1, y1, w1, h1) = rect1
+    (x2, y2, w2, h2) = rect2
+    return x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1
+
+
+def union_rect(rect1, rect2):
+    """
+    :param rect1: (x, y, w, h)
+    :param rect2: (x, y, w, h)
+    :return: the smallest rect containing both rects
+    """
+    x = min(rect1[0], rect2[0])
+    y = min(rect1[1], rect2[1])
+    right = max(rect1[0] + rect1[2], rect2[0] + rect2[2])
+    bottom = max(rect1[1] + rect1[3], rect2[1] + rect2[3])
+    return (x, y, right - x, bottom - y)
+
+
+def expand_rect(rect, margin, frame_size, min_size=(0, 0)):
+    """
+    Grows the rect by a fraction of its size on every side, and to at least min_size, without leaving the frame.
+
+    :param rect: (x, y, w, h)
+    :param margin: fraction of the width (height) to add on the left and right (top and bottom)
+    :param frame_size: (width, height) of the frame
+    :param min_size: (width, height) the rect should be grown to, if the frame is large enough
+    :return: the expanded rect
+    """
+    (x, y, w, h) = rect
+    (frame_width, frame_height) = frame_size
+    width = min(frame_width, max(int(w * (1 + 2 * margin)), min_size[0]))
+    height = min(frame_height, max(int(h * (1 + 2 * margin)), min_size[1]))
+    # keep the rect centered where possible, and shift it back inside the frame where not
+    x = min(max(0, x + w // 2 - width // 2), frame_width - width)
+    y = min(max(0, y + h // 2 - height // 2), frame_height - height)
+    return (x, y, width, height)
+
+
+def merge_rects(rects):
+    """
+    Merges overlapping rects until no two rects overlap.
+
+    :param rects: list of (x, y, w, h)
+    :return: list of non overlapping rects covering the input rects
+    """
+    merged = [tuple(rect) for rect in rects]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                if rects_overlap(merged[i], merged[j]):
+                    merged[i] = union_rect(merged[i], merged[j])
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def rect_area(rect):
+    return rect[2] * rect[3]
+
+
+def intersection_over_union(rect1, rect2):
+    """
+    :param rect1: (x, y, w, h)
+    :param rect2: (x, y, w, h)
+    :return: area of the intersection of the rects divided by the area of their union, in [0, 1]
+    """
+    width = min(rect1[0] + rect1[2], rect2[0] + rect2[2]) - max(rect1[0], rect2[0])
+    height = min(rect1[1] + rect1[3], rect2[1] + rect2[3]) - max(rect1[1], rect2[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return float(intersection) / (rect_area(rect1) + rect_area(rect2) - intersection)
+
+
+def similar_rects(rect1, rect2, eps):
+    """
+    The similarity opencv uses when grouping detections: every edge of the two rects is within
+    eps times their average size of each other.
+
+    :param rect1: (x, y, w, h)
+    :param rect2: (x, y, w, h)
+    :param eps: relative tolerance
+    :return: True iff the rects are similar
+    """
+    delta = eps * (min(rect1[2], rect2[2]) + min(rect1[3], rect2[3])) * 0.5
+    return abs(rect1[0] - rect2[0]) <= delta and abs(rect1[1] - rect2[1]) <= delta and \
+        abs(rect1[0] + rect1[2] - rect2[0] - rect2[2]) <= delta and \
+        abs(rect1[1] + rect1[3] - rect2[1] - rect2[3]) <= delta
+
+
+def group_rectangles(rects, weights, group_threshold=2, eps=0.2):
+    """
+    Groups raw detections from several scales into final detections, the same way
+    cv2.HOGDescriptor.detectMultiScale does with its default finalThreshold.
+
+    Similar rects are clustered and averaged, clusters with group_threshold or fewer members are dropped,
+    as are clusters nested inside a stronger cluster. Each cluster keeps the highest weight of its members.
+
+    :param rects: list of (x, y, w, h)
+    :param weights: detection weight of every rect
+    :param group_threshold: minimum number of rects (exclusive) a cluster needs to be kept
+    :param eps: relative tolerance used to decide whether two rects are similar
+    :return: tuple of the grouped rects and their weights
+    """
+    rects = [tuple(rect) for rect in rects]
+    if group_threshold <= 0 or len(rects) == 0:
+        return (rects, list(weights))
+
+    # union find over similar rects
+    parents = list(range(len(rects)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i in range(len(rects)):
+        for j in range(i + 1, len(rects)):
+            if similar_rects(rects[i], rects[j], eps):
+                parents[find(i)] = find(j)
+
+    labels = {}
+    clusters = []
+    for (i, rect) in enumerate(rects):
+        root = find(i)
+        if root not in labels:
+            labels[root] = len(clusters)
+            clusters.append([[0.0, 0.0, 0.0, 0.0], 0, float("-inf")])
+        cluster = clusters[labels[root]]
+        for k in range(4):
+            cluster[0][k] += rect[k]
+        cluster[1] += 1
+        cluster[2] = max(cluster[2], float(weights[i]))
+
+    averaged = [(tuple(int(round(total / count)) for total in sums), count, weight)
+                for (sums, count, weight) in clusters]
+
+    grouped_rects = []
+    grouped_weights = []
+    for (i, (r1, n1, w1)) in enumerate(averaged):
+        if n1 <= group_threshold:
+            continue
+        nested = False
+        for (j, (r2, n2, w2)) in enumerate(averaged):
+            if j == i or n2 <= group_threshold:
+                continue
+            dx = int(round(r2[2] * eps))
+            dy = int(round(r2[3] * eps))
+            if r1[0] >= r2[0] - dx and r1[1] >= r2[1] - dy and \
+                    r1[0] + r1[2] <= r2[0] + r2[2] + dx and r1[1] + r1[3] <= r2[1] + r2[3] + dy and \
+                    (n2 > max(3, n1) or n1 < 3):
+                nested = True
+                break
+        if not nested:
+            grouped_rects.append(r1)
+            grouped_weights.append(w1)
+    return (grouped_rects, grouped_weights)
+
+
+def _corners(boxes):
+    """
+    :param boxes: (x, y, w, h) boxes, as a list or an n x 4 array
+    :return: n x 4 float array of (x1, y1, x2, y2)
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    return np.hstack([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]])
+
+
+def intersection_areas(boxes1, boxes2):
+    """
+    :param boxes1: n (x, y, w, h) boxes
+    :param boxes2: m (x, y, w, h) boxes
+    :return: n x m array of the area every box of boxes1 shares with every box of boxes2
+    """
+    corners1 = _corners(boxes1)[:, np.newaxis, :]
+    corners2 = _corners(boxes2)[np.newaxis, :, :]
+    width = np.minimum(corners1[..., 2], corners2[..., 2]) - np.maximum(corners1[..., 0], corners2[..., 0])
+    height = np.minimum(corners1[..., 3], corners2[..., 3]) - np.maximum(corners1[..., 1], corners2[..., 1])
+    return np.clip(width, 0, None) * np.clip(height, 0, None)
+
+
+def iou_matrix(boxes1, boxes2):
+    """
+    The vectorized intersection_over_union() of every pair of boxes.
+
+    :param boxes1: n (x, y, w, h) boxes
+    :param boxes2: m (x, y, w, h) boxes
+    :return: n x m array of intersection over union, in [0, 1]
+    """
+    intersection = intersection_areas(boxes1, boxes2)
+    areas1 = np.prod(np.asarray(boxes1, dtype=float).reshape(-1, 4)[:, 2:], axis=1)
+    areas2 = np.prod(np.asarray(boxes2, dtype=float).reshape(-1, 4)[:, 2:], axis=1)
+    union = areas1[:, np.newaxis] + areas2[np.newaxis, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def coverage_matrix(boxes, regions):
+    """
+    :param boxes: n (x, y, w, h) boxes
+    :param regions: m (x, y, w, h) boxes
+    :return: n x m array of the fraction of every box that lies inside every region, in [0, 1]
+    """
+    intersection = intersection_areas(boxes, regions)
+    areas = np.prod(np.asarray(boxes, dtype=float).reshape(-1, 4)[:, 2:], axis=1)[:, np.newaxis]
+    return np.divide(intersection, areas, out=np.zeros_like(intersection), where=areas > 0)
+
+
+def non_max_suppression(boxes, weights, overlap=0.65):
+    """
+    Drops every box that overlaps a box with a higher weight by more than overlap, measured as in
+    imutils.object_detection.non_max_suppression: the intersection over the area of the weaker box.
+
+    :param boxes: n (x, y, w, h) boxes
+    :param weights: the weight of every box
+    :param overlap: fraction of a box that may be covered by a stronger box before it is suppressed
+    :return: the indices of the boxes we kept, strongest first
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    order = np.argsort(-np.ravel(np.asarray(weights, dtype=float)), kind="stable")
+    keep = []
+    while len(order) > 0:
+        best = order[0]
+        keep.append(int(best))
+        # suppress every remaining box the best box covers too much of, all in one go
+        covered = coverage_matrix(boxes[order[1:]], boxes[best:best + 1])[:, 0]
+        order = order[1:][covered <= overlap]
+    return np.array(keep, dtype=int)
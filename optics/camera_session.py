@@ -0,0 +1,229 @@
+from collections import deque
+from optics.frame_source import FrameSource, capture_seconds
+from picamera.array import PiRGBArray
+from picamera import PiCamera
+from util.metrics import registry
+
+import cv2
+import numpy as np
+import time
+
+wake_seconds = registry.histogram("camera_wake_seconds", "time from resuming the camera to the first analysed frame")
+
+
+class YUVBuffer:
+    """
+    Output picamera writes raw yuv (I420) frames into. The buffer is allocated once, and the Y plane is a view into it,
+    so capturing a frame allocates nothing.
+    """
+
+    def __init__(self, resolution):
+        """
+
+        :param resolution: (width, height) of the captured frames
+        """
+        (width, height) = resolution
+        # picamera pads the planes to a multiple of 32 columns and 16 rows
+        self.padded = ((width + 31) // 32 * 32, (height + 15) // 16 * 16)
+        (padded_width, padded_height) = self.padded
+        self.buffer = np.empty(padded_width * padded_height * 3 // 2, dtype=np.uint8)
+        self.luminance = self.buffer[:padded_width * padded_height].reshape((padded_height, padded_width))
+        self.luminance = self.luminance[:height, :width]
+        self.position = 0
+        self._bgr = None
+        self._resolution = resolution
+
+    def write(self, data):
+        size = min(len(data), len(self.buffer) - self.position)
+        self.buffer[self.position:self.position + size] = np.frombuffer(data, dtype=np.uint8, count=size)
+        self.position += size
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def truncate(self, size=0):
+        self.position = size
+
+    def seek(self, position):
+        self.position = position
+
+    def close(self):
+        pass
+
+    def bgr(self):
+        """
+        Converts the frame in the buffer to bgr, into a second buffer that is also reused.
+
+        :return: the bgr frame
+        """
+        (padded_width, padded_height) = self.padded
+        (width, height) = self._resolution
+        self._bgr = cv2.cvtColor(self.buffer.reshape((padded_height * 3 // 2, padded_width)), cv2.COLOR_YUV2BGR_I420,
+                                 dst=self._bgr)
+        return self._bgr[:height, :width]
+
+
+class CameraSession(FrameSource):
+    """
+    Long lived handle to the camera.
+
+    The camera is opened and warmed up once. Between scans the session is paused, which stops the video port
+    capture but leaves the camera open, so exposure and white balance calibration survive until the next resume.
+
+    In "yuv" format the session yields the luminance (Y) plane as a grayscale frame, which is all the motion
+    detector needs, and only converts to bgr when color() is called. The frames are views into a single buffer that
+    the next capture overwrites, so consumers must be done with a frame before asking for the next one.
+    """
+
+    def __init__(self, resolution=(640, 480), framerate=2, contrast=None, brightness=None, iso=None,
+                 warmup=1.0, discard_frames=10, resume_discard_frames=2, capture_format="bgr"):
+        """
+
+        :param resolution: (width, height) of the captured frames
+        :param framerate: frames per second captured from the video port
+        :param contrast: camera contrast, None to keep the camera default
+        :param brightness: camera brightness, None to keep the camera default
+        :param iso: camera iso, None to keep the camera default
+        :param warmup: seconds to let the sensor settle after opening the camera
+        :param discard_frames: frames to throw away after opening the camera, while exposure settles
+        :param resume_discard_frames: frames to throw away after resuming a paused session
+        :param capture_format: "bgr" to capture bgr frames, "yuv" to capture grayscale frames into a reused buffer
+        """
+        if capture_format not in ("bgr", "yuv"):
+            raise ValueError("unsupported capture format {}".format(capture_format))
+        FrameSource.__init__(self)
+        self.resolution = resolution
+        self.framerate = framerate
+        self.contrast = contrast
+        self.brightness = brightness
+        self.iso = iso
+        self.warmup = warmup
+        self.discard_frames = discard_frames
+        self.resume_discard_frames = resume_discard_frames
+        self.capture_format = capture_format
+
+        self.camera = None
+        self.capture = None
+        self.wake_latencies = deque(maxlen=1000)
+
+        self._stream = None
+        self._resumed = False
+        self._woke_at = None
+
+    def open(self):
+        """
+        Opens the camera and warms up the sensor. Does nothing if the camera is already open.
+
+        :return:
+        """
+        if self.camera is not None:
+            return
+        self.camera = PiCamera()
+        self.camera.resolution = self.resolution
+        self.camera.framerate = self.framerate
+        if self.contrast is not None:
+            self.camera.contrast = self.contrast
+        if self.brightness is not None:
+            self.camera.brightness = self.brightness
+        if self.iso is not None:
+            self.camera.iso = self.iso
+        if self.capture_format == "yuv":
+            self.capture = YUVBuffer(self.resolution)
+        else:
+            self.capture = PiRGBArray(self.camera, size=self.resolution)
+        # warmup the sensor array
+        time.sleep(self.warmup)
+
+    def resume(self):
+        """
+        Starts capturing from the video port, opening the camera first if needed.
+
+        :return:
+        """
+        if self._stream is not None:
+            return
+        self._woke_at = time.time()
+        self.open()
+        self._stream = self.camera.capture_continuous(self.capture, format=self.capture_format, use_video_port=True)
+
+        # the first frames after starting the port are badly exposed. we need far fewer of them
+        # once the camera has been calibrated by a previous run.
+        discard = self.resume_discard_frames if self._resumed else self.discard_frames
+        for i in range(discard):
+            next(self._stream)
+            self.capture.truncate(0)
+        self._resumed = True
+
+    def frames(self):
+        """
+        Yields frames from the camera until the session is paused or closed.
+
+        :return: generator of bgr frames
+        """
+        self.resume()
+        stream = self._stream
+        before = time.time()
+        for frame in stream:
+            array = frame.luminance if self.capture_format == "yuv" else frame.array
+            # we need to truncate the buffer before the next capture
+            self.capture.truncate(0)
+            capture_seconds.observe(time.time() - before)
+            self.frame_count += 1
+            yield array
+            before = time.time()
+
+    def color(self, frame):
+        """
+        :param frame: the latest frame yielded by frames()
+        :return: the frame in bgr
+        """
+        if self.capture_format == "yuv":
+            return self.capture.bgr()
+        return frame
+
+    def frame_analysed(self):
+        """
+        Called by consumers once they have finished analysing a frame.
+        Records the time from the last resume to the first analysed frame after it.
+
+        :return:
+        """
+        if self._woke_at is not None:
+            self.wake_latencies.append(time.time() - self._woke_at)
+            wake_seconds.observe(self.wake_latencies[-1])
+            print("took {}s from wake to first analysed frame".format(self.wake_latencies[-1]))
+            self._woke_at = None
+
+    def pause(self):
+        """
+        Stops capturing from the video port while keeping the camera open.
+
+        :return:
+        """
+        if self._stream is not None:
+            # closing the generator releases picamera's video port encoder
+            self._stream.close()
+            self._stream = None
+            self.capture.truncate(0)
+
+    def close(self):
+        """
+        Releases the camera.
+
+        :return:
+        """
+        self.pause()
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self.camera is not None:
+            self.camera.close()
+            self.camera = None
+        self._resumed = False
+
+    def last_wake_latency(self):
+        """
+        :return: seconds between the last resume and the first frame analysed after it, or None
+        """
+        return self.wake_latencies[-1] if len(self.wake_latencies) > 0 else None
@@ -0,0 +1,254 @@
+from collections import deque
+from threading import Lock, Thread
+from util.metrics import registry
+
+import cv2
+import datetime
+import imutils
+import json
+import os
+import queue
+import shutil
+import time
+
+clips_written = registry.counter("clips_written", "clips saved to disk")
+clips_dropped = registry.counter("clips_dropped", "clips dropped because the writer fell behind")
+clips_pruned = registry.counter("clips_pruned", "old clips deleted to stay within the disk cap")
+
+
+class BufferedFrame:
+    """
+    A compressed frame, shared between the buffer and the clips it is part of. Its bytes count towards the memory
+    limit once, for as long as any of them holds on to it.
+    """
+
+    def __init__(self, timestamp, jpeg):
+        self.timestamp = timestamp
+        self.jpeg = jpeg
+        self.references = 0
+
+
+class Clip:
+    """
+    The frames around one or more events that happened close together.
+    """
+
+    def __init__(self, name, frames, until):
+        self.name = name
+        self.frames = frames
+        self.until = until
+        self.events = []
+
+
+class ClipRecorder:
+    """
+    Keeps the last few seconds of frames in memory, downscaled and jpeg compressed, so that we can save what led up
+    to a light change.
+
+    When an event happens, the frames in memory and the frames of the next post_seconds are saved to a directory of
+    their own, one jpeg per frame plus clip.json with the timestamps and events, so that a clip can be replayed with
+    an ImageDirectoryFrameSource. The files are written by a background thread, and if it falls behind clips are
+    dropped rather than slowing down the caller.
+    """
+
+    def __init__(self, directory, pre_seconds=10.0, post_seconds=10.0, width=320, quality=75,
+                 max_memory=16 * 1024 * 1024, max_disk=512 * 1024 * 1024, max_pending=4, clock=time.time):
+        """
+
+        :param directory: directory to save the clips in
+        :param pre_seconds: seconds of frames to keep from before an event
+        :param post_seconds: seconds of frames to record after the last event of a clip
+        :param width: width to downscale the frames to, None to keep the full resolution
+        :param quality: jpeg quality of the saved frames
+        :param max_memory: most bytes of compressed frames to keep in memory, including clips waiting to be written.
+                           a frame in both the buffer and a clip only counts once.
+        :param max_disk: most bytes of clips to keep on disk, the oldest clips are deleted beyond this
+        :param max_pending: most finished clips waiting for the writer before we drop new ones
+        :param clock: function returning the current time in seconds
+        """
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.width = width
+        self.quality = quality
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.clock = clock
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._remove_partial()
+
+        self.frames = deque()
+        self.memory = 0
+        self.clip = None
+        self._lock = Lock()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._thread = Thread(target=self._write_clips, name="clip-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+        registry.gauge("clip_buffer_bytes", "compressed frames kept in memory", function=lambda: self.memory)
+
+    def add(self, frame):
+        """
+        Adds a frame to the buffer, and to the clip being recorded if there is one.
+
+        :param frame: bgr or grayscale frame
+        :return:
+        """
+        now = self.clock()
+        if self.width is not None and frame.shape[1] > self.width:
+            frame = imutils.resize(frame, width=self.width)
+        (encoded, jpeg) = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if not encoded:
+            return
+        buffered = BufferedFrame(now, jpeg.tobytes())
+
+        with self._lock:
+            self._hold(buffered)
+            self.frames.append(buffered)
+            if self.clip is not None:
+                if now > self.clip.until:
+                    self._finish()
+                elif self.memory <= self.max_memory:
+                    # the frame is already accounted for, the clip only keeps it alive for longer
+                    self._hold(buffered)
+                    self.clip.frames.append(buffered)
+            self._evict(now)
+
+    def event(self, name, **details):
+        """
+        Starts a clip with the buffered frames, or extends the clip being recorded.
+
+        :param name: what happened, ie "on" or "off". used in the name of the clip's directory.
+        :param details: anything else to save with the event in clip.json
+        :return:
+        """
+        now = self.clock()
+        with self._lock:
+            if self.clip is None:
+                stamp = datetime.datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S-%f")[:-3]
+                # the clip shares the buffered frames, they stay accounted for until the clip is written
+                self.clip = Clip("{}-{}".format(stamp, name), list(self.frames), now + self.post_seconds)
+                for frame in self.clip.frames:
+                    self._hold(frame)
+            self.clip.until = now + self.post_seconds
+            details.update({"event": name, "time": now})
+            self.clip.events.append(details)
+
+    def close(self):
+        """
+        Writes the clip being recorded and waits for the writer to finish.
+
+        :return:
+        """
+        with self._lock:
+            if self.clip is not None:
+                self._finish()
+        self._pending.put(None)
+        self._thread.join()
+
+    def _hold(self, frame):
+        if frame.references == 0:
+            self.memory += len(frame.jpeg)
+        frame.references += 1
+
+    def _release(self, frame):
+        frame.references -= 1
+        if frame.references == 0:
+            self.memory -= len(frame.jpeg)
+
+    def _evict(self, now):
+        while len(self.frames) > 0 and self.frames[0].timestamp < now - self.pre_seconds:
+            self._release(self.frames.popleft())
+        # over the limit, drop the oldest frames only the buffer holds. dropping frames a clip holds as well
+        # wouldn't free anything.
+        while self.memory > self.max_memory:
+            exclusive = next((frame for frame in self.frames if frame.references == 1), None)
+            if exclusive is None:
+                break
+            self.frames.remove(exclusive)
+            self._release(exclusive)
+
+    def _finish(self):
+        clip = self.clip
+        self.clip = None
+        try:
+            self._pending.put_nowait(clip)
+        except queue.Full:
+            clips_dropped.inc()
+            print("clip writer is behind, dropping clip {}".format(clip.name))
+            for frame in clip.frames:
+                self._release(frame)
+
+    def _write_clips(self):
+        while True:
+            try:
+                clip = self._pending.get(timeout=1.0)
+            except queue.Empty:
+                # the caller may have stopped adding frames, ie while the camera is paused
+                with self._lock:
+                    if self.clip is not None and self.clock() > self.clip.until:
+                        self._finish()
+                continue
+            if clip is None:
+                return
+            try:
+                path = self._write(clip)
+                clips_written.inc()
+                self._prune(path)
+            except (IOError, OSError) as e:
+                print("failed to write clip {}: {}".format(clip.name, e))
+            finally:
+                with self._lock:
+                    for frame in clip.frames:
+                        self._release(frame)
+
+    def _write(self, clip):
+        path = os.path.join(self.directory, clip.name)
+        # write into a temporary directory, so that a clip is either complete or not there at all
+        partial = path + ".partial"
+        os.makedirs(partial)
+        timestamps = []
+        for (i, frame) in enumerate(clip.frames):
+            with open(os.path.join(partial, "{:06d}.jpg".format(i)), "wb") as f:
+                f.write(frame.jpeg)
+            timestamps.append(frame.timestamp)
+        with open(os.path.join(partial, "clip.json"), "w") as f:
+            json.dump({"events": clip.events, "timestamps": timestamps}, f, indent=2)
+        os.rename(partial, path)
+        print("saved clip {} with {} frames".format(path, len(clip.frames)))
+        return path
+
+    def _remove_partial(self):
+        # clips that were being written when we last stopped, ie crashed or lost power
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".partial") and os.path.isdir(path):
+                print("removing unfinished clip {}".format(path))
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _prune(self, newest):
+        """
+        Deletes the oldest clips until the rest fit in max_disk.
+
+        :param newest: path of the clip just written, kept even if it doesn't fit on its own
+        :return:
+        """
+        clips = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path) or name.endswith(".partial"):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            clips.append((os.path.getmtime(path), path, size))
+            total += size
+        for (_, path, size) in sorted(clips):
+            if total <= self.max_disk:
+                break
+            if path == newest:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            clips_pruned.inc()
+            total -= size
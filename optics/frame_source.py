@@ -0,0 +1,218 @@
+from imutils import paths
+from util.metrics import registry
+
+import cv2
+import numpy as np
+import time
+
+capture_seconds = registry.histogram("frame_capture_seconds", "time spent waiting for the next frame")
+
+
+class FrameSource:
+    """
+    Something we can read bgr frames from, ie the camera, a recorded video or a directory of images.
+
+    Sources remember their position, so calling frames() again after the consumer stopped early continues
+    where it left off.
+    """
+
+    def __init__(self, max_frames=None):
+        """
+
+        :param max_frames: stop after this many frames, None to read until the source runs out
+        """
+        self.max_frames = max_frames
+        self.frame_count = 0
+        self.exhausted = False
+
+    def frames(self):
+        """
+        Yields frames until the source runs out or the consumer stops iterating.
+
+        :return: generator of bgr frames
+        """
+        while not self.exhausted:
+            if self.max_frames is not None and self.frame_count >= self.max_frames:
+                self.exhausted = True
+                break
+            with capture_seconds.time():
+                frame = self.read()
+            if frame is None:
+                self.exhausted = True
+                break
+            self.frame_count += 1
+            yield frame
+
+    def read(self):
+        """
+        :return: the next frame, or None if there are no more frames
+        """
+        raise NotImplementedError
+
+    def color(self, frame):
+        """
+        Sources that yield grayscale frames produce the bgr version of their latest frame here, for the consumers
+        that need colour, ie the person detector.
+
+        :param frame: the latest frame yielded by frames()
+        :return: the frame in bgr
+        """
+        return frame
+
+    def frame_analysed(self):
+        """
+        Called by consumers once they have finished analysing a frame.
+
+        :return:
+        """
+        pass
+
+    def pause(self):
+        """
+        Called when the consumer stops reading for a while.
+
+        :return:
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources held by the source.
+
+        :return:
+        """
+        pass
+
+
+class VideoFileFrameSource(FrameSource):
+    """
+    Replays frames from a recorded video file.
+    """
+
+    def __init__(self, path, max_frames=None):
+        FrameSource.__init__(self, max_frames)
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError("could not open video {}".format(path))
+
+    def read(self):
+        (grabbed, frame) = self.capture.read()
+        return frame if grabbed else None
+
+    def close(self):
+        self.capture.release()
+
+
+class ImageDirectoryFrameSource(FrameSource):
+    """
+    Replays the images in a directory as frames, in filename order.
+    """
+
+    def __init__(self, path, max_frames=None):
+        FrameSource.__init__(self, max_frames)
+        self.path = path
+        self.image_paths = sorted(paths.list_images(path))
+        self._position = 0
+
+    def read(self):
+        while self._position < len(self.image_paths):
+            image = cv2.imread(self.image_paths[self._position])
+            self._position += 1
+            if image is not None:
+                return image
+        return None
+
+
+class SyntheticFrameSource(FrameSource):
+    """
+    Generates frames of a blob moving back and forth across a static, slightly noisy background.
+    """
+
+    def __init__(self, resolution=(640, 480), max_frames=300, blob_radius=40, speed=8, noise=4, seed=0):
+        """
+
+        :param resolution: (width, height) of the generated frames
+        :param max_frames: number of frames to generate, None to generate forever
+        :param blob_radius: radius of the moving blob, in pixels
+        :param speed: pixels the blob moves per frame
+        :param noise: amplitude of the per frame sensor noise
+        :param seed: seed for the random background and noise
+        """
+        FrameSource.__init__(self, max_frames)
+        self.resolution = resolution
+        self.blob_radius = blob_radius
+        self.speed = speed
+        self.noise = noise
+
+        (width, height) = resolution
+        random = np.random.RandomState(seed)
+        gradient = np.tile(np.linspace(40, 160, width, dtype=np.uint8), (height, 1))
+        self.background = cv2.merge([gradient, gradient, np.full_like(gradient, 90)])
+        self.background = cv2.add(self.background, random.randint(0, 20, self.background.shape, dtype=np.uint8))
+        self._noise = [random.randint(0, noise + 1, self.background.shape, dtype=np.uint8) for i in range(8)]
+
+    def read(self):
+        (width, height) = self.resolution
+        # bounce between the left and right edge
+        travel = max(1, width - 2 * self.blob_radius)
+        offset = (self.frame_count * self.speed) % (2 * travel)
+        x = self.blob_radius + (offset if offset < travel else 2 * travel - offset)
+        y = height // 2
+
+        frame = cv2.add(self.background, self._noise[self.frame_count % len(self._noise)])
+        cv2.circle(frame, (int(x), y), self.blob_radius, (20, 20, 220), -1)
+        return frame
+
+
+class MeasuredFrameSource(FrameSource):
+    """
+    Wraps another source and measures how long the consumer spends on each frame,
+    ie the time between handing out a frame and being asked for the next one.
+    """
+
+    def __init__(self, source):
+        FrameSource.__init__(self)
+        self.source = source
+        self.latencies = []
+        self.started = None
+        self.finished = None
+
+    def frames(self):
+        for frame in self.source.frames():
+            now = time.time()
+            if self.started is None:
+                self.started = now
+            self.frame_count += 1
+            try:
+                yield frame
+            finally:
+                # runs when the consumer asks for the next frame, or stops iterating
+                self.finished = time.time()
+                self.latencies.append(self.finished - now)
+        self.exhausted = self.source.exhausted
+
+    def frame_analysed(self):
+        self.source.frame_analysed()
+
+    def pause(self):
+        self.source.pause()
+
+    def close(self):
+        self.source.close()
+
+    def summary(self):
+        """
+        :return: dict with the number of frames, frames per second and per frame latency percentiles in seconds
+        """
+        elapsed = self.finished - self.started if self.finished is not None else 0.0
+        latencies = sorted(self.latencies)
+        summary = {
+            "frames": self.frame_count,
+            "fps": self.frame_count / elapsed if elapsed > 0 else 0.0,
+        }
+        for pct in (50, 90, 99):
+            summary["p{}".format(pct)] = latencies[min(len(latencies) - 1, len(latencies) * pct // 100)] \
+                if len(latencies) > 0 else 0.0
+        summary["max"] = latencies[-1] if len(latencies) > 0 else 0.0
+        return summary
@@ -0,0 +1,70 @@
+from optics.boxes import coverage_matrix, merge_rects, non_max_suppression
+
+import numpy as np
+
+
+class FusedDetections:
+    """
+    The person detections of a frame after fusing them with the motion in it.
+    """
+
+    def __init__(self, boxes, weights, support, scores):
+        """
+
+        :param boxes: n x 4 array of the (x, y, w, h) person boxes left after non maximum suppression
+        :param weights: the detector weight of every box
+        :param support: how much motion backs every box, in [0, 1]
+        :param scores: the confidence of every box, ie its weight scaled by its support
+        """
+        self.boxes = boxes
+        self.weights = weights
+        self.support = support
+        self.scores = scores
+        self.score = float(scores.max()) if len(scores) > 0 else 0.0
+
+    def above(self, threshold):
+        """
+        :param threshold: minimum confidence
+        :return: the boxes whose confidence is above the threshold
+        """
+        return self.boxes[self.scores > threshold]
+
+
+class DetectionFusion:
+    """
+    Combines the person detector's boxes with the regions of motion into a single confidence for the frame.
+
+    Overlapping person boxes are suppressed first, and every remaining box is then scaled by how much of it is
+    covered by motion, so that a strong detection in a still part of the frame, ie a poster or a coat, counts for
+    nothing while a weak one on top of the motion keeps its weight. The confidence of the frame is that of its best
+    box.
+    """
+
+    def __init__(self, overlap=0.65, min_coverage=0.2):
+        """
+
+        :param overlap: fraction of a person box a stronger box may cover before it is suppressed
+        :param min_coverage: fraction of a person box that needs to be covered by motion for full support.
+                             less coverage scales the box's weight down proportionally.
+        """
+        self.overlap = overlap
+        self.min_coverage = min_coverage
+
+    def fuse(self, human_rects, human_weights, motion_rects):
+        """
+        :param human_rects: (x, y, w, h) boxes from the person detector
+        :param human_weights: the weight of every person box
+        :param motion_rects: (x, y, w, h) regions of motion in the same frame
+        :return: FusedDetections
+        """
+        boxes = np.asarray(human_rects, dtype=int).reshape(-1, 4)
+        weights = np.ravel(np.asarray(human_weights, dtype=float))
+        keep = non_max_suppression(boxes, weights, self.overlap)
+        boxes = boxes[keep]
+        weights = weights[keep]
+        # the bounding rects of separate contours can still overlap. merged, they don't, so their coverage of a box
+        # adds up without counting the shared part twice.
+        coverage = coverage_matrix(boxes, merge_rects(motion_rects)).sum(axis=1) if len(motion_rects) > 0 else \
+            np.zeros(len(boxes))
+        support = np.clip(coverage / self.min_coverage, 0.0, 1.0) if self.min_coverage > 0 else np.ones(len(boxes))
+        return FusedDetections(boxes, weights, support, weights * support)
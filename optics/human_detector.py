@@ -1,25 +1,127 @@
+from optics.boxes import expand_rect, merge_rects, rect_area
+from util.metrics import registry
+
 import cv2
 import imutils
+import numpy as np
 import time
 
+
+def _detect_seconds(mode):
+    return registry.histogram("human_detect_seconds", "time spent looking for people", labels={"mode": mode})
+
+
 class HumanDetector:
 
+    # the default people detector looks at 64x128 windows
+    window_size = (64, 128)
 
-    def __init__(self):
+    def __init__(self, width=350, winStride=(4,4), padding=(6,6), scale=1.05, verbose=True):
+        """
+
+        :param width: images are scaled down to at most this width before running the detector
+        :param winStride: default step of the detection window
+        :param padding: default padding around the image
+        :param scale: default factor between the levels of the scale pyramid
+        :param verbose: print the time and result of every detection
+        """
+        self.width = width
+        self.winStride = tuple(winStride)
+        self.padding = tuple(padding)
+        self.scale = scale
+        self.verbose = verbose
         # initialize detector
         self.hog = cv2.HOGDescriptor()
         self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
 
-    def detect(self, image, winStride=(4,4), padding=(6,6), scale=1.05):
+    def detect(self, image, winStride=None, padding=None, scale=None):
         """
         Detects humans in the given image.
 
         :param image:
         :return: tuple bounding boxes and weights
         """
+        (winStride, padding, scale) = self.parameters(winStride, padding, scale)
         before = time.time()
-        image = imutils.resize(image, width=min(350, image.shape[1]))
-        boxes = self.hog.detectMultiScale(image, winStride=winStride, padding=padding, scale=scale)
+        image = imutils.resize(image, width=min(self.width, image.shape[1]))
+        boxes = self.detect_multiscale(image, winStride=winStride, padding=padding, scale=scale)
         after = time.time()
-        print("took {}s to find bounding boxes and weights {}".format(after - before, boxes))
+        _detect_seconds("full_frame").observe(after - before)
+        if self.verbose:
+            print("took {}s to find bounding boxes and weights {}".format(after - before, boxes))
         return boxes
+
+    def detect_regions(self, image, rects, margin=0.25, max_coverage=0.6, winStride=None, padding=None,
+                       scale=None):
+        """
+        Detects humans only in the given regions of the image, ie where we found motion.
+
+        The regions are expanded by margin, merged where they overlap and cropped out of the full resolution image,
+        so small regions are searched at a higher resolution than detect() would use for the whole image.
+
+        :param image:
+        :param rects: (x, y, w, h) regions to search
+        :param margin: fraction of a region's size to add on every side, so we don't cut people in half
+        :param max_coverage: if the merged regions cover more than this fraction of the image,
+                             search the whole image instead
+        :return: tuple of bounding boxes, in image coordinates, and weights
+        """
+        (winStride, padding, scale) = self.parameters(winStride, padding, scale)
+        (height, width) = image.shape[:2]
+        regions = merge_rects([expand_rect(rect, margin, (width, height), self.window_size) for rect in rects])
+        if len(regions) == 0:
+            return (np.zeros((0, 4), dtype=int), np.zeros((0,)))
+        if sum(rect_area(region) for region in regions) > max_coverage * width * height:
+            regions = [(0, 0, width, height)]
+
+        before = time.time()
+        all_boxes = []
+        all_weights = []
+        for (x, y, w, h) in regions:
+            crop = image[y:y + h, x:x + w]
+            # scale wide regions down like detect() does, but never below the height of a detection window
+            resize_ratio = min(1.0, max(float(self.width) / w, float(self.window_size[1]) / h))
+            if resize_ratio < 1.0:
+                crop = imutils.resize(crop, width=int(w * resize_ratio))
+            (boxes, weights) = self.detect_multiscale(crop, winStride=winStride, padding=padding, scale=scale)
+            for (bx, by, bw, bh) in boxes:
+                # map the box back into the coordinates of the full image
+                all_boxes.append((x + int(bx / resize_ratio), y + int(by / resize_ratio),
+                                  int(bw / resize_ratio), int(bh / resize_ratio)))
+            all_weights.extend(np.ravel(weights))
+        after = time.time()
+        _detect_seconds("regions").observe(after - before)
+        if self.verbose:
+            print("took {}s to find bounding boxes and weights in {} regions {}".format(
+                after - before, len(regions), all_boxes))
+        return (np.array(all_boxes, dtype=int).reshape(-1, 4), np.array(all_weights, dtype=float))
+
+    def parameters(self, winStride=None, padding=None, scale=None):
+        """
+        :return: tuple of winStride, padding and scale, with the detector's defaults for any that are None
+        """
+        return (winStride if winStride is not None else self.winStride,
+                padding if padding is not None else self.padding,
+                scale if scale is not None else self.scale)
+
+    def detect_multiscale(self, image, winStride=(4,4), padding=(6,6), scale=1.05):
+        """
+        Runs the detector over every scale of the image, as is. Subclasses can override this to change
+        how the detector is run.
+
+        :param image:
+        :return: tuple bounding boxes and weights
+        """
+        return self.hog.detectMultiScale(image, winStride=winStride, padding=padding, scale=scale)
+
+    def detect_source(self, frame_source, winStride=None, padding=None, scale=None):
+        """
+        Detects humans in every frame of the source.
+
+        :param frame_source: the FrameSource to read frames from
+        :return: generator of (frame, (bounding boxes, weights)) tuples
+        """
+        for frame in frame_source.frames():
+            boxes = self.detect(frame, winStride=winStride, padding=padding, scale=scale)
+            frame_source.frame_analysed()
+            yield (frame, boxes)
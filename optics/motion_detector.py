@@ -1,9 +1,26 @@
+from util.metrics import registry
+
 import cv2
+import numpy as np
+
+detect_seconds = registry.histogram("motion_detect_seconds", "time spent looking for motion in a frame")
+
 
 class MotionDetector:
 
-    def __init__(self, min_area=250):
+    def __init__(self, min_area=250, learning_rate=None):
+        """
+
+        :param min_area: minimum area (in pixels) of a region of motion
+        :param learning_rate: how quickly the background model used by update() adapts to new frames, in (0, 1].
+                              None compares every frame against the previous one instead of a running average.
+        """
         self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.background = None
+        # update() works in these buffers instead of allocating new ones for every frame
+        self._buffers = {}
+        self._blurred = 0
 
     def detect(self, frame1, frame2):
         """
@@ -15,20 +32,118 @@ class MotionDetector:
         :param frame2:
         :return: bounding boxes for detected motion
         """
-        # convert our frames to
-        gray_frame1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray_frame1 = cv2.GaussianBlur(gray_frame1, (21, 21), 0)
-        gray_frame2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-        gray_frame2 = cv2.GaussianBlur(gray_frame2, (21, 21), 0)
+        with detect_seconds.time():
+            # compute the diff and threshold it
+            frame_delta = cv2.absdiff(self.preprocess(frame1), self.preprocess(frame2))
+            return list(self.motion_rects(frame_delta))
+
+    def update(self, frame):
+        """
+        Checks for motion between the provided frame and the frames we have seen before.
 
-        # compute the diff and threshold it
-        frame_delta = cv2.absdiff(gray_frame1, gray_frame2)
-        thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
+        Unlike detect(), every frame is only converted and blurred once. Depending on learning_rate, we compare
+        against either the previous frame or a running average of the previous frames.
+        All the intermediate images are written into buffers that are reused between frames.
+
+        :param frame: bgr frame, or a grayscale one, ie the Y plane of a yuv capture
+        :return: bounding boxes for detected motion. empty for the first frame.
+        """
+        with detect_seconds.time():
+            return self._update(frame)
+
+    def _update(self, frame):
+        shape = frame.shape[:2]
+        if self.background is not None and self.background.shape != shape:
+            # the resolution changed, start over
+            self.reset()
+
+        # blur into whichever of the two buffers doesn't hold the previous frame
+        self._blurred = 1 - self._blurred
+        gray_frame = self.preprocess(frame, self._buffer("gray", shape),
+                                     self._buffer("blurred{}".format(self._blurred), shape))
+
+        if self.background is None:
+            if self.learning_rate is None:
+                self.background = gray_frame
+            else:
+                self.background = self._buffer("average", shape, np.float32)
+                self.background[:] = gray_frame
+            return []
+
+        frame_delta = self._buffer("delta", shape)
+        if self.learning_rate is None:
+            cv2.absdiff(self.background, gray_frame, dst=frame_delta)
+            self.background = gray_frame
+        else:
+            background = cv2.convertScaleAbs(self.background, dst=self._buffer("background", shape))
+            cv2.absdiff(gray_frame, background, dst=frame_delta)
+            cv2.accumulateWeighted(gray_frame, self.background, self.learning_rate)
+
+        return list(self.motion_rects(frame_delta, self._buffer("thresh", shape), self._buffer("dilated", shape)))
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def reset(self):
+        """
+        Forgets the background built up by update().
+
+        :return:
+        """
+        self.background = None
+        self._buffers = {}
+
+    @staticmethod
+    def preprocess(frame, gray=None, blurred=None):
+        """
+        Converts the frame to blurred grayscale, so that sensor noise doesn't show up as motion.
+
+        :param frame: bgr frame, or a grayscale one which is only blurred
+        :param gray: optional buffer to convert the frame into
+        :param blurred: optional buffer to blur the frame into
+        :return: blurred grayscale frame
+        """
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        return cv2.GaussianBlur(frame, (21, 21), 0, dst=blurred)
+
+    def motion_rects(self, frame_delta, thresh=None, dilated=None):
+        """
+        Finds regions of motion in the difference between two preprocessed frames.
+
+        :param frame_delta: absolute difference between two grayscale frames
+        :param thresh: optional buffer for the thresholded difference
+        :param dilated: optional buffer for the dilated threshold
+        :return: bounding boxes for detected motion
+        """
+        thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY, dst=thresh)[1]
 
         # dilate the thresholded image to fill in holes, then find contours
         # on thresholded image
-        thresh = cv2.dilate(thresh, None, iterations=2)
-        (_, cnts, _) = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        thresh = cv2.dilate(thresh, None, dst=dilated, iterations=2)
+        # opencv 3 returns (image, contours, hierarchy) and opencv 4 (contours, hierarchy)
+        cnts = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
 
         filtered = filter(lambda contour: cv2.contourArea(contour) > self.min_area, cnts)
         return map(lambda contour: cv2.boundingRect(contour), filtered)
+
+    def detect_source(self, frame_source):
+        """
+        Checks for motion between consecutive frames of the source.
+
+        :param frame_source: the FrameSource to read frames from
+        :return: generator of (frame, bounding boxes for detected motion) tuples
+        """
+        self.reset()
+        first = True
+        for frame in frame_source.frames():
+            rects = list(self.update(frame))
+            if first:
+                first = False
+                continue
+            frame_source.frame_analysed()
+            yield (frame, rects)
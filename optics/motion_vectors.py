@@ -0,0 +1,350 @@
+from optics.frame_source import FrameSource
+from util.metrics import registry
+
+import cv2
+import numpy as np
+import queue
+
+vector_detect_seconds = registry.histogram("motion_vector_detect_seconds",
+                                           "time spent looking for motion in the encoder's motion vectors")
+
+# layout of the motion vectors the pi's h264 encoder writes for every macroblock, see picamera.array.PiMotionArray
+MOTION_VECTOR_DTYPE = np.dtype([("x", "i1"), ("y", "i1"), ("sad", "u2")])
+
+MACROBLOCK_SIZE = 16
+
+
+def vector_shape(resolution):
+    """
+    :param resolution: (width, height) of the recorded video
+    :return: (rows, columns) of the motion vector array of a frame. the encoder adds one extra column.
+    """
+    (width, height) = resolution
+    return ((height + MACROBLOCK_SIZE - 1) // MACROBLOCK_SIZE, (width + MACROBLOCK_SIZE - 1) // MACROBLOCK_SIZE + 1)
+
+
+class MotionVectorDetector:
+    """
+    Finds motion in the motion vectors the gpu's h264 encoder computes anyway, instead of diffing frames on the cpu.
+
+    Every macroblock whose vector is long enough counts as moving, and neighbouring moving blocks are clustered
+    into bounding boxes in frame coordinates, like those of MotionDetector.
+    """
+
+    def __init__(self, min_area=250, min_magnitude=2, max_sad=None, min_blocks=2, resolution=None):
+        """
+
+        :param min_area: minimum area (in pixels) of a region of motion, counting only its moving macroblocks
+        :param min_magnitude: minimum length of a vector (in pixels) for its macroblock to count as moving
+        :param max_sad: ignore blocks whose sum of absolute differences is above this, ie where the encoder found
+                        no good match and the vector is noise. None to use every block.
+        :param min_blocks: minimum number of moving macroblocks in a region
+        :param resolution: (width, height) of the video, to clip the boxes to. None to not clip them.
+        """
+        self.min_area = min_area
+        self.min_magnitude = min_magnitude
+        self.max_sad = max_sad
+        self.min_blocks = min_blocks
+        self.resolution = resolution
+
+    def detect(self, vectors):
+        """
+        Checks for motion in the motion vectors of a frame.
+
+        :param vectors: MOTION_VECTOR_DTYPE array of (rows, columns) macroblocks
+        :return: bounding boxes for detected motion
+        """
+        with vector_detect_seconds.time():
+            return self.motion_rects(self.moving_blocks(vectors))
+
+    def update(self, vectors):
+        """
+        Same as detect(). The encoder already compares every frame against the previous one, so there is no
+        background to keep.
+
+        :param vectors:
+        :return: bounding boxes for detected motion
+        """
+        return self.detect(vectors)
+
+    def reset(self):
+        pass
+
+    def moving_blocks(self, vectors):
+        """
+        :param vectors: MOTION_VECTOR_DTYPE array of (rows, columns) macroblocks
+        :return: uint8 mask of the macroblocks that moved
+        """
+        x = vectors["x"].astype(np.int16)
+        y = vectors["y"].astype(np.int16)
+        moving = x * x + y * y >= self.min_magnitude * self.min_magnitude
+        if self.max_sad is not None:
+            moving &= vectors["sad"] <= self.max_sad
+        return moving.astype(np.uint8)
+
+    def motion_rects(self, mask):
+        """
+        Clusters the moving macroblocks into regions of motion.
+
+        :param mask: uint8 mask of the macroblocks that moved
+        :return: bounding boxes for detected motion, in pixels
+        """
+        # join blocks that are separated by a single still block, ie the still middle of a moving body
+        joined = cv2.dilate(mask, None, iterations=1)
+        (count, labels, stats, _) = cv2.connectedComponentsWithStats(joined, connectivity=8)
+        rects = []
+        for label in range(1, count):
+            (x, y, w, h) = stats[label, :4]
+            blocks = int(np.count_nonzero(mask[y:y + h, x:x + w][labels[y:y + h, x:x + w] == label]))
+            if blocks < self.min_blocks or blocks * MACROBLOCK_SIZE * MACROBLOCK_SIZE <= self.min_area:
+                continue
+            rect = [int(x) * MACROBLOCK_SIZE, int(y) * MACROBLOCK_SIZE, int(w) * MACROBLOCK_SIZE,
+                    int(h) * MACROBLOCK_SIZE]
+            if self.resolution is not None:
+                (width, height) = self.resolution
+                rect[2] = min(rect[2], width - rect[0])
+                rect[3] = min(rect[3], height - rect[1])
+            rects.append(tuple(rect))
+        return rects
+
+    def detect_source(self, vector_source):
+        """
+        Checks for motion in every array of the source.
+
+        :param vector_source: a FrameSource of motion vector arrays, ie a MotionVectorFileSource
+        :return: generator of (vectors, bounding boxes for detected motion) tuples
+        """
+        for vectors in vector_source.frames():
+            rects = self.detect(vectors)
+            vector_source.frame_analysed()
+            yield (vectors, rects)
+
+
+class MotionVectorFileSource(FrameSource):
+    """
+    Replays recorded motion vectors, either the raw motion_output of picamera or a .npy file of stacked arrays.
+    """
+
+    def __init__(self, path, resolution=(640, 480), max_frames=None):
+        """
+
+        :param path: the recording
+        :param resolution: (width, height) of the video the vectors were recorded with, only used for raw files
+        :param max_frames: stop after this many frames, None to read until the recording runs out
+        """
+        FrameSource.__init__(self, max_frames)
+        if path.endswith(".npy"):
+            self.vectors = np.load(path)
+            if self.vectors.dtype != MOTION_VECTOR_DTYPE:
+                self.vectors = self.vectors.view(MOTION_VECTOR_DTYPE)
+        else:
+            (rows, columns) = vector_shape(resolution)
+            self.vectors = np.fromfile(path, dtype=MOTION_VECTOR_DTYPE).reshape((-1, rows, columns))
+
+    def read(self):
+        if self.frame_count >= len(self.vectors):
+            return None
+        return self.vectors[self.frame_count]
+
+
+class SyntheticMotionVectorSource(FrameSource):
+    """
+    Generates the motion vectors of a blob moving back and forth, like SyntheticFrameSource, over noisy still blocks.
+    """
+
+    def __init__(self, resolution=(640, 480), max_frames=300, blob_radius=40, speed=8, noise=0.02, seed=0):
+        """
+
+        :param resolution: (width, height) of the video
+        :param max_frames: number of arrays to generate, None to generate forever
+        :param blob_radius: radius of the moving blob, in pixels
+        :param speed: pixels the blob moves per frame
+        :param noise: fraction of the still blocks that get a random vector of at most one pixel
+        :param seed: seed for the noise
+        """
+        FrameSource.__init__(self, max_frames)
+        self.resolution = resolution
+        self.blob_radius = blob_radius
+        self.speed = speed
+        self.noise = noise
+        self._random = np.random.RandomState(seed)
+
+        (rows, columns) = vector_shape(resolution)
+        (self._ys, self._xs) = np.mgrid[0:rows, 0:columns] * MACROBLOCK_SIZE + MACROBLOCK_SIZE // 2
+
+    def read(self):
+        (width, height) = self.resolution
+        travel = max(1, width - 2 * self.blob_radius)
+        offset = (self.frame_count * self.speed) % (2 * travel)
+        direction = 1 if offset < travel else -1
+        x = self.blob_radius + (offset if offset < travel else 2 * travel - offset)
+        y = height // 2
+
+        vectors = np.zeros(self._xs.shape, dtype=MOTION_VECTOR_DTYPE)
+        vectors["sad"] = self._random.randint(0, 200, vectors.shape)
+        noisy = self._random.random_sample(vectors.shape) < self.noise
+        vectors["x"][noisy] = self._random.randint(-1, 2, np.count_nonzero(noisy))
+        # the encoder stores where the block came from, ie the opposite of the direction of motion
+        blob = (self._xs - x) ** 2 + (self._ys - y) ** 2 <= self.blob_radius ** 2
+        vectors["x"][blob] = -direction * min(self.speed, 127)
+        vectors["sad"][blob] = self._random.randint(100, 600, np.count_nonzero(blob))
+        return vectors
+
+
+class CameraMotionVectorSource(FrameSource):
+    """
+    Records h264 from the pi camera to nowhere, only to read the motion vectors the encoder computes for every frame.
+    The gpu does all the work, so the cpu only sees an array of a few kilobytes per frame.
+
+    The encoder records from a splitter port of its own, so the camera session can capture frames for the person
+    detector from the video port at the same time.
+    """
+
+    def __init__(self, camera_session, record_path=None, timeout=5.0, max_timeouts=3, max_queued=2, splitter_port=1,
+                 max_frames=None):
+        """
+
+        :param camera_session: the CameraSession whose camera we record from
+        :param record_path: optional file to append the raw vectors to, to replay them with a MotionVectorFileSource
+        :param timeout: seconds to wait for the next array before checking that the encoder is still recording
+        :param max_timeouts: consecutive timeouts after which we give up on the encoder and raise
+        :param max_queued: arrays to keep while the consumer is behind, the oldest are dropped
+        :param splitter_port: splitter port to record from. the session captures frames from port 0.
+        :param max_frames: stop after this many frames, None to record until paused
+        """
+        FrameSource.__init__(self, max_frames)
+        self.camera_session = camera_session
+        self.record_path = record_path
+        self.timeout = timeout
+        self.max_timeouts = max_timeouts
+        self.splitter_port = splitter_port
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._output = None
+        self._record_file = None
+
+    def resume(self):
+        if self._output is not None:
+            return
+        # picamera is only available on the pi
+        from picamera.array import PiMotionAnalysis
+
+        source = self
+
+        class Analysis(PiMotionAnalysis):
+            def analyse(self, vectors):
+                if source._record_file is not None:
+                    vectors.tofile(source._record_file)
+                try:
+                    source._queue.put_nowait(vectors)
+                except queue.Full:
+                    # the consumer is behind, drop the older array rather than block the encoder
+                    try:
+                        source._queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    source._queue.put_nowait(vectors)
+
+        self.camera_session.open()
+        camera = self.camera_session.camera
+        if self.record_path is not None:
+            self._record_file = open(self.record_path, "ab")
+        self._output = Analysis(camera)
+        camera.start_recording("/dev/null", format="h264", motion_output=self._output,
+                               splitter_port=self.splitter_port)
+
+    def read(self):
+        """
+        :return: the motion vectors of the next frame. frames() already times this as the capture.
+        :raises: IOError if the encoder produced nothing for max_timeouts timeouts in a row
+        """
+        self.resume()
+        for attempt in range(self.max_timeouts):
+            try:
+                return self._queue.get(timeout=self.timeout)
+            except queue.Empty:
+                # one slow frame isn't the end of the stream, but an encoder that failed is. picamera raises its
+                # error from here.
+                self.camera_session.camera.wait_recording(0, splitter_port=self.splitter_port)
+                print("no motion vectors after {:g}s, waiting again".format(self.timeout))
+        raise IOError("the encoder produced no motion vectors for {:g}s".format(self.timeout * self.max_timeouts))
+
+    def pending(self):
+        """
+        :return: the motion vectors of every frame the encoder produced since the last call, oldest first. waits for
+                 the next frame if there are none yet.
+        """
+        self.resume()
+        arrays = []
+        while True:
+            try:
+                arrays.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(arrays) == 0:
+            arrays.append(self.read())
+        return arrays
+
+    def discard(self):
+        """
+        Drops the arrays nobody read yet.
+
+        :return:
+        """
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def pause(self):
+        """
+        Stops recording while keeping the camera open.
+
+        :return:
+        """
+        if self._output is not None:
+            self.camera_session.camera.stop_recording(splitter_port=self.splitter_port)
+            self._output = None
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+    def close(self):
+        self.pause()
+
+
+class CameraMotionVectorDetector:
+    """
+    Stands in for a MotionDetector in scan(), watch() and the pipeline. Instead of diffing the captured frames, it
+    looks for motion in the vectors the encoder produced for every frame since the previous one, so frames skipped
+    by the scheduler still count.
+    """
+
+    def __init__(self, vector_source, detector):
+        """
+
+        :param vector_source: the CameraMotionVectorSource recording next to the captured frames
+        :param detector: the MotionVectorDetector to find motion in the vectors with
+        """
+        self.vector_source = vector_source
+        self.detector = detector
+
+    def update(self, frame):
+        """
+        :param frame: the captured frame, only telling us that another frame arrived
+        :return: bounding boxes for the motion in any of the frames since the last call
+        """
+        arrays = self.vector_source.pending()
+        with vector_detect_seconds.time():
+            mask = self.detector.moving_blocks(arrays[0])
+            for vectors in arrays[1:]:
+                mask |= self.detector.moving_blocks(vectors)
+            return self.detector.motion_rects(mask)
+
+    def reset(self):
+        """
+        Forgets the vectors of the frames from before, ie while the lights were on.
+
+        :return:
+        """
+        self.vector_source.discard()
@@ -0,0 +1,174 @@
+from multiprocessing import cpu_count, get_all_start_methods, get_context
+from multiprocessing.sharedctypes import RawArray
+from optics.boxes import group_rectangles
+from optics.human_detector import HumanDetector
+from threading import Lock
+
+import ctypes
+import cv2
+import numpy as np
+
+# opencv resizes the pyramid levels with this interpolation
+_interpolation = getattr(cv2, "INTER_LINEAR_EXACT", cv2.INTER_LINEAR)
+
+# the pool may be started while other threads hold locks, ie the hue command queue or the camera, and a forked
+# worker would inherit those locks held forever. forkserver workers fork from a clean single threaded process.
+_context = get_context("forkserver" if "forkserver" in get_all_start_methods() else "spawn")
+
+# state of a worker process, set up once by _init_worker
+_worker_hog = None
+_worker_buffer = None
+
+
+def _init_worker(buffer):
+    global _worker_hog, _worker_buffer
+    # every worker already has a core to itself, so we don't want opencv spawning threads of its own
+    cv2.setNumThreads(1)
+    _worker_hog = cv2.HOGDescriptor()
+    _worker_hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    _worker_buffer = buffer
+
+
+def _detect_levels(shape, scales, winStride, padding):
+    """
+    Runs the detector over some levels of the scale pyramid of the frame in shared memory.
+
+    :param shape: shape of the frame in the shared buffer
+    :param scales: factors to scale the frame down by, one per pyramid level
+    :return: list of (x, y, w, h, weight) detections, in the coordinates of the frame
+    """
+    image = np.frombuffer(_worker_buffer, dtype=np.uint8, count=int(np.prod(shape))).reshape(shape)
+    (height, width) = shape[:2]
+    (win_width, win_height) = _worker_hog.winSize
+
+    detections = []
+    for scale in scales:
+        size = (int(round(width / scale)), int(round(height / scale)))
+        level = image if size == (width, height) else cv2.resize(image, size, interpolation=_interpolation)
+        (locations, weights) = _worker_hog.detect(level, winStride=winStride, padding=padding)
+        for ((x, y), weight) in zip(np.reshape(locations, (-1, 2)), np.ravel(weights)):
+            detections.append((int(round(x * scale)), int(round(y * scale)),
+                               int(round(win_width * scale)), int(round(win_height * scale)), float(weight)))
+    return detections
+
+
+class ParallelHumanDetector(HumanDetector):
+    """
+    HumanDetector that spreads the levels of the HOG scale pyramid over a pool of worker processes.
+
+    Frames are handed to the workers through a shared memory buffer rather than being pickled, and the
+    detections from all levels are grouped the same way detectMultiScale groups them, so the results match
+    the single process detector.
+    """
+
+    def __init__(self, width=350, workers=None, max_frame_bytes=640 * 480 * 3, winStride=(4,4), padding=(6,6),
+                 scale=1.05):
+        """
+
+        :param width: images are scaled down to at most this width before running the detector
+        :param workers: number of worker processes, defaults to the number of cores
+        :param max_frame_bytes: size of the shared frame buffer. it is grown if a larger frame comes along.
+        :param winStride: default step of the detection window
+        :param padding: default padding around the image
+        :param scale: default factor between the levels of the scale pyramid
+        """
+        HumanDetector.__init__(self, width, winStride, padding, scale)
+        self.workers = workers if workers is not None else cpu_count()
+        self._buffer = None
+        self._pool = None
+        self._lock = Lock()
+        self._allocate(max_frame_bytes)
+
+    def detect_multiscale(self, image, winStride=(4,4), padding=(6,6), scale=1.05):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        levels = self.pyramid_scales(image.shape, scale)
+        with self._lock:
+            if image.nbytes > len(self._buffer):
+                self._allocate(image.nbytes)
+            np.frombuffer(self._buffer, dtype=np.uint8, count=image.size)[:] = image.ravel()
+            tasks = [(image.shape, scales, tuple(winStride), tuple(padding))
+                     for scales in self.split_levels(levels, self.workers) if len(scales) > 0]
+            results = self._pool.starmap(_detect_levels, tasks)
+
+        detections = [detection for result in results for detection in result]
+        (rects, weights) = group_rectangles([d[:4] for d in detections], [d[4] for d in detections])
+        (rects, weights) = self.clip_rects(rects, weights, image.shape)
+        return (np.array(rects, dtype=int).reshape(-1, 4), np.array(weights, dtype=float))
+
+    @staticmethod
+    def clip_rects(rects, weights, shape):
+        """
+        Padding lets detection windows hang over the edge of the image. Like detectMultiScale, we clip the grouped
+        rects to the image and drop the ones that end up empty.
+
+        :param rects: list of (x, y, w, h)
+        :param weights: weight of every rect
+        :param shape: shape of the image
+        :return: tuple of clipped rects and their weights
+        """
+        (height, width) = shape[:2]
+        clipped_rects = []
+        clipped_weights = []
+        for ((x, y, w, h), weight) in zip(rects, weights):
+            (left, top) = (max(0, x), max(0, y))
+            (right, bottom) = (min(width, x + w), min(height, y + h))
+            if right > left and bottom > top:
+                clipped_rects.append((left, top, right - left, bottom - top))
+                clipped_weights.append(weight)
+        return (clipped_rects, clipped_weights)
+
+    def pyramid_scales(self, shape, scale):
+        """
+        Computes the scale pyramid the same way detectMultiScale does.
+
+        :param shape: shape of the image
+        :param scale: factor between consecutive levels
+        :return: list of factors to scale the image down by, one per level
+        """
+        (height, width) = shape[:2]
+        (win_width, win_height) = self.hog.winSize
+        scales = []
+        level_scale = 1.0
+        for level in range(self.hog.nlevels):
+            if int(round(width / level_scale)) < win_width or int(round(height / level_scale)) < win_height:
+                break
+            scales.append(level_scale)
+            if scale <= 1:
+                break
+            level_scale *= scale
+        return scales if len(scales) > 0 else [1.0]
+
+    @staticmethod
+    def split_levels(scales, workers):
+        """
+        Splits the pyramid levels into one batch per worker, balancing the number of pixels each worker scans.
+
+        :param scales: the pyramid levels
+        :param workers: number of batches
+        :return: list of lists of levels
+        """
+        batches = [[] for i in range(workers)]
+        loads = [0.0] * workers
+        # the largest levels first, each to the least loaded worker
+        for scale in sorted(scales):
+            worker = loads.index(min(loads))
+            batches[worker].append(scale)
+            loads[worker] += 1.0 / (scale * scale)
+        return batches
+
+    def close(self):
+        """
+        Stops the worker processes.
+
+        :return:
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _allocate(self, nbytes):
+        # the workers map the buffer when they start, so a new buffer needs new workers
+        self.close()
+        self._buffer = RawArray(ctypes.c_uint8, nbytes)
+        self._pool = _context.Pool(processes=self.workers, initializer=_init_worker, initargs=(self._buffer,))
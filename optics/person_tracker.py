@@ -0,0 +1,158 @@
+from optics.boxes import rects_overlap
+from util.metrics import registry
+
+import cv2
+import numpy as np
+import time
+
+
+def _frames(result):
+    return registry.counter("person_tracker_frames", "frames the person tracker answered", labels={"result": result})
+
+
+class Track:
+    """
+    A confirmed person box, and the corner points inside it we follow from frame to frame.
+    """
+
+    def __init__(self, box, weight, points):
+        self.box = box
+        self.weight = weight
+        self.points = points
+        self.confidence = 1.0
+
+
+class TrackingHumanDetector:
+    """
+    Follows the people a HumanDetector found with sparse optical flow, so that the expensive HOG detector only runs
+    every few frames, or as soon as we lose track of someone.
+
+    Has the detect_regions() method of a HumanDetector, so it can stand in for one in scan() and the pipelines.
+    """
+
+    def __init__(self, detector, verify_every=10, min_confidence=0.5, min_points=5, max_points=50, max_gap=2.0,
+                 clock=time.time):
+        """
+
+        :param detector: the HumanDetector to confirm people with
+        :param verify_every: run the detector again after tracking for this many frames
+        :param min_confidence: fraction of a track's points we must still follow, below it the detector runs again
+        :param min_points: fewest points we need to follow a box at all
+        :param max_points: most corner points to follow inside a box
+        :param max_gap: seconds between frames after which we forget the tracks, ie after the camera was paused
+        :param clock: function returning the current time in seconds
+        """
+        self.detector = detector
+        self.verify_every = verify_every
+        self.min_confidence = min_confidence
+        self.min_points = min_points
+        self.max_points = max_points
+        self.max_gap = max_gap
+        self.clock = clock
+
+        self.tracks = []
+        self.tracked_frames = 0
+        self._previous = None
+        self._previous_at = None
+
+    def detect_regions(self, image, rects, **kwargs):
+        """
+        Follows the tracked people into this frame, or runs the detector when it is time to check on them. While
+        following, the detector still runs on the regions of motion that don't touch a tracked box.
+
+        :param image: bgr frame
+        :param rects: regions of motion, passed on to the detector
+        :param kwargs: passed on to the detector
+        :return: (bounding boxes, weights) of the people in the frame. tracked boxes keep the weight they were
+                 detected with.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        now = self.clock()
+        if self._previous is None or self._previous.shape != gray.shape or now - self._previous_at > self.max_gap:
+            self.tracks = []
+
+        lost = False
+        if len(self.tracks) > 0:
+            lost = not self._follow(gray)
+
+        if len(self.tracks) == 0 or lost or self.tracked_frames >= self.verify_every:
+            (boxes, weights) = self.detector.detect_regions(image, rects, **kwargs)
+            self.tracks = self._start_tracks(gray, boxes, weights)
+            self.tracked_frames = 0
+            _frames("detected").inc()
+        else:
+            (boxes, weights) = ([track.box for track in self.tracks], [track.weight for track in self.tracks])
+            # someone who just walked in moves away from the people we follow, and shouldn't wait for the next check
+            untracked = [rect for rect in rects if not any(rects_overlap(rect, track.box) for track in self.tracks)]
+            if len(untracked) > 0:
+                (found, found_weights) = self.detector.detect_regions(image, untracked, **kwargs)
+                self.tracks.extend(self._start_tracks(gray, found, found_weights))
+                boxes.extend(tuple(int(v) for v in box) for box in found)
+                weights.extend(found_weights)
+                _frames("searched").inc()
+            else:
+                _frames("tracked").inc()
+            self.tracked_frames += 1
+
+        self._previous = gray
+        self._previous_at = now
+        return (boxes, weights)
+
+    def detect(self, image, **kwargs):
+        """
+        Runs the detector on the whole frame, and forgets the tracks.
+        """
+        self.reset()
+        return self.detector.detect(image, **kwargs)
+
+    def reset(self):
+        self.tracks = []
+        self.tracked_frames = 0
+        self._previous = None
+
+    def _start_tracks(self, gray, boxes, weights):
+        """
+        :return: a Track for every detected box with enough corners to follow
+        """
+        tracks = [Track(tuple(int(v) for v in box), weight, self._corners(gray, box))
+                  for (box, weight) in zip(boxes, weights)]
+        return [track for track in tracks if len(track.points) >= self.min_points]
+
+    def _corners(self, gray, box):
+        (x, y, w, h) = [int(v) for v in box]
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        mask[max(0, y):y + h, max(0, x):x + w] = 255
+        points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 3, mask=mask)
+        return points if points is not None else np.empty((0, 1, 2), dtype=np.float32)
+
+    def _follow(self, gray):
+        """
+        Moves every track by the median flow of its points, checking the flow backwards to drop bad points.
+        Boxes are clipped to the frame, and tracks whose box left the frame entirely are dropped.
+
+        :param gray: the new grayscale frame
+        :return: False iff we lost a track
+        """
+        (height, width) = gray.shape[:2]
+        following = []
+        for track in self.tracks:
+            (moved, status, _) = cv2.calcOpticalFlowPyrLK(self._previous, gray, track.points, None)
+            (back, back_status, _) = cv2.calcOpticalFlowPyrLK(gray, self._previous, moved, None)
+            error = np.linalg.norm((track.points - back).reshape(-1, 2), axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < 1.0)
+            track.confidence = float(np.count_nonzero(good)) / max(1, len(track.points))
+            if np.count_nonzero(good) < self.min_points or track.confidence < self.min_confidence:
+                return False
+
+            (dx, dy) = np.median((moved - track.points).reshape(-1, 2)[good], axis=0)
+            (x, y, w, h) = track.box
+            (x, y) = (int(round(x + dx)), int(round(y + dy)))
+            (left, top, right, bottom) = (max(0, x), max(0, y), min(width, x + w), min(height, y + h))
+            if right <= left or bottom <= top:
+                # they walked out of view
+                continue
+            track.box = (left, top, right - left, bottom - top)
+            track.points = moved[good].reshape(-1, 1, 2)
+            following.append(track)
+        self.tracks = following
+        return True
@@ -0,0 +1,191 @@
+from model.hue_state_change import HueStateChangeEvent
+from optics.fusion import DetectionFusion
+from pipeline.stage import LatestQueue, Stage, StageStats
+from threading import Event, Thread
+from util.metrics import observe_when_done, registry
+
+import time
+
+light_seconds = registry.histogram("motion_to_light_seconds",
+                                   "time from seeing motion to the bridge acknowledging the lights are on")
+
+
+class DetectionPipeline:
+    """
+    Runs the same decisions as main.scan(), but with capture, motion detection, person detection and the hue calls
+    on separate threads connected by small queues that drop old frames. A slow person check or bridge call no
+    longer holds up the camera, and decisions are always made on recent frames.
+
+        capture -> motion -> detector -> actuator
+    """
+
+    def __init__(self, frame_source, hue, strategy, motion_detector, human_detector, human_threshold=0.2,
+                 max_age=1.0, name=None, fusion=None):
+        """
+
+        :param frame_source: the FrameSource to read frames from
+        :param hue: the HueWrapper to control the lights with
+        :param strategy: the HueStrategy for the group we are controlling
+        :param motion_detector: a MotionDetector
+        :param human_detector: a HumanDetector
+        :param human_threshold: minimum confidence of a human detection, see DetectionFusion
+        :param max_age: seconds after capture that a frame is still worth processing
+        :param name: optional name prefixed to the names of the stages, ie when running several pipelines
+        :param fusion: the DetectionFusion combining person boxes with motion, a default one is created if None
+        """
+        self.frame_source = frame_source
+        self.hue = hue
+        self.strategy = strategy
+        self.motion_detector = motion_detector
+        self.human_detector = human_detector
+        self.human_threshold = human_threshold
+        self.name = name
+        self.fusion = fusion if fusion is not None else DetectionFusion()
+
+        self.motion_queue = LatestQueue(maxsize=2)
+        self.detector_queue = LatestQueue(maxsize=1)
+        self.actuator_queue = LatestQueue(maxsize=4)
+        self.capture_stats = StageStats()
+        prefix = name + "-" if name is not None else ""
+        self.stages = [
+            Stage(prefix + "motion", self._motion, self.motion_queue, self.detector_queue, max_age, self._fail),
+            Stage(prefix + "detector", self._detect, self.detector_queue, self.actuator_queue, max_age, self._fail),
+            Stage(prefix + "actuator", self._actuate, self.actuator_queue, on_error=self._fail),
+        ]
+
+        self._done = Event()
+        # unlike _done, which run() clears, this stays set until resume() so a stop() just before run() isn't lost
+        self._stopping = Event()
+        self._error = None
+        self._capture_thread = None
+        # set once the motion detector has seen a frame to compare the next ones with
+        self._primed = False
+
+    def run(self):
+        """
+        Runs the pipeline until we turn the lights on, find motion while they are already on, the frame source runs
+        out, or stop() is called.
+
+        :return: HueStateChangeEvent describing how long to sleep for
+        """
+        print("scanning video stream with pipeline...")
+        self._done.clear()
+        if self._stopping.is_set():
+            return HueStateChangeEvent(self.strategy.sleep_when_on)
+        self._error = None
+        self.motion_detector.reset()
+        self._primed = False
+        for stage in self.stages:
+            stage.start()
+        self._capture_thread = Thread(target=self._capture,
+                                      name=self.name + "-capture" if self.name is not None else "capture")
+        self._capture_thread.daemon = True
+        self._capture_thread.start()
+
+        self._done.wait()
+
+        self._capture_thread.join()
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            stage.join()
+        if self._error is not None:
+            raise self._error
+        return HueStateChangeEvent(self.strategy.sleep_when_on)
+
+    def stop(self):
+        """
+        Makes the current run() return, and every later one return straight away until resume() is called.
+
+        :return:
+        """
+        self._stopping.set()
+        self._done.set()
+
+    def resume(self):
+        self._stopping.clear()
+
+    def stats(self):
+        """
+        :return: dict of stage name to its queue depth, dropped frames, processed frames and latency
+        """
+        stats = {"capture": dict(self.capture_stats.as_dict(), queue_depth=0, dropped=0)}
+        for stage in self.stages:
+            stats[stage.name] = dict(stage.stats.as_dict(),
+                                     queue_depth=stage.input_queue.depth(), dropped=stage.input_queue.dropped)
+        return stats
+
+    def _fail(self, error):
+        self._error = error
+        self._done.set()
+
+    def _capture(self):
+        stream = self.frame_source.frames()
+        try:
+            before = time.time()
+            for frame in stream:
+                now = time.time()
+                self.capture_stats.record(now - before)
+                self.motion_queue.put((now, frame))
+                if self._done.is_set():
+                    break
+                before = time.time()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # close the generator on this thread, so the camera can be paused as soon as run() returns
+            stream.close()
+        if self.frame_source.exhausted:
+            # give the other stages a moment to finish the last frames
+            self._wait_for_idle()
+            self._done.set()
+
+    def _motion(self, frame):
+        motion_rects = list(self.motion_detector.update(frame))
+        if not self._primed:
+            # like scan(), the first frame has nothing to compare with, so no motion doesn't mean an empty room
+            self._primed = True
+            return None
+        self.frame_source.frame_analysed()
+        if len(motion_rects) > 0:
+            print("found motion {}".format(motion_rects))
+            # the lights are already on and we found motion. leave them on and go back to sleep.
+            if self.hue.is_group_on(self.strategy.hue_group):
+                self._done.set()
+                return None
+            return (time.time(), frame, motion_rects)
+
+        if self.hue.is_group_on(self.strategy.hue_group):
+            self.actuator_queue.put((time.time(), ("off", None)))
+        return None
+
+    def _detect(self, detection):
+        (motion_seen_at, frame, motion_rects) = detection
+        (human_rects, human_weights) = self.human_detector.detect_regions(frame, motion_rects)
+        fused = self.fusion.fuse(human_rects, human_weights, motion_rects)
+        if fused.score > self.human_threshold:
+            return ("on", motion_seen_at)
+        elif len(fused.boxes) > 0:
+            print("found humans with confidence {:.2f} below threshold {} (likely false positive)".format(
+                fused.score, self.human_threshold))
+        return None
+
+    def _actuate(self, action):
+        (command, motion_seen_at) = action
+        group = self.strategy.hue_group
+        if command == "on":
+            print("found humans above threshold {}, turning on {} lights".format(self.human_threshold, group))
+            future = self.hue.set_group_state(group, on=True, brightness_pct=self.strategy.brightness())
+            observe_when_done(light_seconds, future, motion_seen_at)
+            self._done.set()
+        elif command == "off" and self.hue.is_group_on(group):
+            print("turning off {} lights".format(group))
+            self.hue.turn_group_off(group)
+
+    def _wait_for_idle(self, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self._done.is_set():
+            # stages hand their results on before they finish an item, so checking them in order is enough
+            if all(stage.idle() for stage in self.stages):
+                return
+            time.sleep(0.01)
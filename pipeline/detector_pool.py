@@ -0,0 +1,116 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from util.metrics import registry
+
+import time
+
+
+class FairDetectorPool:
+    """
+    Shares a few person detectors between several zones.
+
+    Every zone has its own queue of requests, and the workers serve the zones round robin, so a zone with a lot of
+    motion gets at most its fair share of the detectors and never starves the quiet zones.
+    """
+
+    def __init__(self, detectors):
+        """
+
+        :param detectors: the HumanDetectors to share, one worker thread is started for each
+        """
+        self.detectors = detectors
+        self._queues = OrderedDict()
+        self._condition = Condition()
+        self._closed = False
+        self._threads = []
+        for (i, detector) in enumerate(detectors):
+            thread = Thread(target=self._run, args=(detector,), name="detector-{}".format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, zone, image, rects, **kwargs):
+        """
+        Queues a detect_regions() call for the zone.
+
+        :param zone: name of the zone the request is for
+        :param image:
+        :param rects: regions of motion to search
+        :param kwargs: passed on to detect_regions()
+        :return: a Future resolving to the (bounding boxes, weights) of detect_regions()
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("detector pool is closed")
+            if zone not in self._queues:
+                self._queues[zone] = deque()
+            self._queues[zone].append((time.time(), image, rects, kwargs, future))
+            self._condition.notify()
+        return future
+
+    def client(self, zone):
+        """
+        :param zone: name of the zone
+        :return: an object with the detect_regions() method of a HumanDetector, that runs on the shared detectors
+        """
+        return ZoneDetector(self, zone)
+
+    def pending(self):
+        """
+        :return: dict of zone to the number of requests waiting for a detector
+        """
+        with self._condition:
+            return dict((zone, len(queue)) for (zone, queue) in self._queues.items())
+
+    def close(self):
+        """
+        Finishes the queued requests and stops the workers.
+
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self):
+        with self._condition:
+            while not self._closed and all(len(queue) == 0 for queue in self._queues.values()):
+                self._condition.wait()
+            for (zone, queue) in self._queues.items():
+                if len(queue) > 0:
+                    # served zones go to the back of the line
+                    self._queues.move_to_end(zone)
+                    return (zone, queue.popleft())
+            return None
+
+    def _run(self, detector):
+        while True:
+            request = self._next()
+            if request is None:
+                return
+            (zone, (submitted_at, image, rects, kwargs, future)) = request
+            registry.histogram("detector_queue_seconds", "time zones wait for a shared person detector",
+                               labels={"zone": zone}).observe(time.time() - submitted_at)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(detector.detect_regions(image, rects, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class ZoneDetector:
+    """
+    Stands in for a HumanDetector in a zone's DetectionPipeline, and runs the detections on the shared pool.
+    """
+
+    def __init__(self, pool, zone):
+        self.pool = pool
+        self.zone = zone
+
+    def detect_regions(self, image, rects, **kwargs):
+        return self.pool.submit(self.zone, image, rects, **kwargs).result()
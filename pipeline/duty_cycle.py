@@ -0,0 +1,103 @@
+from util.metrics import registry
+
+import time
+
+IDLE = "idle"
+ACTIVE = "active"
+WATCH = "watch"
+
+
+class DutyCycleScheduler:
+    """
+    Decides how often to capture and analyse frames.
+
+    We analyse frames at a low rate while the room is idle, raise the rate for a while after we see motion, and
+    keep a slow motion-only watch while the lights are on. Whatever the mode, the rate is capped so that analysing
+    frames takes at most cpu_budget of a core, based on a moving average of how long frames took to analyse.
+    """
+
+    def __init__(self, idle_rate=1.0, active_rate=4.0, watch_rate=0.5, active_time=15.0, cpu_budget=0.5,
+                 smoothing=0.2, clock=time.time, sleep=time.sleep):
+        """
+
+        :param idle_rate: frames per second while there is no motion
+        :param active_rate: frames per second for active_time seconds after the last motion
+        :param watch_rate: frames per second of the motion watch while the lights are on
+        :param active_time: seconds after the last motion we stay at the active rate
+        :param cpu_budget: fraction of a core we may spend analysing frames
+        :param smoothing: weight of the newest frame in the moving average of the analysis time
+        :param clock: function returning the current time in seconds
+        :param sleep: function sleeping for a number of seconds
+        """
+        self.rates = {IDLE: idle_rate, ACTIVE: active_rate, WATCH: watch_rate}
+        self.active_time = active_time
+        self.cpu_budget = cpu_budget
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self.frame_cost = None
+        self.last_motion = None
+
+        self._rate_gauge = registry.gauge("scheduler_frame_rate", "frames per second we currently analyse")
+        self._cost_gauge = registry.gauge("scheduler_frame_cost_seconds", "moving average of the analysis time")
+
+    def record(self, cost, motion=False):
+        """
+        Called after every analysed frame.
+
+        :param cost: seconds it took to analyse the frame
+        :param motion: whether we found motion in the frame
+        :return:
+        """
+        if self.frame_cost is None:
+            self.frame_cost = cost
+        else:
+            self.frame_cost += self.smoothing * (cost - self.frame_cost)
+        self._cost_gauge.set(self.frame_cost)
+        if motion:
+            self.last_motion = self.clock()
+
+    def mode(self, lights_on=False):
+        """
+        :param lights_on: whether the lights we control are on
+        :return: WATCH while the lights are on, ACTIVE shortly after motion and IDLE otherwise
+        """
+        if lights_on:
+            return WATCH
+        if self.last_motion is not None and self.clock() - self.last_motion < self.active_time:
+            return ACTIVE
+        return IDLE
+
+    def rate(self, mode):
+        """
+        :param mode: IDLE, ACTIVE or WATCH
+        :return: frames per second to analyse in the mode, within the cpu budget
+        """
+        rate = self.rates[mode]
+        if self.frame_cost is not None and self.frame_cost > 0:
+            rate = min(rate, self.cpu_budget / self.frame_cost)
+        self._rate_gauge.set(rate)
+        return rate
+
+    def max_rate(self):
+        """
+        :return: the highest rate any mode wants, ie the framerate to capture at
+        """
+        return max(self.rates.values())
+
+    def wait(self, mode, started, stop_event=None):
+        """
+        Sleeps until the next frame is due.
+
+        :param mode: the current mode
+        :param started: clock() time we started analysing the last frame at
+        :param stop_event: optional Event that ends the wait early
+        :return: True iff the stop event was set
+        """
+        delay = started + 1.0 / self.rate(mode) - self.clock()
+        if delay <= 0:
+            return stop_event is not None and stop_event.is_set()
+        if stop_event is not None:
+            return stop_event.wait(delay)
+        self.sleep(delay)
+        return False
@@ -0,0 +1,180 @@
+from collections import deque
+from threading import Condition, Event, Lock, Thread
+from util.metrics import registry
+
+import time
+
+
+class LatestQueue:
+    """
+    Bounded queue that never blocks producers. When it is full, the oldest item is dropped to make room,
+    so consumers that fall behind always work on the freshest items.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._in_flight = 0
+        self._condition = Condition()
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: seconds to wait for an item
+        :return: the oldest item in the queue, or None if none arrived within the timeout
+        """
+        with self._condition:
+            if len(self._items) == 0:
+                self._condition.wait(timeout)
+            if len(self._items) == 0:
+                return None
+            self._in_flight += 1
+            return self._items.popleft()
+
+    def task_done(self):
+        """
+        Called by consumers once they are done with an item they got from the queue.
+
+        :return:
+        """
+        with self._condition:
+            self._in_flight -= 1
+
+    def depth(self):
+        with self._condition:
+            return len(self._items)
+
+    def unfinished(self):
+        """
+        :return: number of items that are queued or still being worked on
+        """
+        with self._condition:
+            return len(self._items) + self._in_flight
+
+
+class StageStats:
+    """
+    Counters and latency for a single pipeline stage.
+    """
+
+    def __init__(self):
+        self.processed = 0
+        self.stale = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self._lock = Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.processed += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_latency += latency
+
+    def record_stale(self):
+        with self._lock:
+            self.stale += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "stale": self.stale,
+                "last_latency": self.last_latency,
+                "mean_latency": self.total_latency / self.processed if self.processed > 0 else 0.0,
+                "max_latency": self.max_latency,
+            }
+
+
+class Stage:
+    """
+    Runs a function over the items of an input queue on its own thread.
+
+    Items are (timestamp, payload) tuples, where the timestamp is when the frame they belong to was captured.
+    Items older than max_age are dropped without being processed. Whatever the function returns, other than None,
+    is passed on to the output queue with the original timestamp.
+    """
+
+    def __init__(self, name, function, input_queue, output_queue=None, max_age=None, on_error=None):
+        """
+
+        :param name: name of the stage, used for the thread and in the stats
+        :param function: called with the payload of every fresh item
+        :param input_queue: LatestQueue to read items from
+        :param output_queue: LatestQueue to pass results on to, if any
+        :param max_age: seconds after capture an item is still worth processing, None to process everything
+        :param on_error: called with the exception if the function raises. the stage stops after an error.
+        """
+        self.name = name
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.max_age = max_age
+        self.on_error = on_error
+        self.stats = StageStats()
+        self.latency = registry.histogram("pipeline_stage_seconds", "time a pipeline stage spends on an item",
+                                          labels={"stage": name})
+        registry.gauge("pipeline_queue_depth", "items waiting for a pipeline stage", labels={"stage": name},
+                       function=input_queue.depth)
+        registry.gauge("pipeline_dropped_items", "items a pipeline stage never saw because its queue was full",
+                       labels={"stage": name}, function=lambda: input_queue.dropped)
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def idle(self):
+        """
+        :return: True iff the stage has nothing queued and is not processing an item
+        """
+        return self.input_queue.unfinished() == 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            item = self.input_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            try:
+                self._process(item)
+            except Exception as e:
+                print("stage {} failed: {}".format(self.name, e))
+                if self.on_error is not None:
+                    self.on_error(e)
+                return
+            finally:
+                self.input_queue.task_done()
+
+    def _process(self, item):
+        (captured_at, payload) = item
+        if self.max_age is not None and time.time() - captured_at > self.max_age:
+            # we are behind, a newer frame will be along shortly
+            self.stats.record_stale()
+            return
+
+        before = time.time()
+        result = self.function(payload)
+        latency = time.time() - before
+        self.stats.record(latency)
+        self.latency.observe(latency)
+        if result is not None and self.output_queue is not None:
+            self.output_queue.put((captured_at, result))
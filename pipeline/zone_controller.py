@@ -0,0 +1,121 @@
+from pipeline.detection_pipeline import DetectionPipeline
+from pipeline.detector_pool import FairDetectorPool
+from optics.motion_detector import MotionDetector
+from optics.person_tracker import TrackingHumanDetector
+from threading import Event, Thread
+
+
+class Zone:
+    """
+    A frame source watching the lights of one hue group.
+    """
+
+    def __init__(self, name, frame_source, strategy, min_area=300, human_threshold=0.2):
+        """
+
+        :param name: name of the zone, used for the threads, the logs and the metrics
+        :param frame_source: the FrameSource watching the zone
+        :param strategy: the HueStrategy of the group the zone controls
+        :param min_area: minimum area (in pixels) of a region of motion
+        :param human_threshold: minimum weight of a human detection
+        """
+        self.name = name
+        self.frame_source = frame_source
+        self.strategy = strategy
+        self.min_area = min_area
+        self.human_threshold = human_threshold
+        self.pipeline = None
+        self.scans = 0
+        self.errors = 0
+
+
+class ZoneController:
+    """
+    Runs several zones in one process. Every zone has its own pipeline and motion detector, but they share the
+    HueWrapper, and with it the bridge connection, and a FairDetectorPool for the expensive person detection.
+    """
+
+    def __init__(self, zones, hue, detectors, retry_delay=10.0, track_every=0):
+        """
+
+        :param zones: list of Zones
+        :param hue: the HueWrapper shared by all zones
+        :param detectors: the HumanDetectors shared by all zones
+        :param retry_delay: seconds to wait before restarting a zone that failed
+        :param track_every: if above 0, every zone tracks the people it found and only asks the shared detectors
+                            again after this many tracked frames
+        """
+        self.zones = zones
+        self.hue = hue
+        self.pool = FairDetectorPool(detectors)
+        self.retry_delay = retry_delay
+        self._stop = Event()
+        self._threads = []
+
+        for zone in zones:
+            detector = self.pool.client(zone.name)
+            if track_every > 0:
+                # the tracks belong to the zone's camera, so every zone gets its own tracker
+                detector = TrackingHumanDetector(detector, verify_every=track_every)
+            zone.pipeline = DetectionPipeline(zone.frame_source, hue, zone.strategy,
+                                              MotionDetector(min_area=zone.min_area), detector,
+                                              human_threshold=zone.human_threshold, name=zone.name)
+
+    def start(self):
+        self._stop.clear()
+        for zone in self.zones:
+            zone.pipeline.resume()
+            thread = Thread(target=self._run_zone, args=(zone,), name="zone-{}".format(zone.name))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def run(self):
+        """
+        Runs every zone until stop() is called, or every frame source ran out.
+
+        :return:
+        """
+        self.start()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stop(self):
+        self._stop.set()
+        for zone in self.zones:
+            zone.pipeline.stop()
+
+    def close(self):
+        self.stop()
+        for thread in self._threads:
+            thread.join()
+        self.pool.close()
+        for zone in self.zones:
+            zone.frame_source.close()
+
+    def stats(self):
+        """
+        :return: dict of zone name to its scans, errors and pipeline stats
+        """
+        return dict((zone.name, {"scans": zone.scans, "errors": zone.errors, "stages": zone.pipeline.stats()})
+                    for zone in self.zones)
+
+    def _run_zone(self, zone):
+        while not self._stop.is_set() and not zone.frame_source.exhausted:
+            try:
+                result = zone.pipeline.run()
+            except Exception as e:
+                # one broken camera shouldn't take the other zones down with it
+                zone.errors += 1
+                print("zone {} failed: {}, retrying in {}s".format(zone.name, e, self.retry_delay))
+                zone.frame_source.pause()
+                self._stop.wait(self.retry_delay)
+                continue
+            zone.scans += 1
+            # stop capturing while we sleep, but keep the camera open
+            zone.frame_source.pause()
+            if zone.frame_source.exhausted:
+                break
+            print("zone {} sleeping for {}s".format(zone.name, result.sleep_time()))
+            self._stop.wait(result.sleep_time())
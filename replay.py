@@ -0,0 +1,81 @@
+#!/usr/bin/python
+"""
+Replays recorded (or synthetic) frames through the scan loop as fast as possible, against a fake bridge,
+and reports frames per second and per frame latency.
+"""
+
+from hue.fake_bridge import FakeBridge
+from hue.hue_wrapper import HueWrapper
+from model.hue_strategy import HueStrategy
+from optics.frame_source import ImageDirectoryFrameSource, MeasuredFrameSource, SyntheticFrameSource, \
+    VideoFileFrameSource
+from optics.human_detector import HumanDetector
+from optics.motion_detector import MotionDetector
+from pipeline.detection_pipeline import DetectionPipeline
+from util.metrics import registry
+
+import argparse
+import main
+
+
+def get_frame_source(args):
+    """
+    :param args: parsed command line arguments
+    :return: the frame source selected on the command line
+    """
+    if args["video"] is not None:
+        return VideoFileFrameSource(args["video"], max_frames=args["max_frames"])
+    if args["images"] is not None:
+        return ImageDirectoryFrameSource(args["images"], max_frames=args["max_frames"])
+    return SyntheticFrameSource(max_frames=args["max_frames"] or 300)
+
+
+def replay(frame_source, hue, strategy, pipelined=False):
+    """
+    Runs the scan loop until the frame source runs out. We don't sleep after turning the lights on.
+
+    :param frame_source:
+    :param hue:
+    :param strategy:
+    :param pipelined: replay through a DetectionPipeline instead of main.scan()
+    :return: the measured frame source summary
+    """
+    measured = MeasuredFrameSource(frame_source)
+    pipeline = None
+    if pipelined:
+        pipeline = DetectionPipeline(measured, hue, strategy, MotionDetector(min_area=300), HumanDetector())
+    scans = 0
+    while not measured.exhausted:
+        if pipeline is not None:
+            pipeline.run()
+        else:
+            main.scan(measured, hue, strategy)
+        scans += 1
+    summary = measured.summary()
+    summary["scans"] = scans
+    if pipeline is not None:
+        summary["stages"] = pipeline.stats()
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", help="path to a recorded video")
+    ap.add_argument("-i", "--images", help="path to a directory of frames")
+    ap.add_argument("-n", "--max-frames", type=int, help="stop after this many frames")
+    ap.add_argument("-p", "--pipeline", action="store_true", help="replay through the threaded pipeline")
+    args = vars(ap.parse_args())
+
+    hue = HueWrapper("fake", bridge=FakeBridge())
+    strategy = HueStrategy("Kitchen", lambda: 100, lambda: 0)
+
+    frame_source = get_frame_source(args)
+    summary = replay(frame_source, hue, strategy, pipelined=args["pipeline"])
+    frame_source.close()
+
+    print("replayed {frames} frames over {scans} scans at {fps:.1f} fps".format(**summary))
+    print("per frame latency p50 {:.1f}ms p90 {:.1f}ms p99 {:.1f}ms max {:.1f}ms".format(
+        summary["p50"] * 1000, summary["p90"] * 1000, summary["p99"] * 1000, summary["max"] * 1000))
+    for (stage, stats) in sorted(summary.get("stages", {}).items()):
+        print("{:>10}: {}".format(stage, stats))
+    print(registry.summary())
@@ -0,0 +1,37 @@
+from optics.boxes import coverage_matrix, intersection_over_union, iou_matrix, merge_rects, non_max_suppression
+
+import numpy as np
+import unittest
+
+
+class BoxesTest(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        corners = random.randint(0, 100, (10, 2))
+        sizes = random.randint(1, 60, (10, 2))
+        boxes = [tuple(box) for box in np.hstack([corners, sizes]).tolist()]
+        (self.boxes1, self.boxes2) = (boxes[:6], boxes[6:])
+
+    def test_iou_matrix_matches_intersection_over_union(self):
+        expected = [[intersection_over_union(a, b) for b in self.boxes2] for a in self.boxes1]
+        np.testing.assert_allclose(expected, iou_matrix(self.boxes1, self.boxes2))
+
+    def test_iou_matrix_of_no_boxes(self):
+        self.assertEqual((0, 4), iou_matrix([], self.boxes2).shape)
+
+    def test_coverage(self):
+        coverage = coverage_matrix([(0, 0, 10, 10)], [(5, 0, 10, 10), (20, 20, 5, 5)])
+        np.testing.assert_allclose([[0.5, 0.0]], coverage)
+
+    def test_merge_rects(self):
+        merged = merge_rects([(0, 0, 10, 10), (20, 20, 5, 5), (5, 0, 10, 10)])
+        self.assertEqual([(0, 0, 15, 10), (20, 20, 5, 5)], merged)
+
+    def test_non_max_suppression(self):
+        keep = non_max_suppression([(0, 0, 10, 10), (1, 1, 10, 10), (50, 50, 10, 10)], [0.5, 0.9, 0.1])
+        self.assertEqual([1, 2], list(keep))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+from hue.bridge_transport import HueCommandError, KeepAliveTransport, check_response
+from hue.fake_bridge_server import FakeBridgeServer
+
+import socket
+import threading
+import time
+import unittest
+
+
+class ClosingServer:
+    """
+    Answers a single request per connection and then closes it without saying so, like the bridge dropping an
+    idle keep-alive connection.
+    """
+
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(5)
+        self.requests = 0
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return "127.0.0.1:{}".format(self.socket.getsockname()[1])
+
+    def _serve(self):
+        while True:
+            try:
+                (connection, _) = self.socket.accept()
+            except OSError:
+                return
+            with connection:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    chunk = connection.recv(4096)
+                    if not chunk:
+                        break
+                    request += chunk
+                (head, _, body) = request.partition(b"\r\n\r\n")
+                length = [int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                          if line.lower().startswith(b"content-length")]
+                while len(length) > 0 and len(body) < length[0]:
+                    body += connection.recv(4096)
+                self.requests += 1
+                content = b'[{"success": {}}]'
+                connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: " +
+                                   str(len(content)).encode() + b"\r\n\r\n" + content)
+
+    def close(self):
+        self.socket.close()
+
+
+class KeepAliveTransportTest(unittest.TestCase):
+
+    def test_reconnects_when_the_bridge_dropped_the_connection(self):
+        server = ClosingServer()
+        self.addCleanup(server.close)
+        transport = KeepAliveTransport(server.address, "fakeuser")
+        self.addCleanup(transport.close)
+        for brightness in (10, 20, 30):
+            transport.send("1", {"bri": brightness})
+            # give the close time to arrive
+            time.sleep(0.05)
+        self.assertEqual(3, server.requests)
+        self.assertEqual(3, transport.connects)
+
+    def start(self):
+        server = FakeBridgeServer()
+        server.start()
+        self.addCleanup(server.stop)
+        transport = KeepAliveTransport(server.address, server.username)
+        self.addCleanup(transport.close)
+        return (server, transport)
+
+    def test_commands_are_not_repeated(self):
+        (server, transport) = self.start()
+        # the bridge may have applied a command before the connection dropped
+        server.fail_next(kind="disconnect")
+        with self.assertRaises(HueCommandError):
+            transport.send("1", {"on": True})
+        self.assertEqual(1, server.stats()["requests"])
+        transport.send("1", {"on": True})
+        self.assertEqual(2, server.stats()["requests"])
+
+    def test_reads_are_repeated(self):
+        (server, transport) = self.start()
+        server.fail_next(kind="disconnect")
+        self.assertEqual("1", transport.group_id("Kitchen"))
+        self.assertEqual(2, server.stats()["requests"])
+
+    def test_rejected_commands_raise(self):
+        (server, transport) = self.start()
+        server.fail_next(kind="api")
+        with self.assertRaises(HueCommandError):
+            transport.send("1", {"on": True})
+
+
+class CheckResponseTest(unittest.TestCase):
+
+    def test_success(self):
+        response = [{"success": {"/groups/1/action/on": True}}]
+        self.assertEqual(response, check_response("Kitchen", {"on": True}, response))
+
+    def test_nested_errors(self):
+        with self.assertRaises(HueCommandError) as raised:
+            check_response("Kitchen", {"on": True}, [[{"error": {"type": 201, "description": "unreachable"}}]])
+        self.assertIn("unreachable", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+from optics.clip_recorder import ClipRecorder
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class FakeClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def noise(seed):
+    # random pixels barely compress, so every frame adds a predictable few kilobytes to a clip
+    return (np.random.RandomState(seed).random_sample((120, 160)) * 255).astype(np.uint8)
+
+
+class ClipRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock(1781500000.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def recorder(self, **kwargs):
+        return ClipRecorder(self.directory, pre_seconds=2.0, post_seconds=2.0, width=None, clock=self.clock,
+                            **kwargs)
+
+    def record(self, recorder, name, frames=4):
+        for i in range(frames):
+            recorder.add(noise(i))
+            self.clock.now += 0.5
+            if i == 0:
+                recorder.event(name)
+        # a frame past the end of the clip finishes it
+        self.clock.now += 5.0
+        recorder.add(noise(frames))
+
+    def clips(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_clip_is_saved(self):
+        recorder = self.recorder()
+        self.record(recorder, "on")
+        recorder.close()
+        [clip] = self.clips()
+        self.assertTrue(clip.endswith("-on"))
+        self.assertIn("clip.json", os.listdir(os.path.join(self.directory, clip)))
+
+    def test_oldest_clips_are_pruned(self):
+        # room for two clips of about 50kb
+        recorder = self.recorder(max_disk=120 * 1024)
+        for name in ("on", "off", "on"):
+            self.record(recorder, name)
+            self.clock.now += 60.0
+        recorder.close()
+        self.assertEqual(["off", "on"], [clip.split("-")[-1] for clip in self.clips()])
+
+    def test_newest_clip_is_kept_even_if_too_large(self):
+        recorder = self.recorder(max_disk=1024)
+        self.record(recorder, "on")
+        recorder.close()
+        self.assertEqual(1, len(self.clips()))
+
+    def test_unfinished_clips_are_removed_at_startup(self):
+        partial = os.path.join(self.directory, "20260615-100000-000-on.partial")
+        os.makedirs(partial)
+        with open(os.path.join(partial, "000000.jpg"), "wb") as f:
+            f.write(b"\xff\xd8")
+        self.recorder().close()
+        self.assertEqual([], self.clips())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+from hue.fake_bridge import FakeBridge
+from hue.hue_wrapper import HueWrapper
+from model.hue_strategy import HueStrategy
+from optics.frame_source import FrameSource
+from optics.motion_detector import MotionDetector
+from pipeline.detection_pipeline import DetectionPipeline
+
+import numpy as np
+import unittest
+
+
+class ListFrameSource(FrameSource):
+
+    def __init__(self, frames):
+        FrameSource.__init__(self)
+        self.list = frames
+
+    def read(self):
+        return self.list[self.frame_count] if self.frame_count < len(self.list) else None
+
+
+class NoPeople:
+
+    def detect_regions(self, image, rects, **kwargs):
+        return ([], [])
+
+
+def still(count):
+    return [np.zeros((120, 160, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def moved():
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    frame[30:90, 40:100] = 255
+    return frame
+
+
+class LightsOnAtStartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = FakeBridge()
+        self.bridge.groups["1"]["action"]["on"] = True
+        self.hue = HueWrapper("fake", bridge=self.bridge, list_lights=False)
+        self.strategy = HueStrategy("Kitchen", lambda: 50, lambda: 10)
+
+    def tearDown(self):
+        self.hue.close()
+
+    def run_pipeline(self, frames):
+        pipeline = DetectionPipeline(ListFrameSource(frames), self.hue, self.strategy, MotionDetector(min_area=300),
+                                     NoPeople())
+        pipeline.run()
+        return self.bridge.get_group("Kitchen", "on")
+
+    def test_priming_frame_leaves_the_lights_on(self):
+        self.assertTrue(self.run_pipeline(still(1)))
+
+    def test_motion_leaves_the_lights_on(self):
+        self.assertTrue(self.run_pipeline(still(1) + [moved()]))
+
+    def test_still_room_turns_the_lights_off(self):
+        self.assertFalse(self.run_pipeline(still(2)))
+
+
+class StopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = FakeBridge()
+        self.hue = HueWrapper("fake", bridge=self.bridge, list_lights=False)
+        self.source = ListFrameSource(still(2))
+        self.pipeline = DetectionPipeline(self.source, self.hue, HueStrategy("Kitchen", lambda: 50, lambda: 10),
+                                          MotionDetector(min_area=300), NoPeople())
+
+    def tearDown(self):
+        self.hue.close()
+
+    def test_stop_before_run_is_not_lost(self):
+        self.pipeline.stop()
+        self.pipeline.run()
+        self.pipeline.run()
+        self.assertEqual(0, self.source.frame_count)
+
+    def test_resume(self):
+        self.pipeline.stop()
+        self.pipeline.resume()
+        self.pipeline.run()
+        self.assertEqual(2, self.source.frame_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
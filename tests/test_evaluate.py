@@ -0,0 +1,33 @@
+from evaluate import match, precision_recall
+
+import unittest
+
+
+class MatchTest(unittest.TestCase):
+
+    def test_nothing_detected(self):
+        self.assertEqual((0, 0, 2), match([], [(0, 0, 10, 10), (50, 50, 10, 10)], 0.5))
+
+    def test_nothing_labelled(self):
+        self.assertEqual((0, 1, 0), match([(0, 0, 10, 10)], [], 0.5))
+
+    def test_matches_above_the_threshold(self):
+        self.assertEqual((1, 1, 1), match([(1, 0, 10, 10), (50, 50, 10, 10)],
+                                          [(0, 0, 10, 10), (45, 50, 10, 10)], 0.6))
+
+    def test_a_labelled_box_is_found_once(self):
+        # the stronger detection takes the labelled box, so the second one is a false positive
+        self.assertEqual((1, 1, 0), match([(0, 0, 10, 10), (1, 0, 10, 10)], [(0, 0, 10, 10)], 0.5))
+
+    def test_weaker_detection_takes_the_next_best_box(self):
+        truth = [(0, 0, 10, 10), (4, 0, 10, 10)]
+        self.assertEqual((2, 0, 0), match([(2, 0, 10, 10), (4, 0, 10, 10)], truth, 0.5))
+
+    def test_precision_recall(self):
+        result = precision_recall(3, 1, 2)
+        self.assertAlmostEqual(0.75, result["precision"])
+        self.assertAlmostEqual(0.6, result["recall"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+from events import latency, lights_on_at, occupancy, parse_date, tail
+from util.event_log import EventLog, connect
+
+import os
+import shutil
+import tempfile
+import unittest
+
+# a day without a daylight saving change, so every hour bucket is 3600s long
+DAY = parse_date("2026-06-15")
+HOUR = 3600.0
+
+
+class FakeClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class EventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "events.db")
+        self.clock = FakeClock(DAY + 10 * HOUR)
+        self.log = EventLog(self.path, flush_interval=0.01, clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, query):
+        self.log.close()
+        connection = connect(self.path)
+        try:
+            return connection.execute(query).fetchall()
+        finally:
+            connection.close()
+
+    def test_events(self):
+        self.log.record("lights", "Kitchen", 1, 0.25, brightness=50)
+        self.log.record("vacancy", "Kitchen", timestamp=DAY, seconds=90)
+        self.assertEqual([(DAY, "vacancy", "Kitchen", None, 90.0, None),
+                          (DAY + 10 * HOUR, "lights", "Kitchen", 1.0, 0.25, '{"brightness": 50}')],
+                         self.read("SELECT * FROM events ORDER BY time"))
+
+    def test_frames_are_summed_per_minute(self):
+        self.log.frame("Kitchen", 0.1, motion=True)
+        self.log.frame("Kitchen", 0.3)
+        self.clock.now += 60
+        self.log.frame("Kitchen", 0.2)
+        self.log.frame("Hallway", 0.5, motion=True)
+        minute = int((DAY + 10 * HOUR) // 60)
+        rows = self.read("SELECT minute, zone, frames, motion_frames, seconds_sum, seconds_max FROM frame_stats "
+                         "ORDER BY minute, zone")
+        self.assertEqual([(minute, "Kitchen", 2, 1), (minute + 1, "Hallway", 1, 1), (minute + 1, "Kitchen", 1, 0)],
+                         [row[:4] for row in rows])
+        self.assertAlmostEqual(0.4, rows[0][4])
+        self.assertAlmostEqual(0.3, rows[0][5])
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = connect(":memory:")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def lights(self, zone, *changes):
+        """
+        :param changes: (hours after midnight, 1 for on or 0 for off, seconds the lights took to come on)
+        """
+        with self.connection:
+            self.connection.executemany("INSERT INTO events (time, kind, zone, value, seconds) VALUES "
+                                        "(?, 'lights', ?, ?, ?)",
+                                        [(DAY + hours * HOUR, zone, value, seconds)
+                                         for (hours, value, seconds) in changes])
+
+    def test_occupancy_splits_intervals_over_buckets(self):
+        self.lights("Kitchen", (10.5, 1, 0.2), (11.25, 0, None))
+        self.assertEqual([("2026-06-15 10:00", 1800.0, 0.5, 1), ("2026-06-15 11:00", 900.0, 0.25, 0)],
+                         occupancy(self.connection, "hour", DAY, DAY + 24 * HOUR))
+
+    def test_occupancy_adds_up_zones(self):
+        self.lights("Kitchen", (10.5, 1, 0.2), (11, 0, None))
+        self.lights("Hallway", (10.75, 1, 0.2), (11, 0, None))
+        self.assertEqual([("2026-06-15", 2700.0, 2700.0 / 86400, 2)],
+                         occupancy(self.connection, "day", DAY, DAY + 24 * HOUR))
+        self.assertEqual([("2026-06-15", 900.0, 900.0 / 86400, 1)],
+                         occupancy(self.connection, "day", DAY, DAY + 24 * HOUR, zone="Hallway"))
+
+    def test_lights_still_on_count_until_the_end(self):
+        self.lights("Kitchen", (23.5, 1, 0.2))
+        self.assertEqual([("2026-06-15 23:00", 1800.0, 0.5, 1)],
+                         occupancy(self.connection, "hour", DAY, DAY + 24 * HOUR))
+
+    def test_lights_on_before_since(self):
+        self.lights("Kitchen", (9.5, 1, 0.2), (10.5, 0, None))
+        self.lights("Hallway", (8, 1, 0.2))
+        self.lights("Porch", (8, 1, 0.2), (9, 0, None))
+        self.assertEqual({"Kitchen", "Hallway"}, lights_on_at(self.connection, DAY + 10 * HOUR))
+        self.assertEqual(set(), lights_on_at(self.connection, DAY + 10 * HOUR, zone="Porch"))
+        # the kitchen was on for half of the range, the hallway all of it, and neither was turned on in it
+        self.assertEqual([("2026-06-15 10:00", 5400.0, 1.5, 0)],
+                         occupancy(self.connection, "hour", DAY + 10 * HOUR, DAY + 11 * HOUR))
+
+    def test_latency(self):
+        minute = int((DAY + 10 * HOUR) // 60)
+        with self.connection:
+            self.connection.executemany("INSERT INTO frame_stats VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(minute, "Kitchen", 10, 5, 1.0, 0.3),
+                                         (minute + 1, "Kitchen", 30, 0, 2.0, 0.1)])
+        self.lights("Kitchen", (10.1, 1, 0.2), (10.2, 0, None), (10.3, 1, 0.4))
+        [(bucket, frames, mean, worst, motion, count, light_seconds)] = latency(self.connection, "hour", DAY,
+                                                                               DAY + 24 * HOUR)
+        self.assertEqual(("2026-06-15 10:00", 40, 2), (bucket, frames, count))
+        self.assertAlmostEqual(3.0 / 40, mean)
+        self.assertAlmostEqual(0.3, worst)
+        self.assertAlmostEqual(5.0 / 40, motion)
+        self.assertAlmostEqual(0.3, light_seconds)
+
+    def test_tail(self):
+        self.lights("Kitchen", (10, 1, 0.2), (11, 0, None), (12, 1, 0.2))
+        self.lights("Hallway", (10.5, 1, 0.2))
+        self.assertEqual([DAY + 11 * HOUR, DAY + 12 * HOUR],
+                         [row[0] for row in tail(self.connection, 2, zone="Kitchen")])
+        self.assertEqual([DAY + 10.5 * HOUR, DAY + 11 * HOUR, DAY + 12 * HOUR],
+                         [row[0] for row in tail(self.connection, 3, kind="lights")])
+
+
+if __name__ == "__main__":
+    unittest.main()
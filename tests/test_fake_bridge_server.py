@@ -0,0 +1,87 @@
+from hue.bridge_transport import HueCommandError
+from hue.fake_bridge_server import FakeBridgeServer
+from hue.hue_wrapper import HueWrapper
+
+import unittest
+
+
+class FakeBridgeServerTest(unittest.TestCase):
+    """
+    Runs the HueWrapper over http against a FakeBridgeServer, like the real bridge, in both command modes.
+    """
+
+    def start(self, **kwargs):
+        server = FakeBridgeServer(seed=0, **kwargs)
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def connect(self, server, async_commands):
+        hue = HueWrapper(server.address, username=server.username, async_commands=async_commands, list_lights=False)
+        # cleanups run last in first out, so the wrapper is closed before the server stops
+        self.addCleanup(hue.close)
+        return hue
+
+    def assertRejected(self, future):
+        self.assertIsInstance(future.exception(timeout=5), HueCommandError)
+        self.assertIn("Internal error, 503", str(future.exception()))
+
+    def check_rate_limit(self, async_commands):
+        # a burst of two commands, and hardly any more for the rest of the test
+        server = self.start(rate_limit=0.01, burst=2)
+        hue = self.connect(server, async_commands)
+        futures = []
+        for brightness in (10, 20, 30, 40):
+            futures.append(hue.set_group_state("Kitchen", on=True, brightness_pct=brightness))
+            # wait for every command, so the async queue can't merge them
+            futures[-1].exception(timeout=5)
+        for future in futures[:2]:
+            self.assertIsNone(future.exception())
+        for future in futures[2:]:
+            self.assertRejected(future)
+        self.assertEqual(2, server.stats()["rate_limited"])
+        self.assertEqual(2, server.stats()["commands"])
+        # the bridge kept the last state it accepted
+        self.assertEqual(HueWrapper.brightness_from_pct(20), server.bridge.get_group("Kitchen", "bri"))
+
+    def test_rate_limited_commands_fail(self):
+        self.check_rate_limit(async_commands=False)
+
+    def test_rate_limited_async_commands_fail(self):
+        self.check_rate_limit(async_commands=True)
+
+    def check_injected_errors(self, async_commands):
+        server = self.start(error_rate=1.0, errors=("api",), error_methods=("PUT",))
+        hue = self.connect(server, async_commands)
+        self.assertRejected(hue.turn_group_on("Kitchen"))
+        # reads still work, and see that the lights never came on
+        self.assertFalse(hue.is_group_on("Kitchen"))
+        self.assertEqual(1, server.stats()["injected_errors"])
+
+    def test_injected_errors_fail_commands(self):
+        self.check_injected_errors(async_commands=False)
+
+    def test_injected_errors_fail_async_commands(self):
+        self.check_injected_errors(async_commands=True)
+
+    def test_async_commands_are_coalesced(self):
+        # slow enough that the commands pile up behind the first one
+        server = self.start(latency=0.05)
+        hue = self.connect(server, async_commands=True)
+        futures = [hue.set_group_state("Kitchen", on=True, brightness_pct=brightness) for brightness in range(10, 30)]
+        for future in futures:
+            self.assertIsNone(future.exception(timeout=5))
+        self.assertLess(server.stats()["commands"], len(futures) / 2)
+        self.assertEqual(HueWrapper.brightness_from_pct(29), server.bridge.get_group("Kitchen", "bri"))
+        self.assertTrue(server.bridge.get_group("Kitchen", "on"))
+
+    def test_sync_commands_are_not_coalesced(self):
+        server = self.start()
+        hue = self.connect(server, async_commands=False)
+        for brightness in range(10, 15):
+            hue.set_group_state("Kitchen", on=True, brightness_pct=brightness)
+        self.assertEqual(5, server.stats()["commands"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+from optics.fusion import DetectionFusion
+
+import unittest
+
+
+class DetectionFusionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fusion = DetectionFusion(overlap=0.65, min_coverage=0.2)
+
+    def test_no_people(self):
+        fused = self.fusion.fuse([], [], [(0, 0, 10, 10)])
+        self.assertEqual(0, len(fused.boxes))
+        self.assertEqual(0.0, fused.score)
+
+    def test_still_person_counts_for_nothing(self):
+        fused = self.fusion.fuse([(0, 0, 50, 100)], [1.5], [(200, 200, 20, 20)])
+        self.assertEqual([0.0], fused.support.tolist())
+        self.assertEqual(0.0, fused.score)
+
+    def test_no_motion(self):
+        self.assertEqual(0.0, self.fusion.fuse([(0, 0, 50, 100)], [1.5], []).score)
+
+    def test_partial_coverage_scales_the_weight(self):
+        # motion covers a tenth of the box, half of min_coverage
+        fused = self.fusion.fuse([(0, 0, 50, 100)], [1.0], [(0, 0, 50, 10)])
+        self.assertAlmostEqual(0.5, fused.score)
+
+    def test_enough_coverage_keeps_the_weight(self):
+        self.assertAlmostEqual(0.8, self.fusion.fuse([(0, 0, 50, 100)], [0.8], [(0, 0, 50, 50)]).score)
+
+    def test_coverage_of_separate_regions_adds_up(self):
+        fused = self.fusion.fuse([(0, 0, 50, 100)], [1.0], [(0, 0, 50, 5), (0, 50, 50, 5)])
+        self.assertAlmostEqual(0.5, fused.score)
+
+    def test_overlapping_regions_count_once(self):
+        # the same motion, found twice
+        fused = self.fusion.fuse([(0, 0, 50, 100)], [1.0], [(0, 0, 50, 5), (0, 0, 50, 5)])
+        self.assertAlmostEqual(0.25, fused.score)
+
+    def test_suppresses_overlapping_boxes(self):
+        fused = self.fusion.fuse([(0, 0, 50, 100), (2, 2, 50, 100)], [0.5, 1.0], [(0, 0, 100, 100)])
+        self.assertEqual([[2, 2, 50, 100]], fused.boxes.tolist())
+        self.assertAlmostEqual(1.0, fused.score)
+        self.assertEqual([[2, 2, 50, 100]], fused.above(0.9).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+from hue.bridge_transport import HueCommandError
+from hue.fake_bridge import FakeBridge
+from hue.hue_wrapper import HueWrapper
+
+import time
+import unittest
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class UnreachableBridge(FakeBridge):
+    """
+    A FakeBridge whose reads can be made to fail, like the real bridge dropping off the network.
+    """
+
+    def __init__(self):
+        FakeBridge.__init__(self)
+        self.unreachable = False
+
+    def get_group(self, group_id=None, parameter=None):
+        if self.unreachable:
+            raise OSError("bridge is unreachable")
+        return FakeBridge.get_group(self, group_id, parameter)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class StateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = FakeBridge()
+        self.clock = FakeClock()
+        self.hue = HueWrapper("fake", state_ttl=5.0, bridge=self.bridge, list_lights=False)
+        self.hue.state_cache.clock = self.clock
+
+    def tearDown(self):
+        self.hue.close()
+
+    def test_miss_then_hit(self):
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+        self.assertEqual(1, self.bridge.requests)
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+        self.assertEqual(1, self.bridge.requests)
+        self.assertEqual((1, 1), (self.hue.state_cache.hits, self.hue.state_cache.misses))
+
+    def test_expires_after_ttl(self):
+        self.hue.is_group_on("Kitchen")
+        self.clock.now += 5.0
+        self.hue.is_group_on("Kitchen")
+        self.assertEqual(1, self.bridge.requests)
+
+        self.clock.now += 0.1
+        self.hue.is_group_on("Kitchen")
+        self.assertEqual(2, self.bridge.requests)
+        self.assertEqual(2, self.hue.state_cache.misses)
+
+    def test_write_updates_cache(self):
+        self.hue.turn_group_on("Kitchen").result()
+        requests = self.bridge.requests
+        self.assertTrue(self.hue.is_group_on("Kitchen"))
+        self.assertEqual(requests, self.bridge.requests)
+
+        self.hue.set_light_group_brightness("Kitchen", 50).result()
+        self.assertEqual((True, 127), self.hue.state_cache.get("Kitchen", "bri"))
+
+    def test_rejected_write_invalidates_cache(self):
+        self.hue.is_group_on("Kitchen")
+        self.bridge.reject("Kitchen")
+        future = self.hue.turn_group_on("Kitchen")
+        self.assertIsInstance(future.exception(), HueCommandError)
+        self.assertEqual((False, None), self.hue.state_cache.get("Kitchen", "on"))
+
+        requests = self.bridge.requests
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+        self.assertEqual(requests + 1, self.bridge.requests)
+
+
+class AsyncStateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = FakeBridge()
+        self.hue = HueWrapper("fake", bridge=self.bridge, async_commands=True, list_lights=False)
+
+    def tearDown(self):
+        self.hue.close()
+
+    def test_write_updates_cache_before_delivery(self):
+        future = self.hue.turn_group_on("Kitchen")
+        self.assertTrue(self.hue.is_group_on("Kitchen"))
+        future.result()
+        self.assertTrue(self.bridge.get_group("Kitchen", "on"))
+
+    def test_rejected_write_invalidates_cache(self):
+        self.bridge.reject("Kitchen")
+        future = self.hue.turn_group_on("Kitchen")
+        self.assertIsInstance(future.exception(), HueCommandError)
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+
+
+class BackgroundRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = UnreachableBridge()
+        self.hue = HueWrapper("fake", state_ttl=60.0, bridge=self.bridge, list_lights=False)
+
+    def tearDown(self):
+        self.hue.close()
+
+    def test_picks_up_changes_made_elsewhere(self):
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+        # ie the hue app or a wall switch
+        self.bridge.groups["1"]["action"]["on"] = True
+        self.assertFalse(self.hue.is_group_on("Kitchen"))
+
+        self.hue.start_state_refresh(interval=0.01)
+        self.assertTrue(wait_for(lambda: self.hue.state_cache.get("Kitchen", "on") == (True, True)))
+
+    def test_failed_refresh_drops_cached_state(self):
+        self.hue.is_group_on("Kitchen")
+        self.bridge.unreachable = True
+        self.hue.start_state_refresh(interval=0.01)
+        self.assertTrue(wait_for(lambda: "Kitchen" not in self.hue.state_cache.groups()))
+
+    def test_stop(self):
+        self.hue.is_group_on("Kitchen")
+        self.hue.start_state_refresh(interval=0.01)
+        self.hue.stop_state_refresh()
+        requests = self.bridge.requests
+        time.sleep(0.05)
+        self.assertEqual(requests, self.bridge.requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
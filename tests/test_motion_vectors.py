@@ -0,0 +1,114 @@
+from optics.motion_vectors import CameraMotionVectorDetector, MotionVectorDetector, MotionVectorFileSource, \
+    SyntheticMotionVectorSource, MOTION_VECTOR_DTYPE, vector_shape
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def still(resolution=(640, 480)):
+    return np.zeros(vector_shape(resolution), dtype=MOTION_VECTOR_DTYPE)
+
+
+def moving(row, column, resolution=(640, 480), size=3):
+    vectors = still(resolution)
+    vectors["x"][row:row + size, column:column + size] = 8
+    return vectors
+
+
+class QueuedVectorSource:
+    """
+    The parts of a CameraMotionVectorSource the detector uses, handing out arrays queued up front.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = list(arrays)
+
+    def pending(self):
+        (arrays, self.arrays) = (self.arrays, [])
+        return arrays
+
+    def discard(self):
+        self.arrays = []
+
+
+class MotionVectorDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = MotionVectorDetector(min_area=300, resolution=(640, 480))
+
+    def test_still_vectors(self):
+        self.assertEqual([], self.detector.detect(still()))
+
+    def test_moving_blocks_become_a_box(self):
+        self.assertEqual([(48, 16, 80, 80)], self.detector.detect(moving(2, 4)))
+
+    def test_follows_the_synthetic_blob(self):
+        source = SyntheticMotionVectorSource(max_frames=20, speed=20)
+        found = list(self.detector.detect_source(source))
+        self.assertEqual(20, len(found))
+        centers = []
+        for (vectors, rects) in found:
+            # the noise is at most a pixel, so the blob is the only motion
+            self.assertEqual(1, len(rects))
+            (x, y, w, h) = rects[0]
+            self.assertTrue(y <= 240 <= y + h)
+            centers.append(x + w / 2.0)
+        self.assertGreater(centers[-1], centers[0] + 200)
+
+    def test_noise_is_ignored(self):
+        source = SyntheticMotionVectorSource(max_frames=5, blob_radius=0, noise=0.2)
+        self.assertEqual([[]] * 5, [rects for (vectors, rects) in self.detector.detect_source(source)])
+
+
+class MotionVectorFileSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recorded = [still(), moving(2, 4), moving(20, 30), still()]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def detect(self, path):
+        detector = MotionVectorDetector(min_area=300, resolution=(640, 480))
+        return [rects for (vectors, rects) in detector.detect_source(MotionVectorFileSource(path))]
+
+    def test_raw_recording(self):
+        # what CameraMotionVectorSource appends to its record_path
+        path = os.path.join(self.directory, "vectors.raw")
+        with open(path, "ab") as f:
+            for vectors in self.recorded:
+                vectors.tofile(f)
+        self.assertEqual([[], [(48, 16, 80, 80)], [(464, 304, 80, 80)], []], self.detect(path))
+
+    def test_npy_recording(self):
+        path = os.path.join(self.directory, "vectors.npy")
+        np.save(path, np.stack(self.recorded))
+        self.assertEqual([[], [(48, 16, 80, 80)], [(464, 304, 80, 80)], []], self.detect(path))
+
+
+class CameraMotionVectorDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = QueuedVectorSource([])
+        self.detector = CameraMotionVectorDetector(self.source, MotionVectorDetector(min_area=300,
+                                                                                     resolution=(640, 480)))
+
+    def test_counts_motion_in_skipped_frames(self):
+        self.source.arrays = [still(), moving(2, 4), still()]
+        self.assertEqual([(48, 16, 80, 80)], self.detector.update(None))
+        self.source.arrays = [still()]
+        self.assertEqual([], self.detector.update(None))
+
+    def test_reset_forgets_earlier_frames(self):
+        self.source.arrays = [moving(2, 4)]
+        self.detector.reset()
+        self.source.arrays.append(still())
+        self.assertEqual([], self.detector.update(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
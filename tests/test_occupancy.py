@@ -0,0 +1,69 @@
+from occupancy import cut_short, evaluate, longest_gap, visits
+from model.occupancy_model import OccupancyModel
+from util.event_log import connect
+
+import unittest
+
+DAY = 1781481600.0
+
+
+class VisitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = connect(":memory:")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def lights(self, zone, *changes):
+        with self.connection:
+            self.connection.executemany("INSERT INTO events (time, kind, zone, value) VALUES (?, 'lights', ?, ?)",
+                                        [(DAY + seconds, zone, value) for (seconds, value) in changes])
+
+    def motion(self, zone, *minutes):
+        with self.connection:
+            self.connection.executemany("INSERT INTO frame_stats VALUES (?, ?, 1, 1, 0.1, 0.1)",
+                                        [(int(DAY // 60) + minute, zone) for minute in minutes])
+
+    def test_visits(self):
+        self.lights("Kitchen", (0, 1), (600, 0), (3000, 1), (3300, 0), (9000, 1))
+        self.lights("Hallway", (100, 1), (200, 0))
+        self.motion("Kitchen", 2, 8)
+        found = visits(self.connection)
+        # the kitchen is still on, so its last visit isn't over
+        self.assertEqual([("Kitchen", DAY, DAY + 600), ("Hallway", DAY + 100, DAY + 200),
+                          ("Kitchen", DAY + 3000, DAY + 3300)], [visit[:3] for visit in found])
+        self.assertEqual([DAY + 150, DAY + 510], found[0][3])
+
+    def test_lights_back_on_soon_continue_the_visit(self):
+        self.lights("Kitchen", (0, 1), (600, 0), (700, 1), (900, 0))
+        [(zone, started, ended, motions)] = visits(self.connection, rejoin=300.0)
+        self.assertEqual((DAY, DAY + 900), (started, ended))
+        # coming back on is motion, after a gap the lights cut short
+        self.assertEqual([DAY + 700], motions)
+        self.assertEqual(2, len(visits(self.connection, rejoin=60.0)))
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_longest_gap(self):
+        self.assertEqual(0.0, longest_gap(0.0, []))
+        self.assertEqual(300.0, longest_gap(0.0, [100.0, 400.0, 450.0]))
+
+    def test_cut_short(self):
+        self.assertEqual(0, cut_short(0.0, [100.0, 400.0], 300.0))
+        self.assertEqual(2, cut_short(0.0, [100.0, 400.0, 700.0], 200.0))
+
+    def test_evaluate(self):
+        found = [("Kitchen", DAY + i * 86400, DAY + i * 86400 + 900, [DAY + i * 86400 + 400]) for i in range(3)]
+        model = OccupancyModel(lambda timestamp: 120.0)
+        replays = evaluate(model, found, fixed=[600.0])
+        self.assertEqual(["schedule", "fixed 600s", "model"], [replay.name for replay in replays])
+        self.assertEqual([3, 0, 3], [replay.cut_short for replay in replays])
+        self.assertEqual([360.0, 1800.0, 360.0], [replay.idle_seconds for replay in replays])
+        # the model learned from every visit after predicting it
+        self.assertAlmostEqual(1.0 + 0.99 + 0.99 ** 2, sum(model.histograms["Kitchen"]["all"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+from model.occupancy_model import OccupancyModel, slots
+from util.storm import TIMEZONE
+
+import datetime
+import os
+import pytz
+import shutil
+import tempfile
+import unittest
+
+PACIFIC = pytz.timezone(TIMEZONE)
+
+
+def at(year, month, day, hour, minute=0):
+    """
+    :return: timestamp of the time in the schedule's timezone
+    """
+    return PACIFIC.localize(datetime.datetime(year, month, day, hour, minute)).timestamp()
+
+
+# a monday and a saturday
+MONDAY = (2026, 6, 15)
+SATURDAY = (2026, 6, 20)
+
+
+class FakeClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SlotsTest(unittest.TestCase):
+
+    def test_weekday(self):
+        self.assertEqual(["weekday-09", "09", "all"], slots(at(*MONDAY, hour=9, minute=30)))
+
+    def test_weekend(self):
+        self.assertEqual(["weekend-23", "23", "all"], slots(at(*SATURDAY, hour=23, minute=59)))
+
+    def test_schedule_timezone(self):
+        # friday evening in oakland is already saturday in utc
+        friday = at(2026, 6, 19, hour=20)
+        self.assertEqual(["weekday-20", "20", "all"], slots(friday))
+        self.assertEqual(["weekend-03", "03", "all"], slots(friday, pytz.utc))
+
+
+class OccupancyModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(at(*MONDAY, hour=9))
+        # without decay, so that every visit counts the same
+        self.model = OccupancyModel(lambda timestamp: 600.0, quantile=0.85, margin=1.0, min_visits=5.0, decay=1.0,
+                                    clock=self.clock)
+
+    def learn(self, when, gaps):
+        for gap in gaps:
+            self.model.add("Kitchen", when, gap)
+
+    def test_falls_back_until_a_slot_has_enough_visits(self):
+        self.learn(at(*MONDAY, hour=9), [120.0] * 4)
+        self.assertEqual(600.0, self.model.predict("Kitchen"))
+        self.assertEqual(600.0, self.model.predict("Hallway"))
+        self.learn(at(*MONDAY, hour=9), [120.0])
+        prediction = self.model.predict("Kitchen")
+        # the top of the bin holding 120s
+        self.assertTrue(120.0 <= prediction < 150.0, prediction)
+
+    def test_quantile_covers_most_visits(self):
+        self.learn(at(*MONDAY, hour=9), [90.0] * 18 + [1500.0] * 2)
+        self.assertLess(self.model.predict("Kitchen"), 120.0)
+        self.model.quantile = 0.95
+        self.assertGreaterEqual(self.model.predict("Kitchen"), 1500.0)
+
+    def test_older_visits_decay(self):
+        self.model.decay = 0.5
+        self.model.min_visits = 1.0
+        self.learn(at(*MONDAY, hour=9), [1500.0] * 5 + [90.0] * 5)
+        self.assertLess(self.model.predict("Kitchen"), 120.0)
+
+    def test_predictions_are_bounded(self):
+        self.learn(at(*MONDAY, hour=9), [5.0] * 5)
+        self.assertEqual(60.0, self.model.predict("Kitchen"))
+        self.model.margin = 100.0
+        self.assertEqual(1800.0, self.model.predict("Kitchen"))
+
+    def test_backs_off_to_less_specific_slots(self):
+        # learned on a monday, asked about the same hour on a saturday, and then another hour
+        self.learn(at(*MONDAY, hour=9), [400.0] * 5)
+        on_saturday = self.model.predict("Kitchen", at(*SATURDAY, hour=9))
+        self.assertEqual(self.model.predict("Kitchen", at(*MONDAY, hour=9)), on_saturday)
+        self.assertEqual(on_saturday, self.model.predict("Kitchen", at(*SATURDAY, hour=15)))
+
+    def test_learns_once_a_visit_can_no_longer_continue(self):
+        started = at(*MONDAY, hour=9)
+        self.model.lights_on("Kitchen", started)
+        self.model.motion("Kitchen", started + 100)
+        self.model.lights_off("Kitchen", started + 400)
+        # back on within the rejoin time, the gap spans the time the lights were off
+        self.model.lights_on("Kitchen", started + 500)
+        self.model.lights_off("Kitchen", started + 600)
+        self.model.flush(started + 600 + self.model.rejoin)
+        self.assertEqual({}, self.model.histograms)
+        self.model.flush(started + 601 + self.model.rejoin)
+        self.assertEqual(1.0, sum(self.model.histograms["Kitchen"]["weekday-09"]))
+        self.assertEqual(self.model._bin(400.0), self.model.histograms["Kitchen"]["weekday-09"].index(1.0))
+        self.assertEqual({}, self.model.visits)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "occupancy.json")
+            self.learn(at(*MONDAY, hour=9), [300.0] * 5)
+            self.model.save(path)
+            loaded = OccupancyModel(lambda timestamp: 600.0, path=path)
+            self.assertEqual(self.model.predict("Kitchen"), loaded.predict("Kitchen", at(*MONDAY, hour=9)))
+            with self.assertRaises(ValueError):
+                OccupancyModel(lambda timestamp: 600.0, path=path, bins=12)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
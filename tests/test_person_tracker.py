@@ -0,0 +1,90 @@
+from optics.person_tracker import TrackingHumanDetector
+
+import numpy as np
+import unittest
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDetector:
+    """
+    Finds a person wherever it is asked to look, and remembers where that was.
+    """
+
+    def __init__(self):
+        self.searched = []
+
+    def detect_regions(self, image, rects, **kwargs):
+        self.searched.append(list(rects))
+        return ([tuple(rect) for rect in rects], [0.5] * len(rects))
+
+
+def frame(people, shape=(240, 320)):
+    """
+    :param people: (x, y) of the top left corners of textured 30x40 patches on a black frame
+    :return: grayscale frame
+    """
+    gray = np.zeros(shape, dtype=np.uint8)
+    texture = (np.random.RandomState(0).random_sample((40, 30)) * 255).astype(np.uint8)
+    for (x, y) in people:
+        gray[y:y + 40, x:x + 30] = texture
+    return gray
+
+
+class TrackingHumanDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = FakeDetector()
+        self.clock = FakeClock()
+        self.tracker = TrackingHumanDetector(self.detector, verify_every=10, clock=self.clock)
+        self.tracker.detect_regions(frame([(40, 100)]), [(40, 100, 30, 40)])
+        self.clock.now += 0.5
+
+    def test_follows_without_the_detector(self):
+        (boxes, weights) = self.tracker.detect_regions(frame([(44, 100)]), [(44, 100, 30, 40)])
+        self.assertEqual(1, len(self.detector.searched))
+        self.assertEqual([(44, 100, 30, 40)], boxes)
+        self.assertEqual([0.5], weights)
+
+    def test_detects_new_motion_while_following(self):
+        (boxes, weights) = self.tracker.detect_regions(frame([(44, 100), (200, 60)]),
+                                                       [(44, 100, 30, 40), (200, 60, 30, 40)])
+        # only the new region is searched, the tracked person is still followed
+        self.assertEqual([(200, 60, 30, 40)], self.detector.searched[-1])
+        self.assertEqual([(44, 100, 30, 40), (200, 60, 30, 40)], boxes)
+        self.assertEqual(2, len(self.tracker.tracks))
+
+        self.clock.now += 0.5
+        (boxes, weights) = self.tracker.detect_regions(frame([(48, 100), (204, 60)]),
+                                                       [(48, 100, 30, 40), (204, 60, 30, 40)])
+        self.assertEqual(2, len(self.detector.searched))
+        self.assertEqual([(48, 100, 30, 40), (204, 60, 30, 40)], boxes)
+
+    def test_verifies_after_verify_every_frames(self):
+        for step in range(1, 11):
+            self.tracker.detect_regions(frame([(40 + step, 100)]), [(40 + step, 100, 30, 40)])
+            self.clock.now += 0.5
+        self.assertEqual(1, len(self.detector.searched))
+        self.tracker.detect_regions(frame([(51, 100)]), [(51, 100, 30, 40)])
+        self.assertEqual(2, len(self.detector.searched))
+
+    def test_forgets_tracks_after_a_gap(self):
+        self.clock.now += 5.0
+        self.tracker.detect_regions(frame([(44, 100)]), [(44, 100, 30, 40)])
+        self.assertEqual(2, len(self.detector.searched))
+
+    def test_box_leaving_the_frame_is_dropped(self):
+        self.tracker.tracks[0].box = (318, 100, 30, 40)
+        self.tracker.detect_regions(frame([(44, 100)]), [])
+        self.assertEqual([], self.tracker.tracks)
+
+
+if __name__ == "__main__":
+    unittest.main()
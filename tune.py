@@ -0,0 +1,174 @@
+#!/usr/bin/python
+"""
+Sweeps the detector parameters over a labelled dataset and writes out the configurations on the latency/accuracy
+Pareto frontier, ie those that no other configuration beats on both.
+
+Every configuration is scored the way main.scan() uses the detectors: the person detector only runs on frames where
+the motion detector found something, and only searches the regions with motion, with HumanDetector.detect_regions(),
+so min_area trades missed people against time spent in the person detector.
+The latency of a configuration is the expected time per frame, the motion detector plus the person detector on the
+fraction of frames that have motion. Accuracy is the F1 score of the person detections on those frames, where a
+detection counts if its DetectionFusion confidence, ie its weight scaled by the motion on it, is above the threshold.
+
+Latencies come from the machine the detections are computed on, so run this on the pi to pick a configuration for
+the pi. Detections are cached by evaluate.py, so extending a sweep only computes the new combinations.
+
+    python tune.py -d ~/frames --budget 0.25 --write-config detector.json
+    python main.py --detector-config detector.json
+"""
+
+from optics.fusion import DetectionFusion
+
+import argparse
+import evaluate
+import itertools
+import json
+import os
+import time
+
+
+SWEEP = {
+    "width": [250, 350, 500],
+    "winStride": [4, 8],
+    "padding": [6],
+    "scale": [1.05, 1.1, 1.2],
+    "min_area": [100, 300, 1000],
+    "threshold": [0.0, 0.2, 0.5, 1.0],
+}
+
+
+def score_config(dataset, human_results, motion_results, threshold, iou_threshold):
+    """
+    :param human_results: person detections in the regions with motion, see evaluate.detect() with in_motion
+    :return: dict of the expected latency per frame, and precision, recall and F1 of the person detections
+             on the frames the motion detector let through
+    """
+    # the first frame of every sequence has no previous frame, so like in main.scan() it only primes the detector
+    motion_seconds = [0.0] * len(dataset)
+    motion_boxes = [[]] * len(dataset)
+    for ((previous, current), result) in zip(evaluate.frame_pairs(dataset), motion_results):
+        motion_seconds[current] = result["seconds"]
+        motion_boxes[current] = result["boxes"]
+
+    fusion = DetectionFusion()
+    totals = [0, 0, 0]
+    frame_seconds = []
+    for ((path, truth), result, seconds, moved) in zip(dataset, human_results, motion_seconds, motion_boxes):
+        boxes = []
+        if len(moved) > 0:
+            fused = fusion.fuse(result["boxes"], result["weights"], moved)
+            # strongest first, so that the greedy matching prefers confident detections
+            order = fused.scores.argsort()[::-1]
+            boxes = [tuple(box) for box in fused.boxes[order][fused.scores[order] > threshold]]
+            seconds += result["seconds"]
+        counts = evaluate.match(boxes, truth, iou_threshold)
+        totals = [total + count for (total, count) in zip(totals, counts)]
+        frame_seconds.append(seconds)
+
+    scores = evaluate.precision_recall(*totals)
+    found = scores["precision"] + scores["recall"]
+    scores["f1"] = 2 * scores["precision"] * scores["recall"] / found if found > 0 else 0.0
+    latency = evaluate.latency_summary(frame_seconds)
+    scores["latency"] = latency["mean"]
+    scores["latency_p90"] = latency["p90"]
+    triggered = [len(moved) > 0 for moved in motion_boxes]
+    scores["motion_rate"] = float(sum(triggered)) / len(triggered) if len(triggered) > 0 else 0.0
+    return scores
+
+
+def pareto_front(configs):
+    """
+    :param configs: list of scored configurations
+    :return: the configurations that no other configuration beats on both latency and F1, fastest first
+    """
+    front = []
+    for config in sorted(configs, key=lambda c: (c["latency"], -c["f1"])):
+        if len(front) == 0 or config["f1"] > front[-1]["f1"]:
+            front.append(config)
+    return front
+
+
+def choose(front, budget):
+    """
+    :param front: the Pareto front
+    :param budget: seconds per frame we can afford, None for no limit
+    :return: the most accurate configuration within the budget, or the fastest one if none fit
+    """
+    within = [config for config in front if budget is None or config["latency"] <= budget]
+    if len(within) == 0:
+        return front[0] if len(front) > 0 else None
+    return max(within, key=lambda c: c["f1"])
+
+
+def sweep(directory, labels_path, grid=SWEEP, cache_directory=None, workers=None, iou_threshold=0.5):
+    """
+    :return: list of every configuration in the grid with its scores
+    """
+    dataset = evaluate.load_dataset(directory, labels_path)
+    if cache_directory is None:
+        cache_directory = os.path.join(directory, ".detections")
+
+    configs = []
+    for (width, stride, padding, scale, min_area) in itertools.product(
+            grid["width"], grid["winStride"], grid["padding"], grid["scale"], grid["min_area"]):
+        human_params = {"width": width, "winStride": [stride, stride], "padding": [padding, padding],
+                        "scale": scale}
+        motion_params = {"min_area": min_area}
+        (human_results, motion_results, computed) = evaluate.detect(dataset, human_params, motion_params,
+                                                                    cache_directory, workers, in_motion=True)
+        # the threshold only filters the cached detections, so it costs nothing to sweep
+        for threshold in grid["threshold"]:
+            config = {"human": human_params, "motion": motion_params, "threshold": threshold}
+            config.update(score_config(dataset, human_results, motion_results, threshold, iou_threshold))
+            configs.append(config)
+    return configs
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--dataset", required=True, help="path to the dataset directory")
+    ap.add_argument("-l", "--labels", help="path to the labels, defaults to labels.json in the dataset directory")
+    ap.add_argument("-c", "--cache", help="directory to cache detections in, defaults to .detections in the dataset")
+    ap.add_argument("-w", "--workers", type=int, help="number of worker processes, defaults to the number of cores")
+    ap.add_argument("-o", "--output", default="pareto.json", help="file to write the Pareto front to")
+    ap.add_argument("-b", "--budget", type=float, help="seconds per frame we can afford on average")
+    ap.add_argument("--write-config", help="file to write the chosen configuration to, for main.py")
+    ap.add_argument("--iou", type=float, default=0.5, help="minimum overlap for a detection to match a label")
+    for (parameter, values) in sorted(SWEEP.items()):
+        ap.add_argument("--" + parameter.lower().replace("_", "-"), default=",".join(str(v) for v in values),
+                        help="comma separated values of {} to try".format(parameter))
+    args = vars(ap.parse_args())
+
+    grid = {
+        "width": parse_list(args["width"], int),
+        "winStride": parse_list(args["winstride"], int),
+        "padding": parse_list(args["padding"], int),
+        "scale": parse_list(args["scale"], float),
+        "min_area": parse_list(args["min_area"], int),
+        "threshold": parse_list(args["threshold"], float),
+    }
+
+    before = time.time()
+    configs = sweep(args["dataset"], args["labels"] or os.path.join(args["dataset"], "labels.json"), grid,
+                    args["cache"], args["workers"], args["iou"])
+    front = pareto_front(configs)
+    chosen = choose(front, args["budget"])
+    print("swept {} configurations in {:.1f}s, {} on the Pareto front".format(
+        len(configs), time.time() - before, len(front)))
+    for config in front:
+        print("{:>8.1f}ms f1 {:.3f} precision {:.3f} recall {:.3f}: {} min_area {} threshold {}{}".format(
+            config["latency"] * 1000, config["f1"], config["precision"], config["recall"], config["human"],
+            config["motion"]["min_area"], config["threshold"], "  <- chosen" if config is chosen else ""))
+
+    with open(args["output"], "w") as f:
+        json.dump({"budget": args["budget"], "chosen": chosen, "pareto": front}, f, indent=2)
+
+    if args["write_config"] is not None and chosen is not None:
+        with open(args["write_config"], "w") as f:
+            json.dump({"human": chosen["human"], "motion": chosen["motion"], "threshold": chosen["threshold"]}, f,
+                      indent=2)
+        print("wrote the chosen configuration to {}".format(args["write_config"]))
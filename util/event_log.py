@@ -0,0 +1,159 @@
+from threading import Thread
+from util.metrics import registry
+
+import json
+import queue
+import sqlite3
+import time
+
+events_dropped = registry.counter("event_log_dropped", "events dropped because the event log writer fell behind")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS events (time REAL NOT NULL, kind TEXT NOT NULL, zone TEXT, value REAL, "
+    "seconds REAL, details TEXT)",
+    "CREATE INDEX IF NOT EXISTS events_kind_time ON events (kind, time)",
+    # one row per zone and minute, instead of a row per frame
+    "CREATE TABLE IF NOT EXISTS frame_stats (minute INTEGER NOT NULL, zone TEXT NOT NULL, frames INTEGER NOT NULL, "
+    "motion_frames INTEGER NOT NULL, seconds_sum REAL NOT NULL, seconds_max REAL NOT NULL, "
+    "PRIMARY KEY (minute, zone))",
+]
+
+
+class EventLog:
+    """
+    Records what the system did in an sqlite database: detections and light changes as events, and the time spent
+    on every frame summarised per minute.
+
+    record() and frame() only put the event on a queue. A background thread owns the database connection and
+    inserts the queued events in batches, one transaction per batch. If the writer falls behind, events are dropped
+    rather than slowing down the caller.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=5.0, max_pending=10000, clock=time.time):
+        """
+
+        :param path: the sqlite database, created if it doesn't exist
+        :param batch_size: most events to insert in one transaction
+        :param flush_interval: most seconds an event waits before it is written
+        :param max_pending: most events waiting for the writer before we drop new ones
+        :param clock: function returning the current time in seconds
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._frames = {}
+        self._thread = Thread(target=self._write_events, name="event-log")
+        self._thread.daemon = True
+
+        # create the tables up front, so that a bad path fails here rather than on the writer thread
+        connection = connect(path)
+        connection.close()
+        self._thread.start()
+
+    def record(self, kind, zone=None, value=None, seconds=None, timestamp=None, **details):
+        """
+        Queues an event.
+
+        :param kind: what happened, ie "detection" or "lights"
+        :param zone: the hue group or zone it happened in
+        :param value: a number describing the event, ie the confidence of a detection or 1/0 for lights on/off
+        :param seconds: a duration that goes with the event, ie how long the lights took to come on
+        :param timestamp: when it happened, defaults to now
+        :param details: anything else to save with the event, as JSON
+        :return:
+        """
+        event = (timestamp if timestamp is not None else self.clock(), kind, zone, value, seconds,
+                 json.dumps(details, sort_keys=True) if len(details) > 0 else None)
+        self._put(("event", event))
+
+    def frame(self, zone, seconds, motion=False):
+        """
+        Adds a frame to the per minute statistics of the zone.
+
+        :param zone: the hue group or zone the frame is from
+        :param seconds: time spent analysing the frame
+        :param motion: whether we found motion in the frame
+        :return:
+        """
+        minute = int(self.clock() // 60)
+        stats = self._frames.get(zone)
+        if stats is not None and stats[0] != minute:
+            self._put(("frames", (stats[0], zone) + tuple(stats[1:])))
+            stats = None
+        if stats is None:
+            stats = [minute, 0, 0, 0.0, 0.0]
+            self._frames[zone] = stats
+        stats[1] += 1
+        stats[2] += 1 if motion else 0
+        stats[3] += seconds
+        stats[4] = max(stats[4], seconds)
+
+    def close(self):
+        """
+        Writes the queued events and the statistics of the current minute, and stops the writer.
+
+        :return:
+        """
+        for (zone, stats) in self._frames.items():
+            self._put(("frames", (stats[0], zone) + tuple(stats[1:])))
+        self._frames = {}
+        self._queue.put(None)
+        self._thread.join()
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            events_dropped.inc()
+
+    def _write_events(self):
+        connection = connect(self.path)
+        closed = False
+        while not closed:
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+            if len(batch) == 0:
+                continue
+            try:
+                with connection:
+                    connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                                           [row for (table, row) in batch if table == "event"])
+                    for (minute, zone, frames, motion_frames, seconds_sum, seconds_max) in \
+                            [row for (table, row) in batch if table == "frames"]:
+                        # the same minute comes around again if we restarted within it, so add them up
+                        updated = connection.execute(
+                            "UPDATE frame_stats SET frames = frames + ?, motion_frames = motion_frames + ?, "
+                            "seconds_sum = seconds_sum + ?, seconds_max = max(seconds_max, ?) "
+                            "WHERE minute = ? AND zone = ?",
+                            (frames, motion_frames, seconds_sum, seconds_max, minute, zone)).rowcount
+                        if updated == 0:
+                            connection.execute("INSERT INTO frame_stats VALUES (?, ?, ?, ?, ?, ?)",
+                                               (minute, zone, frames, motion_frames, seconds_sum, seconds_max))
+            except sqlite3.Error as e:
+                print("failed to write {} events to {}: {}".format(len(batch), self.path, e))
+        connection.close()
+
+
+def connect(path):
+    """
+    :param path: the sqlite database
+    :return: a connection to the database, with the tables created
+    """
+    connection = sqlite3.connect(path)
+    # the log is append only, so the write ahead log keeps readers from blocking the writer
+    connection.execute("PRAGMA journal_mode=WAL")
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
@@ -0,0 +1,316 @@
+"""
+Lightweight timers, counters and histograms, exportable in the prometheus text format.
+
+Recording a value takes a lock and a bisect over a dozen buckets, so it's cheap enough to leave on for every frame.
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Event, Lock, Thread
+
+import os
+import time
+
+
+# upper bounds (in seconds) of the latency buckets, from a millisecond up to the length of a long bridge timeout
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        """
+        :return: context manager that observes how long its block took
+        """
+        return _Timer(self)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile from the buckets, the same way prometheus' histogram_quantile does.
+
+        :param q: the quantile, in [0, 1]
+        :return: the estimated value, or 0 if nothing was observed
+        """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for (i, count) in enumerate(self.counts):
+                if seen + count >= rank and count > 0:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    # the largest value we have seen is a tighter bound than the bucket
+                    upper = min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+                    lower = min(lower, upper)
+                    return lower + (upper - lower) * (rank - seen) / count
+                seen += count
+            return self.max
+
+    def snapshot(self):
+        with self._lock:
+            return (list(self.counts), self.count, self.sum, self.max)
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+
+    def __init__(self, function=None):
+        """
+
+        :param function: optional function called to read the value on every export
+        """
+        self.function = function
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class _Timer:
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.time() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the process, keyed by name and labels.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._types = {}
+        self._lock = Lock()
+        self._reporter = None
+        self._reporter_stop = Event()
+        self._server = None
+
+    def histogram(self, name, help="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(name, help, "histogram", labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help="", labels=None):
+        return self._get_or_create(name, help, "counter", labels, Counter)
+
+    def gauge(self, name, help="", labels=None, function=None):
+        gauge = self._get_or_create(name, help, "gauge", labels, lambda: Gauge(function))
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def render_prometheus(self):
+        """
+        :return: every metric in the prometheus text exposition format
+        """
+        lines = []
+        for (name, labelled) in self._by_name():
+            if self._help[name]:
+                lines.append("# HELP {} {}".format(name, self._help[name]))
+            lines.append("# TYPE {} {}".format(name, self._types[name]))
+            for (labels, metric) in labelled:
+                if isinstance(metric, Histogram):
+                    (counts, count, total, maximum) = metric.snapshot()
+                    cumulative = 0
+                    for (bound, bucket_count) in zip(metric.buckets + ("+Inf",), counts):
+                        cumulative += bucket_count
+                        lines.append("{}_bucket{} {}".format(name, _labels(labels, le=bound), cumulative))
+                    lines.append("{}_sum{} {}".format(name, _labels(labels), total))
+                    lines.append("{}_count{} {}".format(name, _labels(labels), count))
+                elif isinstance(metric, Counter):
+                    lines.append("{}{} {}".format(name, _labels(labels), metric.value))
+                else:
+                    lines.append("{}{} {}".format(name, _labels(labels), metric.get()))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics to a file, ie for the node exporter's textfile collector.
+        The file is replaced atomically so that readers never see a partial file.
+
+        :param path:
+        :return:
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.rename(temp_path, path)
+
+    def summary(self):
+        """
+        :return: a human readable summary of the histograms and counters
+        """
+        lines = []
+        for (name, labelled) in self._by_name():
+            for (labels, metric) in labelled:
+                if isinstance(metric, Histogram):
+                    if metric.count == 0:
+                        continue
+                    lines.append("{}{}: count {} mean {:.1f}ms p50 {:.1f}ms p90 {:.1f}ms max {:.1f}ms".format(
+                        name, _labels(labels), metric.count, metric.sum / metric.count * 1000,
+                        metric.quantile(0.5) * 1000, metric.quantile(0.9) * 1000, metric.max * 1000))
+                elif isinstance(metric, Counter):
+                    lines.append("{}{}: {}".format(name, _labels(labels), metric.value))
+                else:
+                    lines.append("{}{}: {}".format(name, _labels(labels), metric.get()))
+        return "\n".join(lines)
+
+    def start_reporter(self, interval=300, path=None):
+        """
+        Starts a background thread that periodically prints a summary and, if a path is given,
+        writes the metrics to it in the prometheus text format.
+
+        :param interval: seconds between reports
+        :param path: optional file to write the prometheus text to
+        :return:
+        """
+        if self._reporter is not None:
+            return
+        self._reporter_stop.clear()
+        self._reporter = Thread(target=self._report, args=(interval, path), name="metrics-reporter")
+        self._reporter.daemon = True
+        self._reporter.start()
+
+    def start_http_server(self, port, address=""):
+        """
+        Serves the metrics in the prometheus text format on http://address:port/metrics from a background thread.
+
+        :param port:
+        :param address: address to bind to, all interfaces by default
+        :return: the server
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = HTTPServer((address, port), MetricsHandler)
+        thread = Thread(target=self._server.serve_forever, name="metrics-http")
+        thread.daemon = True
+        thread.start()
+        return self._server
+
+    def stop(self):
+        """
+        Stops the reporter and the http server, if they are running.
+
+        :return:
+        """
+        if self._reporter is not None:
+            self._reporter_stop.set()
+            self._reporter.join()
+            self._reporter = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _report(self, interval, path):
+        while not self._reporter_stop.wait(interval):
+            print("metrics summary:\n{}".format(self.summary()))
+            if path is not None:
+                try:
+                    self.write_prometheus(path)
+                except (IOError, OSError) as e:
+                    print("failed to write metrics to {}: {}".format(path, e))
+
+    def _get_or_create(self, name, help, metric_type, labels, factory):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                if name in self._types and self._types[name] != metric_type:
+                    raise ValueError("metric {} is a {}, not a {}".format(name, self._types[name], metric_type))
+                metric = factory()
+                self._metrics[key] = metric
+                self._types[name] = metric_type
+                self._help.setdefault(name, help)
+            return metric
+
+    def _by_name(self):
+        with self._lock:
+            items = sorted(self._metrics.items(), key=lambda item: item[0])
+        grouped = []
+        for ((name, labels), metric) in items:
+            if len(grouped) == 0 or grouped[-1][0] != name:
+                grouped.append((name, []))
+            grouped[-1][1].append((labels, metric))
+        return grouped
+
+
+def observe_when_done(histogram, future, started):
+    """
+    Observes the time from started until the future completes successfully, ie until the bridge acknowledged
+    a command we queued.
+
+    :param histogram:
+    :param future: a concurrent.futures.Future
+    :param started: time.time() the measurement starts at
+    :return:
+    """
+    def done(f):
+        if not f.cancelled() and f.exception() is None:
+            histogram.observe(time.time() - started)
+
+    future.add_done_callback(done)
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, v) for (k, v) in pairs) + "}"
+
+
+# the registry shared by the whole process
+registry = MetricsRegistry()
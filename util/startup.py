@@ -0,0 +1,93 @@
+from threading import Lock, Thread
+from util.metrics import registry
+
+import time
+
+# close enough to when the process started, as long as this is imported first
+process_started = time.time()
+
+
+class StartupProfile:
+    """
+    Records how long every phase of starting up took, and when it ran relative to the start of the process,
+    so that phases running concurrently show up as overlapping.
+    """
+
+    def __init__(self, started=None):
+        """
+
+        :param started: time the process started, defaults to when this module was imported
+        """
+        self.started = started if started is not None else process_started
+        self.phases = []
+        self._lock = Lock()
+
+    def add(self, name, began, finished):
+        """
+        :param name: name of the phase
+        :param began: time the phase began
+        :param finished: time the phase finished
+        :return:
+        """
+        with self._lock:
+            self.phases.append((name, began - self.started, finished - began))
+        registry.gauge("startup_phase_seconds", "time spent in every phase of starting up",
+                       labels={"phase": name}).set(finished - began)
+
+    def run(self, name, function):
+        """
+        Runs function as a phase.
+
+        :return: what function returned
+        """
+        began = time.time()
+        try:
+            return function()
+        finally:
+            self.add(name, began, time.time())
+
+    def run_concurrently(self, phases, cleanup=None):
+        """
+        Runs every phase on a thread of its own and waits for all of them.
+
+        :param phases: dict of phase name to a function running the phase
+        :param cleanup: dict of phase name to a function releasing what the phase returned, called for the phases
+                        that succeeded if another one failed
+        :return: dict of phase name to what its function returned
+        :raises: the exception of the first failed phase, after every phase finished
+        """
+        results = {}
+        errors = []
+
+        def run(name, function):
+            try:
+                results[name] = self.run(name, function)
+            except Exception as e:
+                errors.append((name, e))
+
+        threads = [Thread(target=run, args=(name, function), name="startup-{}".format(name))
+                   for (name, function) in phases.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            (name, error) = errors[0]
+            print("startup phase {} failed: {}".format(name, error))
+            for (succeeded, result) in results.items():
+                if cleanup is not None and succeeded in cleanup:
+                    try:
+                        cleanup[succeeded](result)
+                    except Exception as e:
+                        print("failed to clean up after startup phase {}: {}".format(succeeded, e))
+            raise error
+        return results
+
+    def report(self):
+        """
+        :return: the phases, in the order they began, with when they began, how long they took and the total
+        """
+        lines = ["startup took {:.2f}s:".format(time.time() - self.started)]
+        for (name, began, seconds) in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append("  {:<12} {:>6.2f}s -> {:>6.2f}s  {:>6.2f}s".format(name, began, began + seconds, seconds))
+        return "\n".join(lines)
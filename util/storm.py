@@ -1,39 +1,197 @@
 import datetime
-from astral import *
 import os
 
-now = datetime.datetime.now()
+# the timezone of the location, and so of the schedule
+TIMEZONE = 'US/Pacific'
+
+
+def oakland():
+    """
+    Establishes a location named oakland. astral and pytz are only imported here, the first time we need the sun,
+    so they don't slow down starting up.
+
+    :return: the astral Location
+    """
+    from astral import Location
+    location = Location()
+    location.name = 'Oakland'
+    location.region = 'west'
+    location.latitude = float(os.environ["LATITUDE"])
+    location.longitude = float(os.environ["LONGITUDE"])
+    location.timezone = TIMEZONE
+    location.elevation = float(os.environ["ELEVATION"])
+    return location
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def default_brightness(sunrise, sunset):
+    """
+    :param sunrise: minute of the day the sun rises
+    :param sunset: minute of the day the sun sets
+    :return: list of (end minute, brightness) breakpoints. each brightness applies until its end minute.
+    """
+    return [
+        # late night
+        (6 * 60, 20),
+        # early morning
+        (sunrise, 100),
+        # during work
+        (sunset, 50),
+        # evening
+        (MINUTES_PER_DAY, 100),
+    ]
+
+
+def default_sleep_time(sunrise, sunset):
+    """
+    :param sunrise: minute of the day the sun rises
+    :param sunset: minute of the day the sun sets
+    :return: list of (end minute, seconds to sleep after turning the lights on) breakpoints
+    """
+    return [
+        # late night
+        (2 * 60, 360),
+        # sleep time
+        (9 * 60, 120),
+        # early morning
+        (11 * 60, 180),
+        # during work
+        (18 * 60, 300),
+        # evening
+        (23 * 60, 900),
+        (MINUTES_PER_DAY, 360),
+    ]
+
+
+def minute_table(breakpoints):
+    """
+    Expands breakpoints into one value per minute of the day.
+
+    :param breakpoints: list of (end minute, value), in order. a breakpoint ending before the previous one is empty.
+    :return: list with the value for every minute of the day
+    """
+    table = []
+    for (end, value) in breakpoints:
+        end = min(end, MINUTES_PER_DAY)
+        if end > len(table):
+            table.extend([value] * (end - len(table)))
+    if len(table) < MINUTES_PER_DAY:
+        table.extend([table[-1] if len(table) > 0 else None] * (MINUTES_PER_DAY - len(table)))
+    return table
+
+
+class DailySchedule:
+    """
+    Sunrise, sunset, brightness and sleep time for the current day at a location.
+
+    Sun events are computed once per calendar day, and brightness and sleep time are looked up from per minute
+    tables built at the same time. The tables are rebuilt the first time they are used on a new day.
+    """
+
+    def __init__(self, location, brightness=default_brightness, sleep_time=default_sleep_time):
+        """
+
+        :param location: astral Location to compute the sun events for, or a function returning one on first use
+        :param brightness: function of (sunrise minute, sunset minute) returning brightness breakpoints
+        :param sleep_time: function of (sunrise minute, sunset minute) returning sleep time breakpoints
+        """
+        self._location = location
+        self._timezone = None
+        self.brightness_breakpoints = brightness
+        self.sleep_time_breakpoints = sleep_time
+
+        self.date = None
+        self.sun = None
+        self.brightness_table = None
+        self.sleep_time_table = None
+
+    @property
+    def location(self):
+        if not hasattr(self._location, "sun"):
+            self._location = self._location()
+        return self._location
+
+    @property
+    def timezone(self):
+        if self._timezone is None:
+            import pytz
+            self._timezone = pytz.timezone(self.location.timezone)
+        return self._timezone
+
+    def now(self):
+        return datetime.datetime.now(self.timezone)
+
+    def for_time(self, when=None):
+        """
+        Makes sure the tables are for the day of the given time, rebuilding them if the day changed.
+
+        :param when: timezone aware datetime, defaults to now
+        :return: the minute of the day of the given time
+        """
+        if when is None:
+            when = self.now()
+        else:
+            when = when.astimezone(self.timezone)
+        if when.date() != self.date:
+            self._build(when.date())
+        return when.hour * 60 + when.minute
+
+    def brightness(self, when=None):
+        """
+        :param when: timezone aware datetime, defaults to now
+        :return: the brightness (percentage) to turn the lights on with
+        """
+        minute = self.for_time(when)
+        return self.brightness_table[minute]
+
+    def sleep_time(self, when=None):
+        """
+        :param when: timezone aware datetime, defaults to now
+        :return: the amount of time (in seconds) to sleep for after turning the lights on
+        """
+        minute = self.for_time(when)
+        return self.sleep_time_table[minute]
+
+    def sunrise(self, when=None):
+        """
+        :param when: timezone aware datetime, defaults to now
+        :return: (hour, minute) of sunrise on the day of the given time
+        """
+        self.for_time(when)
+        return (self.sun['sunrise'].hour, self.sun['sunrise'].minute)
+
+    def sunset(self, when=None):
+        """
+        :param when: timezone aware datetime, defaults to now
+        :return: (hour, minute) of sunset on the day of the given time
+        """
+        self.for_time(when)
+        return (self.sun['sunset'].hour, self.sun['sunset'].minute)
+
+    def _build(self, date):
+        # create the sun object to get time value for sunrise and sunset
+        sun = self.location.sun(date=date, local=True)
+        sunrise = sun['sunrise'].hour * 60 + sun['sunrise'].minute
+        sunset = sun['sunset'].hour * 60 + sun['sunset'].minute
+
+        self.brightness_table = minute_table(self.brightness_breakpoints(sunrise, sunset))
+        self.sleep_time_table = minute_table(self.sleep_time_breakpoints(sunrise, sunset))
+        self.sun = sun
+        self.date = date
+
+
+# computed lazily, on first use
+schedule = DailySchedule(oakland)
 
-# Establish a location named oakland
-oakland = Location()
-oakland.name = 'Oakland'
-oakland.region = 'west'
-oakland.latitude = float(os.environ["LATITUDE"])
-oakland.longitude = float(os.environ["LONGITUDE"])
-oakland.timezone = 'US/Pacific'
-oakland.elevation = float(os.environ["ELEVATION"])
-oakland.sun()
 
 def getSunrise():
-
-    # create the sun object to get time value for sunrise and sunset
-    sun = oakland.sun(date=datetime.date(now.year, now.month, now.day), local=True)
-
-    sunrise_hour = int(sun['sunrise'].hour)
-    sunrise_minute = int(sun['sunrise'].minute)
-
-    return (sunrise_hour, sunrise_minute)
+    return schedule.sunrise()
 
 
 def getSunset():
-
-    # create the sun object to get time value for sunrise and sunset
-    sun = oakland.sun(date=datetime.date(now.year, now.month, now.day), local=True)
-
-    sunset_hour = int(sun['sunset'].hour)
-    sunset_minute = int(sun['sunset'].minute)
-
-    return (sunset_hour, sunset_minute)
+    return schedule.sunset()
 
 def main():
 
@@ -48,4 +206,3 @@ def main():
 
 if __name__ == "__main__":
         main()
-